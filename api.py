@@ -0,0 +1,221 @@
+import gzip
+import json
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from models import Product, Category
+from utils.cache import catalog_cached, catalog_version
+from utils.conditional import conditional, etag_for
+from utils.pagination import keyset_paginate
+from utils.queries import query_budget
+from utils.replicas import replica_reads
+
+# Read-only JSON catalog for the mobile app and edge caches
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Selectable fields and the columns they are read from; 'id' is always returned
+PRODUCT_FIELDS = {
+    'id': Product.id,
+    'sku': Product.sku,
+    'name': Product.name,
+    'description': Product.description,
+    'price': Product.price,
+    'stock': Product.stock,
+    'image_url': Product.image_url,
+    'featured': Product.featured,
+    'category_id': Product.category_id,
+    'category': Category.name.label('category'),
+    'created_at': Product.created_at,
+    'updated_at': Product.updated_at,
+}
+
+CATEGORY_FIELDS = {
+    'id': Category.id,
+    'name': Category.name,
+    'description': Category.description,
+    'updated_at': Category.updated_at,
+    'product_count': db.func.count(Product.id).label('product_count'),
+}
+
+# Listing orders: sort name to (keyset columns, descending)
+SORTS = {
+    'id': ([Product.id], False),
+    'price_asc': ([Product.price, Product.id], False),
+    'price_desc': ([Product.price, Product.id], True),
+    'newest': ([Product.created_at, Product.id], True),
+}
+
+MAX_LIMIT = 100
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+def _bad_request(message):
+    abort(400, description=message)
+
+
+def _fields(allowed, default=None):
+    """Parses ``fields=`` into a tuple of field names, always including 'id'."""
+    requested = request.args.get('fields')
+    if not requested:
+        return tuple(default or allowed)
+    names = ['id'] + [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        _bad_request(f'Unknown fields: {", ".join(unknown)}. Choose from: {", ".join(allowed)}')
+    return tuple(dict.fromkeys(names))
+
+
+def _ids():
+    """Parses ``ids=1,2,3`` (or repeated ``ids=``) in request order, without duplicates."""
+    try:
+        ids = [int(value) for item in request.args.getlist('ids') for value in item.split(',') if value.strip()]
+    except ValueError:
+        _bad_request('ids must be integers')
+    if len(ids) > MAX_LIMIT:
+        _bad_request(f'At most {MAX_LIMIT} ids per request')
+    return tuple(dict.fromkeys(ids))
+
+
+def _arg(name, kind):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        _bad_request(f'{name} must be {"an integer" if kind is int else "a number"}')
+
+
+def _serialize(row, fields):
+    item = {}
+    for name in fields:
+        value = getattr(row, name)
+        item[name] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+
+def _product_query(fields, keys=()):
+    """
+    A column-tuple query for the given fields (plus any keyset columns), joined
+    to Category only when the category name is asked for.
+    """
+    columns = [PRODUCT_FIELDS[name] for name in fields]
+    columns += [column for column in keys if column.key not in fields]
+    query = db.session.query(*columns)
+    if 'category' in fields:
+        query = query.join(Category, Category.id == Product.category_id)
+    return query
+
+
+def _encode(payload):
+    """Returns the JSON body and, when big enough to be worth it, its gzipped copy."""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    return body, gzip.compress(body, 6) if len(body) >= GZIP_MIN_SIZE else None
+
+
+def _cached_json(name, loader, *params):
+    """
+    Serves a catalog query as JSON. The encoded (and gzipped) body is cached
+    per catalog version, and a client or cache holding the current version
+    gets a 304 without the query running.
+    """
+    use_gzip = request.accept_encodings['gzip'] > 0
+    not_modified = conditional(etag_for('api', name, params, use_gzip, catalog_version(), personal=False),
+                               public=True, max_age=current_app.config['CATALOG_MAX_AGE'], personal=False)
+    if not_modified:
+        not_modified.vary.add('Accept-Encoding')
+        return not_modified
+
+    body, gzipped = catalog_cached('api_' + name, lambda: _encode(loader()), *params)
+    response = current_app.response_class(gzipped if use_gzip and gzipped else body, mimetype='application/json')
+    if use_gzip and gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@api.errorhandler(HTTPException)
+def api_error(e):
+    return jsonify(error=e.description, status=e.code), e.code
+
+
+@api.route('/products')
+@query_budget(1)
+@replica_reads
+def products():
+    """
+    Lists products, or looks up many by id in one query.
+
+    Query arguments:
+        ids: Comma-separated product ids (up to 100); returned in that order,
+             with unknown ids listed under 'missing'. Other filters are ignored.
+        category, min_price, max_price, featured (true/false): Filters
+        sort: id (default), price_asc, price_desc or newest
+        limit: Page size, up to 100 (default 24)
+        cursor: 'next_cursor' or 'prev_cursor' of a previous page
+        fields: Comma-separated fields to return (default: all)
+    """
+    fields = _fields(PRODUCT_FIELDS)
+    ids = _ids()
+    if ids:
+        def load_batch():
+            rows = _product_query(fields).filter(Product.id.in_(ids)).all()
+            found = {row.id: _serialize(row, fields) for row in rows}
+            return {'data': [found[id] for id in ids if id in found],
+                    'missing': [id for id in ids if id not in found]}
+        return _cached_json('products_batch', load_batch, fields, ids)
+
+    category_id = _arg('category', int)
+    min_price = _arg('min_price', float)
+    max_price = _arg('max_price', float)
+    featured = request.args.get('featured')
+    if featured not in (None, '', 'true', 'false'):
+        _bad_request('featured must be true or false')
+    sort = request.args.get('sort', 'id')
+    if sort not in SORTS:
+        _bad_request(f'sort must be one of: {", ".join(SORTS)}')
+    limit = min(max(_arg('limit', int) or 24, 1), MAX_LIMIT)
+    cursor = request.args.get('cursor')
+
+    def load_page():
+        keys, descending = SORTS[sort]
+        query = _product_query(fields, keys)
+        if category_id is not None:
+            query = query.filter(Product.category_id == category_id)
+        if min_price is not None:
+            query = query.filter(Product.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.price <= max_price)
+        if featured:
+            query = query.filter(Product.featured == (featured == 'true'))
+        page = keyset_paginate(query, keys, cursor=cursor, per_page=limit, descending=descending)
+        return {'data': [_serialize(row, fields) for row in page.items],
+                'next_cursor': page.next_cursor, 'prev_cursor': page.prev_cursor}
+
+    return _cached_json('products', load_page,
+                        fields, category_id, min_price, max_price, featured, sort, limit, cursor)
+
+
+@api.route('/categories')
+@query_budget(1)
+@replica_reads
+def categories():
+    """
+    Lists every category. ``fields`` may include 'product_count', which is
+    only counted when asked for.
+    """
+    fields = _fields(CATEGORY_FIELDS, default=['id', 'name', 'description', 'updated_at'])
+
+    def load():
+        query = db.session.query(*[CATEGORY_FIELDS[name] for name in fields])
+        if 'product_count' in fields:
+            query = query.outerjoin(Product, Product.category_id == Category.id).group_by(Category.id)
+        rows = query.order_by(Category.name, Category.id).all()
+        return {'data': [_serialize(row, fields) for row in rows]}
+
+    return _cached_json('categories', load, fields)
@@ -1,217 +1,246 @@
 import os
-import logging
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+import random
+from flask import Flask, jsonify, render_template, request
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from utils.replicas import RoutingSession
 
 # Create database base class
 class Base(DeclarativeBase):
     pass
 
-# Initialize SQLAlchemy
-db = SQLAlchemy(model_class=Base)
-
-# Create the Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# Initialize SQLAlchemy; read-only views may read from replicas
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 # Custom template filters
-@app.template_filter('slice')
 def slice_filter(iterable, count):
     """Return first 'count' items of the iterable as a list."""
     if iterable is None:
         return []
     return list(iterable)[:count]
 
-# Configure SQLite database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///ecommerce.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Initialize the app with the extension
-db.init_app(app)
+def seeded_filter(seq, *seed):
+    """Like 'random', but always picks the same item for the same seed, so pages render identically."""
+    return random.Random(repr(seed)).choice(list(seq))
 
-# Import models after db initialization to avoid circular imports
-with app.app_context():
-    from models import User, Product, Category, Order, OrderItem, CartItem, Address
-    db.create_all()
-    
-    # Create initial categories and admin user if they don't exist
-    from forms import LoginForm, RegisterForm, AddressForm, CheckoutForm, ProductForm
-    
-    # Create initial data if database is empty
-    if not Category.query.first():
-        categories = [
-            Category(name="Electronics", description="Electronic devices and gadgets"),
-            Category(name="Clothing", description="Fashion clothing for men and women"),
-            Category(name="Books", description="Books of various genres"),
-            Category(name="Home & Kitchen", description="Home and kitchen appliances"),
-            Category(name="Sports", description="Sports equipment and accessories"),
-            Category(name="Beauty", description="Beauty and personal care products")
-        ]
-        db.session.add_all(categories)
-        db.session.commit()
-        
-        # Add some products to each category
-        electronics = [
-            Product(name="Smartphone", description="Latest smartphone with advanced features", 
-                   price=12999.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/mobile-alt.svg", 
-                   category_id=1, featured=True),
-            Product(name="Laptop", description="High-performance laptop for professional use", 
-                   price=49999.00, stock=30, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/laptop.svg", 
-                   category_id=1, featured=True),
-            Product(name="Smartwatch", description="Fitness tracking smartwatch", 
-                   price=2999.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/clock.svg", 
-                   category_id=1),
-            Product(name="Headphones", description="Noise cancelling wireless headphones", 
-                   price=1999.00, stock=75, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/headphones.svg", 
-                   category_id=1),
-            Product(name="Bluetooth Speaker", description="Portable bluetooth speaker with great sound", 
-                   price=1499.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/volume-up.svg", 
-                   category_id=1),
-            Product(name="Power Bank", description="10000mAh fast charging power bank", 
-                   price=999.00, stock=120, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/battery-full.svg", 
-                   category_id=1)
-        ]
-        
-        clothing = [
-            Product(name="Men's T-Shirt", description="Cotton t-shirt for men", 
-                   price=499.00, stock=200, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/tshirt.svg", 
-                   category_id=2, featured=True),
-            Product(name="Women's Dress", description="Elegant dress for women", 
-                   price=1299.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/female.svg", 
-                   category_id=2),
-            Product(name="Jeans", description="Comfortable denim jeans", 
-                   price=999.00, stock=150, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user.svg", 
-                   category_id=2),
-            Product(name="Jacket", description="Winter jacket for cold weather", 
-                   price=1999.00, stock=70, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user-tie.svg", 
-                   category_id=2),
-            Product(name="Formal Shirt", description="Formal shirt for office wear", 
-                   price=799.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user-tie.svg", 
-                   category_id=2),
-            Product(name="Sports Shoes", description="Comfortable sports shoes for running", 
-                   price=1499.00, stock=90, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/shoe-prints.svg", 
-                   category_id=2, featured=True)
-        ]
-        
-        books = [
-            Product(name="Fiction Novel", description="Bestselling fiction novel", 
-                   price=299.00, stock=200, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/book.svg", 
-                   category_id=3),
-            Product(name="Self-Help Book", description="Book for personal development", 
-                   price=399.00, stock=150, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/book-reader.svg", 
-                   category_id=3, featured=True),
-            Product(name="Cookbook", description="Collection of delicious recipes", 
-                   price=499.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/utensils.svg", 
-                   category_id=3),
-            Product(name="Biography", description="Biography of a famous personality", 
-                   price=349.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user.svg", 
-                   category_id=3),
-            Product(name="Academic Textbook", description="College textbook for students", 
-                   price=899.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/graduation-cap.svg", 
-                   category_id=3),
-            Product(name="Children's Book", description="Illustrated book for children", 
-                   price=199.00, stock=120, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/child.svg", 
-                   category_id=3)
-        ]
-        
-        home_kitchen = [
-            Product(name="Blender", description="Multi-purpose kitchen blender", 
-                   price=1999.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/blender.svg", 
-                   category_id=4, featured=True),
-            Product(name="Coffee Maker", description="Automatic coffee maker for home", 
-                   price=2499.00, stock=40, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/coffee.svg", 
-                   category_id=4),
-            Product(name="Bedsheet Set", description="Cotton bedsheet set with pillowcases", 
-                   price=899.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/bed.svg", 
-                   category_id=4),
-            Product(name="Dining Table", description="Wooden dining table for 6 people", 
-                   price=12999.00, stock=20, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/chair.svg", 
-                   category_id=4),
-            Product(name="Microwave Oven", description="Digital microwave oven for kitchen", 
-                   price=6999.00, stock=30, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/temperature-high.svg", 
-                   category_id=4),
-            Product(name="Water Purifier", description="RO water purifier for home", 
-                   price=8999.00, stock=25, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/tint.svg", 
-                   category_id=4)
-        ]
-        
-        sports = [
-            Product(name="Cricket Bat", description="Professional cricket bat", 
-                   price=1499.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/table-tennis.svg", 
-                   category_id=5),
-            Product(name="Football", description="Standard size football", 
-                   price=799.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/futbol.svg", 
-                   category_id=5, featured=True),
-            Product(name="Yoga Mat", description="Anti-slip yoga mat for fitness", 
-                   price=499.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/spa.svg", 
-                   category_id=5),
-            Product(name="Dumbbells", description="Set of 5kg dumbbells", 
-                   price=999.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/dumbbell.svg", 
-                   category_id=5),
-            Product(name="Badminton Racket", description="Professional badminton racket", 
-                   price=899.00, stock=70, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/table-tennis.svg", 
-                   category_id=5),
-            Product(name="Treadmill", description="Motorized treadmill for home gym", 
-                   price=24999.00, stock=15, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/running.svg", 
-                   category_id=5)
-        ]
-        
-        beauty = [
-            Product(name="Face Cream", description="Moisturizing face cream", 
-                   price=499.00, stock=120, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/magic.svg", 
-                   category_id=6, featured=True),
-            Product(name="Perfume", description="Luxury perfume for men and women", 
-                   price=1999.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/spray-can.svg", 
-                   category_id=6),
-            Product(name="Hair Dryer", description="Professional hair dryer with styling tools", 
-                   price=1499.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/wind.svg", 
-                   category_id=6),
-            Product(name="Makeup Kit", description="Complete makeup kit with brushes", 
-                   price=2499.00, stock=40, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/palette.svg", 
-                   category_id=6),
-            Product(name="Hair Serum", description="Anti-frizz hair serum for smooth hair", 
-                   price=399.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/tint.svg", 
-                   category_id=6),
-            Product(name="Beard Grooming Kit", description="Complete beard grooming kit for men", 
-                   price=899.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/cut.svg", 
-                   category_id=6)
-        ]
-        
-        all_products = electronics + clothing + books + home_kitchen + sports + beauty
-        db.session.add_all(all_products)
-        db.session.commit()
-    
-    # Create admin user if not exists
-    if not User.query.filter_by(email="admin@example.com").first():
-        admin = User(
-            name="Admin",
-            email="admin@example.com",
-            password=generate_password_hash("admin123"),
-            is_admin=True
-        )
-        db.session.add(admin)
-        db.session.commit()
+def create_app(config=None):
+    """
+    Creates and configures the Flask app.
 
-# Import routes after models initialization
-from routes import *
+    Creating an app never touches the database; run ``flask init-db`` to create
+    or upgrade the schema and ``flask seed`` to add the demo catalog and admin.
 
-# Register error handlers
-@app.errorhandler(404)
-def page_not_found(e):
-    return render_template('error.html', error="404 - Page Not Found"), 404
+    Args:
+        config (dict): Settings applied over the defaults, e.g. for tests
 
-@app.errorhandler(500)
-def internal_server_error(e):
-    return render_template('error.html', error="500 - Internal Server Error"), 500
+    Returns:
+        Flask: The configured app
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    
+    app.add_template_filter(slice_filter, 'slice')
+    app.add_template_filter(seeded_filter, 'seeded')
+    
+    # Configure SQLite database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///ecommerce.db")
+    # Extra engine options over the profile picked from the URL (utils.engines)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {}
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    
+    # Engine profile: "auto" tunes SQLite (WAL, busy timeout, cache and mmap
+    # sizes) and Postgres (pool share of DB_MAX_CONNECTIONS across the
+    # WEB_CONCURRENCY web processes, request statement timeout) by URL;
+    # "default" keeps SQLAlchemy's behaviour
+    app.config["DB_ENGINE_PROFILE"] = os.environ.get("DB_ENGINE_PROFILE", "auto")
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_CONNECTIONS"] = int(os.environ.get("DB_MAX_CONNECTIONS", 80))
+    app.config["WEB_CONCURRENCY"] = int(os.environ.get("WEB_CONCURRENCY", 1))
+    app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+    app.config["DB_IDLE_IN_TRANSACTION_TIMEOUT_MS"] = int(os.environ.get("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", 60000))
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    app.config["SQLITE_CACHE_SIZE_MB"] = int(os.environ.get("SQLITE_CACHE_SIZE_MB", 64))
+    app.config["SQLITE_MMAP_SIZE_MB"] = int(os.environ.get("SQLITE_MMAP_SIZE_MB", 256))
+    
+    # Read replicas for read-only views (comma-separated URLs; SQLite copies from
+    # `flask snapshot-replica` work locally), skipped while more than
+    # REPLICA_MAX_LAG seconds behind or failing their REPLICA_CHECK_INTERVAL
+    # check. A user who writes reads from the primary for READ_YOUR_WRITES_SECONDS.
+    app.config["DATABASE_REPLICA_URLS"] = os.environ.get("DATABASE_REPLICA_URLS", "")
+    app.config["REPLICA_MAX_LAG"] = float(os.environ.get("REPLICA_MAX_LAG", 5.0))
+    app.config["REPLICA_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5.0))
+    app.config["READ_YOUR_WRITES_SECONDS"] = int(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+    
+    # Catalog cache sizing; the version check interval bounds how long another
+    # worker's product change can take to show up here
+    app.config["CATALOG_CACHE_SIZE"] = int(os.environ.get("CATALOG_CACHE_SIZE", 1024))
+    app.config["CATALOG_CACHE_TTL"] = int(os.environ.get("CATALOG_CACHE_TTL", 300))
+    app.config["CATALOG_VERSION_CHECK_INTERVAL"] = float(os.environ.get("CATALOG_VERSION_CHECK_INTERVAL", 1.0))
+    
+    # Rendered template fragments kept per worker ({% cache %} blocks)
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.environ.get("FRAGMENT_CACHE_SIZE", 4096))
+    
+    # How long browsers and shared caches may reuse anonymous catalog pages
+    app.config["CATALOG_MAX_AGE"] = int(os.environ.get("CATALOG_MAX_AGE", 60))
+    
+    # Logging: root level, per-logger levels ("sqlalchemy.engine=INFO,werkzeug=WARNING"),
+    # json or text output, and the fraction of INFO/DEBUG records kept per logger
+    # ("access=0.1"); warnings, errors and slow requests are always kept
+    app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO")
+    app.config["LOG_LEVELS"] = os.environ.get("LOG_LEVELS", "")
+    app.config["LOG_FORMAT"] = os.environ.get("LOG_FORMAT", "json")
+    app.config["LOG_SAMPLE_RATES"] = os.environ.get("LOG_SAMPLE_RATES", "")
+    app.config["LOG_SLOW_REQUEST_MS"] = float(os.environ.get("LOG_SLOW_REQUEST_MS", 1000))
+    app.config["LOG_QUEUE_SIZE"] = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+    
+    # Per-worker metric snapshots, merged when /admin/metrics is scraped
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR", os.path.join(app.instance_path, "metrics"))
+    app.config["METRICS_FLUSH_INTERVAL"] = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5.0))
+    
+    # Where carts live: "database" (CartItem rows, any deployment), "memory" (one
+    # worker process only) or "shared" (one host, served by `flask cart-server`);
+    # the last two write changed carts back to CartItem every CART_FLUSH_INTERVAL
+    app.config["CART_STORE"] = os.environ.get("CART_STORE", "database")
+    app.config["CART_FLUSH_INTERVAL"] = float(os.environ.get("CART_FLUSH_INTERVAL", 2.0))
+    app.config["CART_SERVER_ADDRESS"] = os.environ.get("CART_SERVER_ADDRESS", "127.0.0.1:5055")
+    
+    # Background jobs: worker threads in each web process (0 when `flask worker`
+    # runs the queue), how often idle workers poll, how long a worker may hold a
+    # job before it is retried elsewhere, and retries with exponential backoff
+    app.config["JOB_WORKER_THREADS"] = int(os.environ.get("JOB_WORKER_THREADS", 1))
+    app.config["JOB_POLL_INTERVAL"] = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+    app.config["JOB_VISIBILITY_TIMEOUT"] = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", 60))
+    app.config["JOB_MAX_ATTEMPTS"] = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+    app.config["JOB_RETRY_DELAY"] = float(os.environ.get("JOB_RETRY_DELAY", 5.0))
+    
+    # Password hashing: the target method (older hashes are upgraded at login),
+    # hashing processes per web process (0 hashes on the request thread), and how
+    # many more may wait before sign-ins are refused with a 429
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", 8))
+    app.config["PASSWORD_HASH_TIMEOUT"] = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 5.0))
+    
+    # Uploaded product feeds wait here for their import job; `flask worker`
+    # processes on other hosts need it on shared storage
+    app.config["IMPORT_DIR"] = os.environ.get("IMPORT_DIR", os.path.join(app.instance_path, "imports"))
+    
+    # Optional PIN code -> district/state file from `flask build-pincodes`;
+    # without it PIN codes are checked against the state prefixes only
+    app.config["PINCODE_DIRECTORY"] = os.environ.get("PINCODE_DIRECTORY")
+    
+    # Ordered products at or below this stock are logged to 'low_stock'
+    app.config["LOW_STOCK_THRESHOLD"] = int(os.environ.get("LOW_STOCK_THRESHOLD", 5))
+    
+    if config:
+        app.config.update(config)
+    
+    # Password hashing process pool, forked before any background thread starts
+    from utils.passwords import init_passwords
+    init_passwords(app)
+    
+    # Background logging and per-request access records, set up early so the
+    # access record's latency covers every other request hook
+    from utils.logs import init_logging
+    init_logging(app)
+    
+    # Replica binds must be configured before the engines are created
+    from utils.replicas import init_replicas
+    init_replicas(app)
+    
+    # Engine options and connection settings for each database's backend
+    from utils.engines import init_engines
+    init_engines(app)
+    
+    # Initialize the app with the extension
+    db.init_app(app)
+    
+    # Request latency and SQL cost per endpoint for /admin/metrics
+    from utils.metrics import init_metrics
+    init_metrics(app)
+    
+    # Register the models' tables and the views
+    import models  # noqa: F401
+    from routes import bp
+    app.register_blueprint(bp)
+    from api import api
+    app.register_blueprint(api)
+    
+    # Count SQL statements per request against each route's query budget
+    from utils.queries import init_query_budget
+    init_query_budget(app)
+    
+    # Product search maintenance command
+    from utils.search import init_search
+    init_search(app)
+    
+    # Size the read-through catalog cache
+    from utils.cache import init_catalog_cache
+    init_catalog_cache(app)
+    
+    # Index upgrade and query plan report commands
+    from utils.indexes import init_index_commands
+    init_index_commands(app)
+    
+    # Background job queue for order follow-up work and `flask worker`
+    from utils.jobs import init_jobs
+    init_jobs(app)
+    
+    # Sales rollup rebuild command
+    from utils.rollups import init_rollups
+    init_rollups(app)
+    
+    # Bulk product import and export commands
+    from utils.catalog_io import init_catalog_io
+    init_catalog_io(app)
+    
+    # Precomputed category facet counts and `flask refresh-facets`
+    from utils.facets import init_facets
+    init_facets(app)
+    
+    # Frequently-bought-together lists and `flask rebuild-recommendations`
+    from utils.recommendations import init_recommendations
+    init_recommendations(app)
+    
+    # Cached logged-in user for permission checks and templates
+    from utils.principal import init_principal
+    init_principal(app)
+    
+    # `flask build-pincodes` for the full PIN code directory
+    from utils.pincodes import init_pincodes
+    init_pincodes(app)
+    
+    # Cart store and the navbar cart count
+    from utils.carts import init_carts
+    init_carts(app)
+    
+    # {% cache %} template tag for product cards and category menus
+    from utils.fragments import init_fragment_cache
+    init_fragment_cache(app)
+    
+    # ETags for conditional GETs
+    from utils.conditional import init_conditional
+    init_conditional(app)
+    
+    # Fingerprinted, precompressed static assets and `flask build-assets`
+    from utils.assets import init_assets
+    init_assets(app)
+    
+    # Schema and seed data commands
+    from utils.bootstrap import init_setup_commands
+    init_setup_commands(app)
+    
+    # Register error handlers
+    @app.errorhandler(404)
+    def page_not_found(e):
+        if request.path.startswith('/api/'):
+            return jsonify(error=e.description, status=404), 404
+        return render_template('error.html', error="404 - Page Not Found"), 404
+    
+    @app.errorhandler(500)
+    def internal_server_error(e):
+        return render_template('error.html', error="500 - Internal Server Error"), 500
+    
+    return app
@@ -0,0 +1,158 @@
+"""
+Multi-process checkout stress test.
+
+Starts several worker processes that each log in as their own customer and
+keep buying one scarce product until it sells out, then checks that stock
+never went negative and that no more units were ordered than were in stock.
+
+    python -m benchmarks.checkout_stress --workers 8 --stock 200
+    python -m benchmarks.checkout_stress --database-url postgresql://localhost/shop_bench
+
+Exits non-zero if an oversell is detected.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+PASSWORD = 'stress-test'
+MAX_ERRORS = 100
+
+
+def _app():
+    from app import create_app
+    # Hash on the request thread: a hashing pool's processes would keep the
+    # worker processes from exiting
+    return create_app({'WTF_CSRF_ENABLED': False, 'PASSWORD_HASH_WORKERS': 0})
+
+
+def setup(workers, stock):
+    """
+    Creates one customer with an address per worker and the product they all buy.
+
+    Returns:
+        tuple: (product id, list of address ids indexed by worker number)
+    """
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from models import User, Address, Product, Category, CartItem
+    from utils.bootstrap import init_db, seed_catalog
+
+    app = _app()
+    with app.app_context():
+        init_db()
+        seed_catalog()
+        password = generate_password_hash(PASSWORD)
+        address_ids = []
+        for n in range(workers):
+            email = f'stress{n}@example.com'
+            user = User.query.filter_by(email=email).first()
+            if not user:
+                user = User(name=f'Stress {n}', email=email, password=password)
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(Address(user_id=user.id, address_line1='1 Test Street', city='New Delhi',
+                                       state='Delhi', pincode='110001', phone='9999999999', is_default=True))
+                db.session.flush()
+            address_ids.append(Address.query.filter_by(user_id=user.id).first().id)
+            CartItem.query.filter_by(user_id=user.id).delete()
+
+        product = Product(name='Stress Test Item', description='Limited stock item for the checkout stress test',
+                          price=100.0, stock=stock, category_id=Category.query.first().id)
+        db.session.add(product)
+        db.session.commit()
+        return product.id, address_ids
+
+
+def worker(n, product_id, address_id, ready, go, results):
+    """Buys one unit at a time until the product is sold out."""
+    app = _app()
+    client = app.test_client()
+    client.post('/login', data={'email': f'stress{n}@example.com', 'password': PASSWORD})
+    ready.put(n)
+    go.wait()
+
+    checkouts = shortfalls = errors = 0
+    while errors < MAX_ERRORS:
+        response = client.post(f'/cart/add/{product_id}', data={'quantity': '1'})
+        if response.status_code >= 500:
+            errors += 1
+            continue
+        if f'/product/{product_id}' in response.headers.get('Location', ''):
+            break  # add_to_cart refused: nothing left in stock
+
+        response = client.post('/checkout', data={'address_id': str(address_id), 'payment_method': 'cod'})
+        location = response.headers.get('Location', '')
+        if response.status_code >= 500:
+            errors += 1
+        elif '/payment/' in location:
+            checkouts += 1
+        else:
+            shortfalls += 1
+            break
+    results.put((checkouts, shortfalls, errors))
+
+
+def verify(product_id, stock):
+    from app import db
+    from models import Product, OrderItem
+
+    app = _app()
+    with app.app_context():
+        final_stock = db.session.get(Product, product_id).stock
+        ordered = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)) \
+            .filter_by(product_id=product_id).scalar()
+    return final_stock, ordered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to test against (default: a fresh SQLite file)')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--stock', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/checkout_stress.db'
+
+    product_id, address_ids = setup(args.workers, args.stock)
+
+    ctx = multiprocessing.get_context('spawn')
+    ready, go, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(n, product_id, address_ids[n], ready, go, results))
+                 for n in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    # Start the clock once every worker has imported the app and logged in
+    for _ in processes:
+        ready.get()
+    started = time.perf_counter()
+    go.set()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    checkouts = sum(t[0] for t in totals)
+    errors = sum(t[2] for t in totals)
+    final_stock, ordered = verify(product_id, args.stock)
+    oversold = max(0, ordered - args.stock) or (final_stock < 0)
+
+    print(f'database:      {os.environ["DATABASE_URL"].split("://", 1)[0]}')
+    print(f'workers:       {args.workers}')
+    print(f'checkouts:     {checkouts} in {elapsed:.2f}s ({checkouts / elapsed:.1f}/s)')
+    print(f'errors:        {errors}')
+    print(f'initial stock: {args.stock}')
+    print(f'final stock:   {final_stock}')
+    print(f'units ordered: {ordered}')
+    print(f'oversold:      {"YES" if oversold else "no"}')
+    sys.exit(1 if oversold or checkouts != ordered else 0)
+
+
+if __name__ == '__main__':
+    main()
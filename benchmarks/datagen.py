@@ -0,0 +1,275 @@
+"""
+Synthetic shop data at production-like volumes.
+
+Bulk-inserts categories, products, customers with addresses, and orders with
+their items. The same --seed and --until date always produce the same rows.
+Rows are appended after whatever the database already holds, then the search
+index, sales rollups, facet counts and recommendations are rebuilt and
+catalog caches invalidated.
+
+    python -m benchmarks.datagen --database-url sqlite:////tmp/bench.db --scale small
+    python -m benchmarks.datagen --database-url postgresql://localhost/shop_bench --scale large
+
+Every generated customer signs in as bench<N>@example.com (N from 1) with the
+password in PASSWORD, and bench-admin@example.com is an admin.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+PASSWORD = 'bench-password'
+ADMIN_EMAIL = 'bench-admin@example.com'
+
+# categories, products, users, orders
+SCALES = {
+    'tiny': (8, 2_000, 500, 2_000),
+    'small': (40, 20_000, 5_000, 50_000),
+    'medium': (200, 100_000, 50_000, 500_000),
+    'large': (1_000, 1_000_000, 100_000, 2_000_000),
+}
+
+BATCH_SIZE = 5000
+
+ICON_URL = 'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/{}.svg'
+ICONS = ['box', 'tag', 'gift', 'star', 'shopping-bag', 'tshirt', 'mobile-alt', 'laptop', 'book', 'couch']
+
+DEPARTMENTS = ['Electronics', 'Clothing', 'Home', 'Books', 'Sports', 'Beauty', 'Toys', 'Garden',
+               'Grocery', 'Automotive', 'Music', 'Office', 'Pets', 'Health', 'Jewellery', 'Footwear']
+ADJECTIVES = ['Classic', 'Premium', 'Compact', 'Deluxe', 'Eco', 'Smart', 'Ultra', 'Portable', 'Vintage',
+              'Pro', 'Essential', 'Organic', 'Wireless', 'Handmade', 'Heavy-duty', 'Lightweight']
+NOUNS = ['Speaker', 'Jacket', 'Lamp', 'Novel', 'Bottle', 'Backpack', 'Watch', 'Chair', 'Kettle', 'Shoes',
+         'Headphones', 'Notebook', 'Blender', 'Mat', 'Charger', 'Scarf', 'Camera', 'Pan', 'Helmet', 'Mug']
+COLOURS = ['Black', 'White', 'Red', 'Blue', 'Green', 'Grey', 'Silver', 'Gold', 'Navy', 'Olive']
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Diya', 'Ananya', 'Ishaan', 'Saanvi', 'Kabir', 'Meera', 'Rohan',
+               'Priya', 'Arjun', 'Kavya', 'Neha', 'Rahul', 'Sneha', 'Vikram', 'Pooja', 'Karan', 'Riya']
+LAST_NAMES = ['Sharma', 'Verma', 'Patel', 'Reddy', 'Iyer', 'Nair', 'Gupta', 'Singh', 'Das', 'Khan']
+CITIES = [('New Delhi', 'Delhi', '110'), ('Mumbai', 'Maharashtra', '400'), ('Bengaluru', 'Karnataka', '560'),
+          ('Chennai', 'Tamil Nadu', '600'), ('Kolkata', 'West Bengal', '700'), ('Jaipur', 'Rajasthan', '302'),
+          ('Ahmedabad', 'Gujarat', '380'), ('Lucknow', 'Uttar Pradesh', '226'), ('Kochi', 'Kerala', '682'),
+          ('Patna', 'Bihar', '800')]
+STATUSES = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']
+STATUS_WEIGHTS = [5, 10, 15, 60, 10]
+PAYMENT_METHODS = ['cod', 'card', 'upi', 'netbanking']
+
+
+def _next_id(model):
+    from app import db
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows):
+    """Inserts rows with one executemany per batch and commits."""
+    from app import db
+
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+
+
+def _batched(model, rows):
+    """Inserts an iterable of rows ``BATCH_SIZE`` at a time. Returns the count."""
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            _insert(model, batch)
+            count += len(batch)
+            batch = []
+    _insert(model, batch)
+    return count + len(batch)
+
+
+def _sync_sequences(models):
+    """Moves PostgreSQL id sequences past the explicit ids inserted here."""
+    from sqlalchemy import text
+    from app import db
+
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = db.engine.dialect.identifier_preparer.format_table(model.__table__)
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                                f"(SELECT max(id) FROM {table}))"), {'table': table})
+    db.session.commit()
+
+
+def generate(categories, products, users, orders, seed=1, until=None, log=print):
+    """
+    Appends a synthetic data set. Must run inside an app context.
+
+    Args:
+        categories, products, users, orders (int): Rows to create of each
+        seed (int): Random seed; the same seed gives the same data
+        until (date): Latest order and product date (default: today)
+        log (callable): Receives progress messages
+
+    Returns:
+        dict: Rows created per table
+    """
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from models import Category, Product, User, Address, Order, OrderItem
+    from utils.cache import bump_catalog_version
+    from utils.facets import refresh_facets
+    from utils.recommendations import rebuild_recommendations
+    from utils.rollups import rebuild_rollups
+    from utils.search import rebuild_search_index
+
+    rng = random.Random(seed)
+    until = datetime.combine(until or date.today(), datetime.min.time())
+    counts = {}
+
+    def timed(name, model, rows):
+        started = time.perf_counter()
+        counts[name] = _batched(model, rows)
+        log(f'{name:12} {counts[name]:>10,} rows in {time.perf_counter() - started:.1f}s')
+
+    first_category = _next_id(Category)
+    timed('categories', Category, (
+        {'id': first_category + n, 'name': f'{DEPARTMENTS[n % len(DEPARTMENTS)]} {n // len(DEPARTMENTS) + 1}',
+         'description': f'Synthetic {DEPARTMENTS[n % len(DEPARTMENTS)].lower()} category', 'updated_at': until}
+        for n in range(categories)))
+
+    first_product = _next_id(Product)
+    # Skewed so a few categories hold most of the catalog, like real shops
+    category_weights = [1 / (n + 1) for n in range(categories)]
+    category_of = rng.choices(range(first_category, first_category + categories), category_weights, k=products)
+    prices = {}
+
+    def product_rows():
+        for n in range(products):
+            product_id = first_product + n
+            created = until - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+            prices[product_id] = round(min(rng.lognormvariate(7, 1.2), 250000), 2)
+            yield {
+                'id': product_id, 'sku': f'BENCH-{seed}-{product_id}',
+                'name': f'{rng.choice(ADJECTIVES)} {rng.choice(COLOURS)} {rng.choice(NOUNS)} {product_id}',
+                'description': f'A {rng.choice(ADJECTIVES).lower()} {rng.choice(NOUNS).lower()} for everyday use.',
+                'price': prices[product_id], 'stock': 0 if rng.random() < 0.05 else rng.randrange(1, 1000),
+                'image_url': ICON_URL.format(rng.choice(ICONS)), 'featured': rng.random() < 0.001,
+                'created_at': created, 'updated_at': created, 'category_id': category_of[n],
+            }
+    timed('products', Product, product_rows())
+
+    first_user = _next_id(User)
+    password = generate_password_hash(PASSWORD)
+    admin_exists = User.query.filter_by(email=ADMIN_EMAIL).first() is not None
+    bench_numbers = User.query.filter(User.email.like('bench%@example.com')).count() - admin_exists
+
+    def user_rows():
+        for n in range(users):
+            yield {
+                'id': first_user + n, 'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'email': f'bench{bench_numbers + n + 1}@example.com', 'password': password,
+                'is_admin': False, 'auth_version': 0,
+                'created_at': until - timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)),
+            }
+        if not admin_exists:
+            yield {'id': first_user + users, 'name': 'Bench Admin', 'email': ADMIN_EMAIL, 'password': password,
+                   'is_admin': True, 'auth_version': 0, 'created_at': until}
+    timed('users', User, user_rows())
+
+    first_address = _next_id(Address)
+    addresses_of = []
+
+    def address_rows():
+        address_id = first_address
+        for n in range(users):
+            owned = []
+            for k in range(rng.choice([1, 1, 1, 2, 2, 3])):
+                city, state, prefix = rng.choice(CITIES)
+                owned.append(address_id)
+                yield {
+                    'id': address_id, 'address_line1': f'{rng.randrange(1, 999)} {rng.choice(LAST_NAMES)} Road',
+                    'address_line2': None, 'city': city, 'state': state,
+                    'pincode': f'{prefix}{rng.randrange(1000):03d}',
+                    'phone': f'9{rng.randrange(10 ** 9):09d}', 'is_default': k == 0, 'user_id': first_user + n,
+                }
+                address_id += 1
+            addresses_of.append(owned)
+    timed('addresses', Address, address_rows())
+
+    first_order = _next_id(Order)
+    item_id = _next_id(OrderItem)
+    # Popular products sell far more often than the long tail
+    product_ids = range(first_product, first_product + products)
+    cumulative = list(accumulate(1 / (n + 1) ** 0.8 for n in range(products)))
+
+    started = time.perf_counter()
+    counts['orders'] = counts['order items'] = 0
+    order_batch, item_batch = [], []
+    for n in range(orders):
+        order_id = first_order + n
+        user_index = rng.randrange(users)
+        total = 0
+        for product_id in rng.choices(product_ids, cum_weights=cumulative, k=rng.choice([1, 1, 2, 2, 3, 4])):
+            quantity = rng.choice([1, 1, 1, 2, 3])
+            total += prices[product_id] * quantity
+            item_batch.append({'id': item_id, 'order_id': order_id, 'product_id': product_id,
+                               'quantity': quantity, 'price': prices[product_id]})
+            item_id += 1
+        created = until - timedelta(minutes=rng.randrange(365 * 24 * 60))
+        order_batch.append({
+            'id': order_id, 'order_number': f'BN{seed % 100:02d}{order_id:012d}', 'total_amount': round(total, 2),
+            'status': rng.choices(STATUSES, STATUS_WEIGHTS)[0], 'payment_method': rng.choice(PAYMENT_METHODS),
+            'created_at': created, 'updated_at': created, 'user_id': first_user + user_index,
+            'address_id': rng.choice(addresses_of[user_index]),
+        })
+        if len(order_batch) >= BATCH_SIZE or n == orders - 1:
+            # Each order batch goes in before its items
+            _insert(Order, order_batch)
+            _insert(OrderItem, item_batch)
+            counts['orders'] += len(order_batch)
+            counts['order items'] += len(item_batch)
+            order_batch, item_batch = [], []
+    log(f'{"orders":12} {counts["orders"]:>10,} rows, {counts["order items"]:,} items '
+        f'in {time.perf_counter() - started:.1f}s')
+
+    _sync_sequences([Category, Product, User, Address, Order, OrderItem])
+    started = time.perf_counter()
+    rebuild_search_index()
+    log(f'search index rebuilt in {time.perf_counter() - started:.1f}s')
+    started = time.perf_counter()
+    rebuild_rollups()
+    log(f'sales rollups rebuilt in {time.perf_counter() - started:.1f}s')
+    started = time.perf_counter()
+    refresh_facets()
+    log(f'category facets counted in {time.perf_counter() - started:.1f}s')
+    started = time.perf_counter()
+    rebuild_recommendations(log=lambda line: None)
+    log(f'recommendations rebuilt in {time.perf_counter() - started:.1f}s')
+    bump_catalog_version()
+    db.session.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--scale', choices=SCALES, default='small', help='Preset volumes (see SCALES)')
+    parser.add_argument('--categories', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--orders', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--until', type=date.fromisoformat, help='Latest order date, YYYY-MM-DD (default: today)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import create_app
+    from utils.bootstrap import init_db
+
+    volumes = dict(zip(('categories', 'products', 'users', 'orders'), SCALES[args.scale]))
+    volumes.update({name: getattr(args, name) for name in volumes if getattr(args, name) is not None})
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        generate(seed=args.seed, until=args.until, **volumes)
+
+
+if __name__ == '__main__':
+    main()
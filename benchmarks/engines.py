@@ -0,0 +1,126 @@
+"""
+Mixed read/write throughput per engine profile.
+
+Runs the same workload against each DB_ENGINE_PROFILE: --workers processes
+(like gunicorn workers) that, until --seconds are up, either view a random
+product page or, with probability --write-ratio, add a product to the cart
+and check out. Reports page views and orders per second, 500s ("database is
+locked" and the like) and latency percentiles for each profile.
+
+    python -m benchmarks.engines
+    python -m benchmarks.engines --workers 8 --seconds 20 --write-ratio 0.5
+    python -m benchmarks.engines --database-url postgresql://localhost/engines_bench
+
+Each SQLite profile gets a fresh database file unless --database-url is given.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+PROFILES = ('default', 'auto')
+
+
+def worker(n, product_ids, order_product_id, address_id, seconds, write_ratio, ready, go, results):
+    """Runs the mix until ``seconds`` after the start signal."""
+    from benchmarks.checkout_stress import PASSWORD, _app
+
+    app = _app()
+    client = app.test_client()
+    client.post('/login', data={'email': f'stress{n}@example.com', 'password': PASSWORD})
+    rng = random.Random(n)
+    ready.put(n)
+    go.wait()
+
+    reads, orders, errors, latencies = 0, 0, 0, {'read': [], 'write': []}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if rng.random() < write_ratio:
+            kind = 'write'
+            statuses = [client.post(f'/cart/add/{order_product_id}', data={'quantity': '1'}).status_code,
+                        client.post('/checkout', data={'address_id': str(address_id),
+                                                       'payment_method': 'cod'}).status_code]
+        else:
+            kind = 'read'
+            statuses = [client.get(f'/product/{rng.choice(product_ids)}').status_code]
+        latencies[kind].append((time.perf_counter() - started) * 1000)
+        if max(statuses) >= 500:
+            errors += 1
+        elif kind == 'write':
+            orders += 1
+        else:
+            reads += 1
+    results.put((reads, orders, errors, latencies))
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100, method='inclusive')[int(fraction * 100) - 1] \
+        if len(samples) > 1 else samples[0]
+
+
+def run(profile, args):
+    os.environ['DB_ENGINE_PROFILE'] = profile
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/engines_{profile}.db'
+    from app import db
+    from models import Product
+    from benchmarks.checkout_stress import _app, setup
+
+    order_product_id, address_ids = setup(args.workers, 10 ** 9)
+    with _app().app_context():
+        product_ids = [row[0] for row in db.session.query(Product.id).filter(Product.id != order_product_id)]
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    ready, go, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(n, product_ids, order_product_id, address_ids[n],
+                                                  args.seconds, args.write_ratio, ready, go, results))
+                 for n in range(args.workers)]
+    for process in processes:
+        process.start()
+    # Start the clock once every worker has imported the app and logged in
+    for _ in processes:
+        ready.get()
+    started = time.perf_counter()
+    go.set()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    reads = sum(t[0] for t in totals)
+    orders = sum(t[1] for t in totals)
+    errors = sum(t[2] for t in totals)
+    read_ms = [ms for t in totals for ms in t[3]['read']]
+    write_ms = [ms for t in totals for ms in t[3]['write']]
+    print(f'{profile:10}{reads / elapsed:>10.1f}{orders / elapsed:>10.1f}{errors:>8}'
+          f'{percentile(read_ms, 0.5):>10.1f}{percentile(read_ms, 0.95):>10.1f}'
+          f'{percentile(write_ms, 0.5):>10.1f}{percentile(write_ms, 0.95):>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to test against (default: a fresh SQLite file per profile)')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+    parser.add_argument('--seconds', type=float, default=10, help='Run time per profile')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Fraction of iterations that place an order')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='DB_ENGINE_PROFILE values to compare')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    backend = (args.database_url or 'sqlite').split(':', 1)[0]
+    print(f'{backend}, {args.workers} workers x {args.seconds:g}s, {args.write_ratio:.0%} orders, '
+          f'{os.cpu_count()} CPUs')
+    print(f'{"profile":10}{"views/s":>10}{"orders/s":>10}{"500s":>8}'
+          f'{"view p50":>10}{"view p95":>10}{"order p50":>10}{"order p95":>10}')
+    for profile in args.profiles.split(','):
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Category facet count timings.
+
+Fills one category with --products synthetic products, then times what a
+category page spends on facet counts: reading the stored per-category counts
+and summarizing them for a selection, against counting them live with the
+single grouped query (what a custom price range or a recount costs).
+
+    python -m benchmarks.facets
+    python -m benchmarks.facets --products 100000 --repeat 50
+    python -m benchmarks.facets --database-url postgresql://localhost/facets_bench
+
+The database is a fresh SQLite file unless --database-url is given.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def timed(fn, repeat):
+    """Returns the median milliseconds of ``repeat`` calls of ``fn``."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to fill (default: a fresh SQLite file)')
+    parser.add_argument('--products', type=int, default=100000, help='Products in the category')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/facets.db'
+    from app import create_app, db
+    from models import Category
+    from utils.bootstrap import init_db
+    from utils.facets import count_facets, refresh_facets, stored_facets, summarize
+    from benchmarks.datagen import generate
+
+    app = create_app({'JOB_WORKER_THREADS': 0})
+    with app.app_context():
+        init_db()
+        generate(categories=1, products=args.products, users=1, orders=0, log=lambda line: None)
+        category_id = db.session.query(db.func.max(Category.id)).scalar()
+
+        def stored():
+            summarize(stored_facets(category_id), price=1, in_stock=True)
+            db.session.rollback()
+
+        def live():
+            summarize(count_facets(category_id), price=1, in_stock=True)
+            db.session.rollback()
+
+        def live_range():
+            summarize(count_facets(category_id, 1000, 20000), in_stock=True)
+            db.session.rollback()
+
+        rows = len(stored_facets(category_id))
+        print(f'{args.products:,} products in one category, {rows} stored facet rows, '
+              f'{db.engine.dialect.name}, median of {args.repeat}')
+        print(f'{"stored counts + summarize":32}{timed(stored, args.repeat):>9.2f}ms')
+        print(f'{"live grouped count":32}{timed(live, args.repeat):>9.2f}ms')
+        print(f'{"live count, custom price range":32}{timed(live_range, args.repeat):>9.2f}ms')
+        print(f'{"recount and store":32}{timed(lambda: refresh_facets([category_id]), max(args.repeat // 4, 1)):>9.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Load test of the shop's main pages.
+
+Worker processes each sign in as their own generated customer (and as the
+bench admin), then replay a weighted mix of browsing, cart, checkout and
+admin requests against the WSGI app for a fixed time. Reports p50/p95/p99
+latency, throughput and SQL statements per request for each page.
+
+    python -m benchmarks.load                      # tiny generated data set
+    python -m benchmarks.load --database-url sqlite:////tmp/bench.db --workers 8 --duration 60
+    python -m benchmarks.load --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load --baseline benchmarks/baseline.json --tolerance 0.25
+
+The database must hold a data set from benchmarks.datagen; without
+--database-url a tiny one is generated in a temporary SQLite file. With
+--baseline, pages whose p95 latency or statements per request grew by more
+than --tolerance are flagged and the exit status is 1. benchmarks/baseline.json
+was recorded on SQLite with `benchmarks.datagen --scale small --until 2026-10-01`,
+4 workers and 20 seconds; record a new one when comparing on other hardware, and
+with any change that knowingly changes a page's statements per request.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import ADMIN_EMAIL, PASSWORD
+
+# Relative frequency of each scenario in the mix
+MIX = {
+    'index': 20,
+    'category': 30,
+    'product': 25,
+    'cart': 10,
+    'checkout': 5,
+    'admin_dashboard': 5,
+    'admin_orders': 5,
+}
+
+# Regressions smaller than this many milliseconds are treated as noise
+MIN_REGRESSION_MS = 2.0
+
+SORTS = ['price_asc', 'price_desc', 'newest']
+
+
+class Session:
+    """A test client that records latency and SQL statements per page."""
+
+    def __init__(self, client, samples):
+        self.client = client
+        self.samples = samples
+
+    def request(self, page, method, url, **kwargs):
+        from utils.metrics import metrics
+
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.samples.setdefault(page, []).append((elapsed, metrics.last_request_statements,
+                                                  response.status_code >= 500))
+        return response
+
+
+def _scenarios(shop, admin, rng, catalog, address_id):
+    category_ids, product_ids = catalog
+
+    def index():
+        shop.request('index', 'GET', '/')
+
+    def category():
+        query = {'sort': rng.choice(SORTS)}
+        if rng.random() < 0.3:
+            low = rng.choice([0, 100, 500, 1000])
+            query.update(min_price=low, max_price=low * 10 + 1000)
+        if rng.random() < 0.2:
+            query['paging'] = 'cursor'
+        else:
+            query['page'] = rng.choice([1, 1, 1, 2, 2, 3, 5, 10])
+        shop.request('category', 'GET', f'/category/{rng.choice(category_ids)}', query_string=query)
+
+    def product():
+        shop.request('product', 'GET', f'/product/{rng.choice(product_ids)}')
+
+    def cart():
+        shop.request('add_to_cart', 'POST', f'/cart/add/{rng.choice(product_ids)}', data={'quantity': '1'})
+        shop.request('cart', 'GET', '/cart')
+
+    def checkout():
+        shop.request('add_to_cart', 'POST', f'/cart/add/{rng.choice(product_ids)}', data={'quantity': '1'})
+        shop.request('checkout_page', 'GET', '/checkout')
+        response = shop.request('checkout', 'POST', '/checkout',
+                                data={'address_id': str(address_id), 'payment_method': 'cod'})
+        location = response.headers.get('Location', '')
+        if '/payment/' in location:
+            shop.request('payment', 'POST', location.replace('/payment/', '/payment/process/'))
+
+    def admin_dashboard():
+        admin.request('admin_dashboard', 'GET', '/admin', query_string={'days': rng.choice([7, 30, 90])})
+
+    def admin_orders():
+        query = {'status': rng.choice(['', 'Pending', 'Delivered'])}
+        admin.request('admin_orders', 'GET', '/admin/orders', query_string=query)
+
+    return {name: fn for name, fn in locals().items() if name in MIX}
+
+
+def worker(n, duration, seed, ready, go, results):
+    """Replays the scenario mix for ``duration`` seconds as customer bench<n+1>."""
+    from app import create_app, db
+    from models import Address, Category, Product, User
+
+    # Hash on the request thread: the benchmark measures pages, not sign-ins
+    app = create_app({'WTF_CSRF_ENABLED': False, 'QUERY_BUDGET_ENFORCE': False, 'PASSWORD_HASH_WORKERS': 0})
+    with app.app_context():
+        catalog = ([row.id for row in db.session.query(Category.id)],
+                   [row.id for row in db.session.query(Product.id).filter(Product.stock > 0)])
+        address_id = db.session.query(Address.id).join(User) \
+            .filter(User.email == f'bench{n + 1}@example.com').first().id
+
+    samples = {}
+    shop, admin = Session(app.test_client(), samples), Session(app.test_client(), samples)
+    shop.client.post('/login', data={'email': f'bench{n + 1}@example.com', 'password': PASSWORD})
+    admin.client.post('/login', data={'email': ADMIN_EMAIL, 'password': PASSWORD})
+
+    rng = random.Random(seed * 1000 + n)
+    scenarios = _scenarios(shop, admin, rng, catalog, address_id)
+    names, weights = list(MIX), list(MIX.values())
+    ready.put(n)
+    go.wait()
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        scenarios[rng.choices(names, weights)[0]]()
+    results.put(samples)
+
+
+def summarize(samples, elapsed):
+    """
+    Returns:
+        dict: Per page: requests, errors, throughput and p50/p95/p99 latency
+              in ms and mean SQL statements per request
+    """
+    report = {}
+    for page, rows in sorted(samples.items()):
+        latencies = sorted(row[0] for row in rows)
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        report[page] = {
+            'requests': len(rows),
+            'errors': sum(row[2] for row in rows),
+            'rps': round(len(rows) / elapsed, 1),
+            'p50': round(cuts[49], 2),
+            'p95': round(cuts[94], 2),
+            'p99': round(cuts[98], 2),
+            'statements': round(statistics.mean(row[1] for row in rows), 2),
+        }
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns:
+        list: Regression messages for pages slower or chattier than the baseline
+    """
+    regressions = []
+    for page, current in report.items():
+        before = baseline.get('pages', {}).get(page)
+        if not before:
+            continue
+        if current['p95'] > before['p95'] * (1 + tolerance) and current['p95'] - before['p95'] > MIN_REGRESSION_MS:
+            regressions.append(f'{page}: p95 {before["p95"]}ms -> {current["p95"]}ms')
+        if current['statements'] > before['statements'] * (1 + tolerance) + 0.5:
+            regressions.append(f'{page}: statements per request {before["statements"]} -> {current["statements"]}')
+        if current['errors'] and not before['errors']:
+            regressions.append(f'{page}: {current["errors"]} server errors')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database with a benchmarks.datagen data set '
+                                               '(default: generate a tiny one in a temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per worker')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='Baseline JSON to compare against')
+    parser.add_argument('--save-baseline', help='Write this run as a baseline JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed growth before flagging (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/load.db'
+        from app import create_app
+        from benchmarks.datagen import SCALES, generate
+        from utils.bootstrap import init_db
+
+        app = create_app()
+        with app.app_context():
+            init_db()
+            generate(*SCALES['tiny'], seed=args.seed, log=lambda message: None)
+
+    ctx = multiprocessing.get_context('spawn')
+    ready, go, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(n, args.duration, args.seed, ready, go, results))
+                 for n in range(args.workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    started = time.perf_counter()
+    go.set()
+    samples = {}
+    for _ in processes:
+        for page, rows in results.get().items():
+            samples.setdefault(page, []).extend(rows)
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    report = summarize(samples, elapsed)
+    total = sum(page['requests'] for page in report.values())
+    print(f'database: {os.environ["DATABASE_URL"].split("://", 1)[0]}, {args.workers} workers, '
+          f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f}/s)')
+    print(f'{"page":16}{"requests":>9}{"errors":>7}{"req/s":>8}{"p50":>9}{"p95":>9}{"p99":>9}{"SQL/req":>9}')
+    for page, row in report.items():
+        print(f'{page:16}{row["requests"]:>9}{row["errors"]:>7}{row["rps"]:>8}'
+              f'{row["p50"]:>7.1f}ms{row["p95"]:>7.1f}ms{row["p99"]:>7.1f}ms{row["statements"]:>9}')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'workers': args.workers, 'duration': args.duration,
+                       'database': os.environ['DATABASE_URL'].split('://', 1)[0], 'pages': report}, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            sys.exit(1)
+        print('no regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
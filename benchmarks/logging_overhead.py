@@ -0,0 +1,90 @@
+"""
+Logging overhead benchmark.
+
+Serves the same page repeatedly under different logging setups and reports
+request latency, writing logs to a file. Setups are interleaved over several
+rounds so drift in the machine's speed affects them all alike.
+
+    basic-debug      logging.basicConfig(level=DEBUG), the old setup: records
+                     formatted and written on the request thread
+    basic-sql        the old setup with SQL statement logging turned on
+    queue-info       the default pipeline: INFO, JSON, written by a background thread
+    queue-sql        the pipeline with SQL statement logging turned on
+    queue-sampled    queue-sql, keeping only LOG_SAMPLE_RATES of the SQL and
+                     access records (default sqlalchemy=0.05,access=0.1)
+
+    python -m benchmarks.logging_overhead --requests 2000 --path "/search?q=phone"
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+
+def _serve(client, path, count):
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to serve from (default: a fresh SQLite file)')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per logging setup')
+    parser.add_argument('--rounds', type=int, default=5, help='Times each setup takes its turn')
+    parser.add_argument('--path', default='/search?q=phone')
+    parser.add_argument('--sample-rates', default='sqlalchemy=0.05,access=0.1')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{workdir}/logging.db'
+
+    from app import create_app
+    from utils.bootstrap import init_db, seed_catalog
+    from utils.logs import configure_logging, parse_pairs, shutdown_logging
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        seed_catalog()
+
+    sql = {'sqlalchemy.engine': 'INFO'}
+    setups = {
+        'basic-debug': lambda sink: logging.basicConfig(level=logging.DEBUG, stream=sink, force=True),
+        'basic-sql': lambda sink: (logging.basicConfig(level=logging.DEBUG, stream=sink, force=True),
+                                   logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)),
+        'queue-info': lambda sink: configure_logging('INFO', stream=sink),
+        'queue-sql': lambda sink: configure_logging('INFO', levels=sql, stream=sink),
+        'queue-sampled': lambda sink: configure_logging(
+            'INFO', levels=sql, sample_rates=parse_pairs(args.sample_rates), stream=sink),
+    }
+    timings = {name: [] for name in setups}
+    sinks = {name: open(os.path.join(workdir, f'{name}.log'), 'w') for name in setups}
+
+    client = app.test_client()
+    _serve(client, args.path, 50)
+    per_round = max(1, args.requests // args.rounds)
+    for _ in range(args.rounds):
+        for name, setup in setups.items():
+            setup(sinks[name])
+            timings[name] += _serve(client, args.path, per_round)
+            shutdown_logging()
+            logging.basicConfig(level=logging.WARNING, force=True)
+            logging.getLogger('sqlalchemy.engine').setLevel(logging.NOTSET)
+
+    print(f'{per_round * args.rounds} requests to {args.path} per setup')
+    print(f'{"":16}{"median":>10}{"p95":>10}{"log size":>12}')
+    for name, sink in sinks.items():
+        sink.close()
+        p95 = statistics.quantiles(timings[name], n=20)[-1]
+        size = os.path.getsize(sink.name) / 1024
+        print(f'{name:16}{statistics.median(timings[name]):>8.2f}ms{p95:>8.2f}ms{size:>10.0f}KB')
+
+
+if __name__ == '__main__':
+    main()
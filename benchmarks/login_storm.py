@@ -0,0 +1,168 @@
+"""
+Storefront latency during a login storm.
+
+Serves the app from a threaded WSGI server in a child process, then
+measures storefront page latency from a few browsing clients, first on their
+own and then while many more clients sign in as fast as they can. Runs once
+with passwords hashed on the request threads (PASSWORD_HASH_WORKERS=0) and
+once with the hashing pool, and reports p50/p95/p99 for each.
+
+    python -m benchmarks.login_storm
+    python -m benchmarks.login_storm --storm 32 --duration 15 --pool-workers 1 --pool-queue 4
+
+Storm clients that are refused with a 429 wait --retry-delay seconds before
+trying again. The database is a fresh SQLite file unless --database-url is
+given; the storm users are created in it either way.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import urllib.parse
+
+PASSWORD = 'storm-password'
+
+STOREFRONT_PATHS = ['/', '/category/1', '/category/2', '/product/1', '/product/2', '/product/3']
+
+
+def prepare_database(users):
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db
+    from models import User
+    from utils.bootstrap import init_db, seed_catalog
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        seed_catalog()
+        password = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+        existing = {row.email for row in db.session.query(User.email).filter(User.email.like('storm%'))}
+        db.session.add_all([User(name=f'Storm {n}', email=f'storm{n}@example.com', password=password)
+                            for n in range(users) if f'storm{n}@example.com' not in existing])
+        db.session.commit()
+
+
+def serve(port, config, ready):
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app({'WTF_CSRF_ENABLED': False, 'QUERY_BUDGET_ENFORCE': False, **config})
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+def request(port, method, path, body=None):
+    """Returns (status, seconds, Retry-After) for one request on a new connection."""
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started, response.getheader('Retry-After')
+    finally:
+        conn.close()
+
+
+def browse(port, stop, latencies, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        status, seconds, _ = request(port, 'GET', rng.choice(STOREFRONT_PATHS))
+        if status == 200:
+            latencies.append(seconds * 1000)
+
+
+def sign_in(port, stop, outcomes, n, users, retry_delay):
+    while not stop.is_set():
+        body = urllib.parse.urlencode({'email': f'storm{n % users}@example.com', 'password': PASSWORD})
+        status, seconds, _ = request(port, 'POST', '/login', body)
+        outcomes.append((status, seconds * 1000))
+        if status == 429:
+            stop.wait(retry_delay)
+
+
+def run_phase(port, args, storm):
+    stop = threading.Event()
+    latencies, outcomes = [], []
+    threads = [threading.Thread(target=browse, args=(port, stop, latencies, n)) for n in range(args.browsers)]
+    if storm:
+        threads += [threading.Thread(target=sign_in, args=(port, stop, outcomes, n, args.users, args.retry_delay))
+                     for n in range(args.storm)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, outcomes
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return [values[0] if values else 0.0] * 3
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to serve (default: a fresh SQLite file)')
+    parser.add_argument('--browsers', type=int, default=4, help='Clients loading storefront pages')
+    parser.add_argument('--storm', type=int, default=24, help='Clients signing in concurrently')
+    parser.add_argument('--users', type=int, default=50, help='Accounts the storm signs in to')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per phase')
+    parser.add_argument('--pool-workers', type=int, default=2, help='PASSWORD_HASH_WORKERS for the pool run')
+    parser.add_argument('--pool-queue', type=int, default=8, help='PASSWORD_HASH_QUEUE for the pool run')
+    parser.add_argument('--retry-delay', type=float, default=0.5, help='Seconds a refused storm client waits')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/login_storm.db'
+    prepare_database(args.users)
+
+    modes = {
+        'inline': {'PASSWORD_HASH_WORKERS': 0},
+        'pool': {'PASSWORD_HASH_WORKERS': args.pool_workers, 'PASSWORD_HASH_QUEUE': args.pool_queue},
+    }
+    ctx = multiprocessing.get_context('spawn')
+    print(f'{args.browsers} browsing clients, {args.storm} signing in, {args.duration:.0f}s per phase, '
+          f'{os.cpu_count()} CPUs')
+    print(f'{"mode":8}{"phase":7}{"pages":>7}{"p50":>9}{"p95":>9}{"p99":>9}'
+          f'{"logins":>8}{"429s":>7}{"errors":>8}{"login p95":>11}')
+    for mode, config in modes.items():
+        port, ready = free_port(), ctx.Event()
+        server = ctx.Process(target=serve, args=(port, config, ready))
+        server.start()
+        ready.wait(30)
+        try:
+            request(port, 'GET', '/')
+            for phase, storm in (('quiet', False), ('storm', True)):
+                latencies, outcomes = run_phase(port, args, storm)
+                p50, p95, p99 = percentiles(latencies)
+                signed_in = [ms for status, ms in outcomes if status == 302]
+                refused = sum(1 for status, _ in outcomes if status == 429)
+                errors = sum(1 for status, _ in outcomes if status >= 500)
+                login_p95 = f'{percentiles(signed_in)[1]:>9.0f}ms' if signed_in else f'{"-":>11}'
+                print(f'{mode:8}{phase:7}{len(latencies):>7}{p50:>7.1f}ms{p95:>7.1f}ms{p99:>7.1f}ms'
+                      f'{len(signed_in):>8}{refused:>7}{errors:>8}{login_p95}')
+        finally:
+            server.terminate()
+            server.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Recommendation rebuild runtime and memory.
+
+Generates synthetic orders until the order history holds about
+--order-items lines, then times a full ``rebuild_recommendations`` in a
+forked child and reports its wall time and peak memory (max RSS), the
+incremental recount of the best-selling products, and the page lookups.
+
+    python -m benchmarks.recommendations --order-items 1000000
+    python -m benchmarks.recommendations --order-items 10000000 --products 100000
+    python -m benchmarks.recommendations --database-url postgresql://localhost/reco_bench --skip-generate
+
+The database is a fresh SQLite file unless --database-url is given.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+# Average order lines per generated order (see benchmarks.datagen)
+ITEMS_PER_ORDER = 2.17
+
+
+def rebuild(app, results):
+    from app import db
+    from utils.recommendations import rebuild_recommendations
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        products = rebuild_recommendations(log=lambda line: None)
+        results.put((products, time.perf_counter() - started, before,
+                     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to fill (default: a fresh SQLite file)')
+    parser.add_argument('--order-items', type=int, default=1000000, help='Order lines to generate')
+    parser.add_argument('--products', type=int, default=20000, help='Products the orders are drawn from')
+    parser.add_argument('--skip-generate', action='store_true', help='Use the orders already in the database')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed runs per lookup')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/recommendations.db'
+    from app import create_app, db
+    from models import OrderItem, ProductNeighbour
+    from utils.bootstrap import init_db
+    from utils.recommendations import also_bought, bought_together, refresh_neighbours
+    from benchmarks.datagen import generate
+
+    app = create_app({'JOB_WORKER_THREADS': 0})
+    with app.app_context():
+        init_db()
+        if not args.skip_generate:
+            started = time.perf_counter()
+            orders = int(args.order_items / ITEMS_PER_ORDER)
+            generate(categories=20, products=args.products, users=max(orders // 20, 1), orders=orders,
+                     log=lambda line: None)
+            print(f'generated {orders:,} orders in {time.perf_counter() - started:.0f}s')
+        items = db.session.query(db.func.count(OrderItem.id)).scalar()
+        best_sellers = [row[0] for row in db.session.query(OrderItem.product_id)
+                        .group_by(OrderItem.product_id).order_by(db.func.count().desc()).limit(10)]
+        db.session.rollback()
+
+    results = multiprocessing.get_context('fork').Queue()
+    child = multiprocessing.get_context('fork').Process(target=rebuild, args=(app, results))
+    child.start()
+    products, seconds, rss_before, rss_after = results.get()
+    child.join()
+
+    with app.app_context():
+        neighbours = db.session.query(db.func.count()).select_from(ProductNeighbour).scalar()
+        print(f'{items:,} order items, {db.engine.dialect.name}, {os.cpu_count()} CPUs')
+        print(f'{"full rebuild":34}{seconds:>10.1f}s   peak RSS {rss_after / 1024:,.0f} MB '
+              f'(+{(rss_after - rss_before) / 1024:,.0f} MB)')
+        print(f'{"":34}{products:>10,} products, {neighbours:,} neighbour rows')
+
+        def refresh():
+            refresh_neighbours(best_sellers)
+            db.session.commit()
+        print(f'{"recount 10 best sellers":34}{timed(refresh, 3):>10.1f}ms')
+        print(f'{"also_bought (product page)":34}'
+              f'{timed(lambda: also_bought(best_sellers[0]), args.repeat):>10.2f}ms')
+        print(f'{"bought_together (4-line cart)":34}'
+              f'{timed(lambda: bought_together(best_sellers[:4]), args.repeat):>10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Worker cold-start benchmark.
+
+Starts fresh Python processes the way a gunicorn worker or an autoscaled
+instance would, and reports how long importing the app takes and how long
+the first and second requests take once it is imported.
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --database-url postgresql://localhost/shop_bench --path /category/1
+
+The database is created and seeded first (a fresh SQLite file by default).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in each child process; prints one JSON line of timings in milliseconds
+CHILD = '''
+import json, time
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+client = app.test_client()
+status = client.get(PATH).status_code
+first = time.perf_counter()
+client.get(PATH)
+second = time.perf_counter()
+print(json.dumps({
+    'status': status,
+    'import': (imported - started) * 1000,
+    'first_request': (first - imported) * 1000,
+    'second_request': (second - first) * 1000,
+}))
+'''
+
+
+def prepare_database():
+    from main import app
+    from utils.bootstrap import init_db, seed_catalog, ensure_admin
+
+    with app.app_context():
+        init_db()
+        seed_catalog()
+        ensure_admin('admin@example.com', 'admin123')
+
+
+def run_child(path):
+    code = f'PATH = {path!r}\n' + CHILD
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to start against (default: a fresh SQLite file)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/', help='Page requested by each fresh process')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/startup.db'
+    prepare_database()
+
+    runs = [run_child(args.path) for _ in range(args.runs)]
+    if any(run['status'] != 200 for run in runs):
+        sys.exit(f'{args.path} did not return 200')
+
+    print(f'database: {os.environ["DATABASE_URL"].split("://", 1)[0]}')
+    print(f'runs:     {args.runs} fresh processes requesting {args.path}')
+    print(f'{"":16}{"median":>10}{"min":>10}{"max":>10}')
+    for key in ('import', 'first_request', 'second_request'):
+        values = [run[key] for run in runs]
+        print(f'{key:16}{statistics.median(values):>8.1f}ms{min(values):>8.1f}ms{max(values):>8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, FloatField, IntegerField, SelectField, HiddenField, RadioField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, NumberRange
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, NumberRange, ValidationError
 from utils.pincodes import is_valid_pincode
 
 class LoginForm(FlaskForm):
@@ -28,7 +29,7 @@ class AddressForm(FlaskForm):
     
     def validate_pincode(self, pincode):
         if not is_valid_pincode(pincode.data):
-            raise ValueError('Invalid PIN code. Please enter a valid Indian PIN code.')
+            raise ValidationError('Invalid PIN code. Please enter a valid Indian PIN code.')
 
 class CheckoutForm(FlaskForm):
     address_id = RadioField('Select Delivery Address', coerce=int, validators=[DataRequired()])
@@ -42,6 +43,7 @@ class CheckoutForm(FlaskForm):
 
 class ProductForm(FlaskForm):
     name = StringField('Product Name', validators=[DataRequired(), Length(max=100)])
+    sku = StringField('SKU', validators=[Optional(), Length(max=64)])
     description = TextAreaField('Description', validators=[DataRequired()])
     price = FloatField('Price', validators=[DataRequired(), NumberRange(min=0)])
     stock = IntegerField('Stock', validators=[DataRequired(), NumberRange(min=0)])
@@ -49,3 +51,16 @@ class ProductForm(FlaskForm):
     category_id = SelectField('Category', coerce=int, validators=[DataRequired()])
     featured = BooleanField('Featured Product')
     submit = SubmitField('Save Product')
+    
+    # Set to the product being edited so its own SKU is not reported as taken
+    product_id = None
+    
+    def validate_sku(self, field):
+        from models import Product
+        field.data = (field.data or '').strip() or None
+        if field.data and Product.query.filter(Product.sku == field.data, Product.id != self.product_id).first():
+            raise ValidationError('Another product already uses this SKU.')
+
+class ProductImportForm(FlaskForm):
+    feed = FileField('Product Feed', validators=[FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson'], 'CSV or JSON Lines files only')])
+    submit = SubmitField('Import')
@@ -8,6 +8,8 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(256), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
+    # Bumped to end the user's sessions when their access changes
+    auth_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -22,6 +24,7 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     products = db.relationship('Product', backref='category', lazy=True)
@@ -31,13 +34,16 @@ class Category(db.Model):
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # Stable key used to match rows in bulk product feeds
+    sku = db.Column(db.String(64), unique=True, index=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     stock = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String(200))
-    featured = db.Column(db.Boolean, default=False)
+    featured = db.Column(db.Boolean, default=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign keys
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
@@ -46,6 +52,12 @@ class Product(db.Model):
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
     
+    # Category listings filter on category and sort by price or newest
+    __table_args__ = (
+        db.Index('ix_product_category_id_price', 'category_id', 'price'),
+        db.Index('ix_product_category_id_created_at', 'category_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Product {self.name}>'
 
@@ -65,6 +77,10 @@ class Address(db.Model):
     # Relationships
     orders = db.relationship('Order', backref='address', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_address_user_id_is_default', 'user_id', 'is_default'),
+    )
+    
     def __repr__(self):
         return f'<Address {self.city}, {self.pincode}>'
 
@@ -74,15 +90,22 @@ class Order(db.Model):
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='Pending')  # Pending, Processing, Shipped, Delivered, Cancelled
     payment_method = db.Column(db.String(50))  # COD, Credit Card, Debit Card, UPI, etc.
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    address_id = db.Column(db.Integer, db.ForeignKey('address.id'), nullable=False)
+    address_id = db.Column(db.Integer, db.ForeignKey('address.id'), nullable=False, index=True)
     
     # Relationships
     items = db.relationship('OrderItem', backref='order', lazy=True)
     
+    # Order listings are newest first, per customer or per status
+    __table_args__ = (
+        db.Index('ix_order_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Order {self.order_number}>'
 
@@ -92,8 +115,8 @@ class OrderItem(db.Model):
     price = db.Column(db.Float, nullable=False)  # Price at the time of order
     
     # Foreign keys
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<OrderItem {self.id}>'
@@ -107,5 +130,108 @@ class CartItem(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_cart_item_user_id_product_id', 'user_id', 'product_id'),
+    )
+    
     def __repr__(self):
         return f'<CartItem {self.id}>'
+
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+class SalesRollup(db.Model):
+    # Revenue, order and unit counts per order day x current status x category,
+    # kept current by utils.rollups. category_id 0 holds whole-order figures.
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SalesRollup {self.day} {self.status} {self.category_id}>'
+
+class SalesTotal(db.Model):
+    # Running all-time totals per status
+    status = db.Column(db.String(20), primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SalesTotal {self.status}>'
+
+class SiteTotal(db.Model):
+    # Running counts the admin dashboard shows besides sales, e.g. customers,
+    # kept current by utils.rollups
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SiteTotal {self.name}>'
+
+class ProductFacet(db.Model):
+    # Product counts per category x price bucket x in stock x featured x new
+    # arrival, rebuilt per category by utils.facets; at most 40 rows a category
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    price_bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    in_stock = db.Column(db.Boolean, primary_key=True)
+    featured = db.Column(db.Boolean, primary_key=True)
+    new_arrival = db.Column(db.Boolean, primary_key=True)
+    products = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ProductFacet {self.category_id} {self.price_bucket}>'
+
+class ProductOrderCount(db.Model):
+    # Orders containing each product, kept by utils.recommendations
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ProductOrderCount {self.product_id}={self.orders}>'
+
+class ProductNeighbour(db.Model):
+    # The products most often bought together with product_id, best first,
+    # kept by utils.recommendations; at most TOP_K rows a product
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    # Cosine similarity of the two products' orders, and the orders they share
+    score = db.Column(db.Float, nullable=False)
+    together = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<ProductNeighbour {self.product_id} #{self.rank}: {self.neighbour_id}>'
+
+class Job(db.Model):
+    # Background work queued by utils.jobs. A job stays 'queued' while a worker
+    # holds it; locked_until is that worker's lease, after which it may be retried.
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # Jobs with the same key are only queued once
+    key = db.Column(db.String(200), unique=True)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    # Workers look for queued jobs that are due
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}>'
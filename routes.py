@@ -1,33 +1,54 @@
-from flask import render_template, request, redirect, url_for, flash, session, jsonify, abort
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import app, db
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify, abort, Response, stream_with_context
+from app import db
 from models import User, Product, Category, Order, OrderItem, CartItem, Address
-from forms import LoginForm, RegisterForm, AddressForm, CheckoutForm, ProductForm
+from forms import LoginForm, RegisterForm, AddressForm, CheckoutForm, ProductForm, ProductImportForm
 from datetime import datetime
 import random
 import string
 from functools import wraps
-from utils.pincodes import is_valid_pincode
+from utils.pincodes import is_valid_pincode, validate_pincodes
+from utils.queries import eager, count_by, query_budget
+from utils.pagination import keyset_paginate
+from utils.search import search_products, index_product, remove_product
+from utils.catalog_io import default_sku, export_products, queue_import, FORMATS
+from utils.principal import current_principal, login_user, logout_user
+from utils.carts import cart_lines, cart_store, remember_cart_count
+from utils.fragments import fragment_cache, nav_categories
+from utils.conditional import conditional, etag_for, last_modified_of
+from utils.metrics import render_metrics
+from utils.rollups import add_order, count_customers, customer_count, move_order, sales_summary
+from utils.jobs import publish
+from utils.replicas import replica_reads
+from utils.recommendations import also_bought, bought_together
+from utils.facets import PRICE_BUCKETS, price_bucket_index, facet_filters, count_facets, stored_facets, summarize, refresh_facets_later, product_count
+from utils.passwords import PasswordHashingBusy, check_password, hash_password, needs_rehash
+from utils.cache import catalog_cache, catalog_cached, catalog_version, bump_catalog_version, detach, freeze_pagination
+
+# Every page of the shop and its admin panel
+bp = Blueprint('shop', __name__)
+
+# Top of the category page's max price slider, which means no upper limit
+PRICE_SLIDER_MAX = 100000
 
 # Custom decorators
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_principal() is None:
             flash('Please login to access this page', 'danger')
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('.login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        principal = current_principal()
+        if principal is None:
             flash('Please login to access this page', 'danger')
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('.login', next=request.url))
         
-        user = User.query.get(session['user_id'])
-        if not user or not user.is_admin:
+        if not principal.is_admin:
             abort(403)
         return f(*args, **kwargs)
     return decorated_function
@@ -35,77 +56,231 @@ def admin_required(f):
 # Helper functions
 def get_cart_items():
     if 'user_id' in session:
-        cart_items = CartItem.query.filter_by(user_id=session['user_id']).all()
-        total = sum(item.product.price * item.quantity for item in cart_items)
-        return cart_items, total
+        return cart_lines(session['user_id'])
     return [], 0
 
+def cached_product(id):
+    """The product with its category from the catalog cache, or None."""
+    return catalog_cached('product', lambda: detach(eager(Product.query, 'category').filter_by(id=id).first()), id)
+
+def reserve_stock(cart_items):
+    """
+    Takes each cart line's quantity out of stock with a conditional UPDATE that
+    only matches while enough stock is left, so concurrent checkouts cannot
+    drive stock negative. Lines are reserved in product id order so two
+    checkouts always lock rows in the same order.
+    
+    Returns the cart lines that could not be reserved; the caller must roll
+    back if there are any.
+    """
+    shortfalls = []
+    for item in sorted(cart_items, key=lambda item: item.product_id):
+        reserved = Product.query.filter(
+            Product.id == item.product_id,
+            Product.stock >= item.quantity
+        ).update({'stock': Product.stock - item.quantity}, synchronize_session=False)
+        if not reserved:
+            shortfalls.append(item)
+    return shortfalls
+
+def publish_order_event(event, order, **details):
+    """
+    Updates the sales rollups for an order event and queues its follow-up
+    work (stock alerts, recommendations), all in the current transaction, so
+    none of it happens unless the request commits.
+    """
+    if event == 'order.placed':
+        add_order(order)
+    else:
+        move_order(order, details['old_status'])
+    publish(event, {'order_id': order.id, 'status': order.status, **details},
+            key=f'{event}:{order.id}' if event == 'order.placed' else None)
+
+def hashing_busy(template, **context):
+    """Re-renders a sign-in form with a 429 when the password hashing queue is full."""
+    flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+    return render_template(template, **context), 429, {'Retry-After': '2'}
+
 def generate_order_number():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
 
 # Route handlers
-@app.route('/')
+@bp.route('/')
+@query_budget(3)
+@replica_reads
 def index():
-    featured_products = Product.query.filter_by(featured=True).limit(8).all()
-    categories = Category.query.all()
+    featured_products = catalog_cached('featured', lambda: detach(Product.query.filter_by(featured=True).limit(8).all()))
+    categories = catalog_cached('categories', lambda: detach(Category.query.all()))
+    
+    not_modified = conditional(etag_for('index', catalog_version()),
+                               public=True, max_age=current_app.config['CATALOG_MAX_AGE'])
+    if not_modified:
+        return not_modified
+    
     return render_template('index.html', 
                            featured_products=featured_products, 
                            categories=categories)
 
-@app.route('/category/<int:id>')
+@bp.route('/category/<int:id>')
+@query_budget(4)
+@replica_reads
 def category(id):
-    category = Category.query.get_or_404(id)
+    category = catalog_cached('category', lambda: detach(db.session.get(Category, id)), id)
+    if category is None:
+        abort(404)
     page = request.args.get('page', 1, type=int)
     per_page = 6  # Products per page
     
-    # Get filter parameters
+    # Get filter parameters; the slider ends mean no price limit
     min_price = request.args.get('min_price', type=float, default=0)
-    max_price = request.args.get('max_price', type=float, default=100000)
+    max_price = request.args.get('max_price', type=float, default=PRICE_SLIDER_MAX)
     sort_by = request.args.get('sort', 'price_asc')
+    low = min_price if min_price > 0 else None
+    high = max_price if max_price < PRICE_SLIDER_MAX else None
+    
+    # Facets: a price bucket key and on/off switches
+    price = price_bucket_index(request.args.get('price'))
+    in_stock = request.args.get('in_stock') == '1'
+    featured = request.args.get('featured') == '1'
+    new_arrival = request.args.get('new') == '1'
+    
+    # Cursor mode seeks past the last product shown instead of using OFFSET
+    cursor_mode = request.args.get('paging') == 'cursor'
+    cursor = request.args.get('cursor')
+    
+    def load_products():
+        # Build query
+        query = Product.query.filter_by(category_id=id)
+        if low is not None:
+            query = query.filter(Product.price >= low)
+        if high is not None:
+            query = query.filter(Product.price <= high)
+        query = facet_filters(query, price, in_stock, featured, new_arrival)
+        
+        if cursor_mode:
+            if sort_by == 'newest':
+                keys, descending = [Product.created_at, Product.id], True
+            else:
+                keys, descending = [Product.price, Product.id], sort_by == 'price_desc'
+            products = keyset_paginate(query, keys, cursor=cursor,
+                                       per_page=per_page, descending=descending)
+            detach(products.items)
+            return products
+        
+        # Apply sorting
+        if sort_by == 'price_asc':
+            query = query.order_by(Product.price.asc())
+        elif sort_by == 'price_desc':
+            query = query.order_by(Product.price.desc())
+        elif sort_by == 'newest':
+            query = query.order_by(Product.created_at.desc())
+        
+        # Execute query with pagination
+        return freeze_pagination(query.paginate(page=page, per_page=per_page, error_out=False))
     
-    # Build query
-    query = Product.query.filter_by(category_id=id).filter(
-        Product.price >= min_price,
-        Product.price <= max_price
-    )
+    products = catalog_cached('category_products', load_products,
+                              id, low, high, price, in_stock, featured, new_arrival,
+                              sort_by, cursor if cursor_mode else page)
     
-    # Apply sorting
-    if sort_by == 'price_asc':
-        query = query.order_by(Product.price.asc())
-    elif sort_by == 'price_desc':
-        query = query.order_by(Product.price.desc())
-    elif sort_by == 'newest':
-        query = query.order_by(Product.created_at.desc())
+    # Stored counts cover the whole category; a custom price range is counted live
+    if low is None and high is None:
+        facet_rows = catalog_cached('facets', lambda: stored_facets(id), id)
+    else:
+        facet_rows = catalog_cached('facets', lambda: count_facets(id, low, high), id, low, high)
+    facets = summarize(facet_rows, price, in_stock, featured, new_arrival)
+    
+    # Query arguments that keep the current selection in pagination and facet links
+    filters = {'min_price': low, 'max_price': high, 'sort': sort_by,
+               'price': PRICE_BUCKETS[price][0] if price is not None else None,
+               'in_stock': 1 if in_stock else None, 'featured': 1 if featured else None,
+               'new': 1 if new_arrival else None}
     
-    # Execute query with pagination
-    products = query.paginate(page=page, per_page=per_page, error_out=False)
+    not_modified = conditional(etag_for('category', request.full_path, catalog_version()),
+                               public=True, max_age=current_app.config['CATALOG_MAX_AGE'])
+    if not_modified:
+        return not_modified
     
     return render_template('category.html', 
                           category=category, 
                           products=products,
+                          cursor_mode=cursor_mode,
                           min_price=min_price,
                           max_price=max_price,
-                          sort_by=sort_by)
-
-@app.route('/product/<int:id>')
+                          price_slider_max=PRICE_SLIDER_MAX,
+                          sort_by=sort_by,
+                          facets=facets,
+                          filters=filters)
+
+@bp.route('/product/<int:id>')
+@query_budget(3)
+@replica_reads
 def product(id):
-    product = Product.query.get_or_404(id)
-    related_products = Product.query.filter_by(category_id=product.category_id).filter(Product.id != id).limit(4).all()
+    product = cached_product(id)
+    if product is None:
+        abort(404)
+    
+    def load_related():
+        related = also_bought(id)
+        if not related:
+            # Nothing bought with it yet; show others from its category
+            related = Product.query.filter_by(category_id=product.category_id).filter(Product.id != id).limit(4).all()
+        return detach(related)
+    
+    related_products = catalog_cached('related', load_related, id)
+    
+    not_modified = conditional(etag_for('product', id, catalog_version()),
+                               public=True, max_age=current_app.config['CATALOG_MAX_AGE'])
+    if not_modified:
+        return not_modified
+    
     return render_template('product.html', product=product, related_products=related_products)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/search')
+@query_budget(3)
+@replica_reads
+def search():
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    category_id = request.args.get('category', type=int)
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    
+    categories = Category.query.order_by(Category.name).all()
+    query = search_products(q, category_id=category_id, min_price=min_price, max_price=max_price)
+    products = query.paginate(page=page, per_page=12, error_out=False) if query is not None else None
+    
+    return render_template('search.html',
+                          q=q,
+                          products=products,
+                          categories=categories,
+                          category_id=category_id,
+                          min_price=min_price,
+                          max_price=max_price)
+
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if 'user_id' in session:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         
-        if user and check_password_hash(user.password, form.password.data):
-            session['user_id'] = user.id
-            session['user_name'] = user.name
-            session['is_admin'] = user.is_admin
+        try:
+            valid = user is not None and check_password(user.password, form.password.data)
+        except PasswordHashingBusy:
+            return hashing_busy('login.html', form=form)
+        
+        if valid:
+            # Upgrade hashes made with older parameters while we have the password
+            # in the hashing pool; skipped for now when the pool is full
+            try:
+                if needs_rehash(user.password):
+                    user.password = hash_password(form.password.data)
+                    db.session.commit()
+            except PasswordHashingBusy:
+                pass
+            login_user(user)
             
             # Get default address if exists
             default_address = Address.query.filter_by(user_id=user.id, is_default=True).first()
@@ -117,16 +292,16 @@ def login():
             
             if next_page:
                 return redirect(next_page)
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
         else:
             flash('Login unsuccessful. Please check email and password', 'danger')
     
     return render_template('login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if 'user_id' in session:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     form = RegisterForm()
     if form.validate_on_submit():
@@ -137,7 +312,10 @@ def register():
             return render_template('register.html', form=form)
         
         # Create new user
-        hashed_password = generate_password_hash(form.password.data)
+        try:
+            hashed_password = hash_password(form.password.data)
+        except PasswordHashingBusy:
+            return hashing_busy('register.html', form=form)
         user = User(
             name=form.name.data,
             email=form.email.data,
@@ -145,122 +323,113 @@ def register():
         )
         
         db.session.add(user)
+        count_customers(1)
         db.session.commit()
         
         flash('Account created successfully! You can now login.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     return render_template('register.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
-    session.pop('user_id', None)
-    session.pop('user_name', None)
-    session.pop('is_admin', None)
-    session.pop('default_address', None)
+    logout_user()
     flash('You have been logged out', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/cart')
+@bp.route('/cart')
+@query_budget(3)
 def cart():
     cart_items, total = get_cart_items()
-    return render_template('cart.html', cart_items=cart_items, total=total)
+    product_ids = tuple(item.product_id for item in cart_items)
+    suggestions = catalog_cached('bought_together', lambda: detach(bought_together(product_ids)),
+                                 product_ids) if product_ids else []
+    return render_template('cart.html', cart_items=cart_items, total=total, suggestions=suggestions)
 
-@app.route('/cart/add/<int:product_id>', methods=['POST'])
+@bp.route('/cart/add/<int:product_id>', methods=['POST'])
 @login_required
+@query_budget(2)
 def add_to_cart(product_id):
-    product = Product.query.get_or_404(product_id)
+    product = cached_product(product_id)
+    if product is None:
+        abort(404)
     quantity = int(request.form.get('quantity', 1))
     
     if quantity <= 0:
         flash('Quantity must be positive', 'danger')
-        return redirect(url_for('product', id=product_id))
+        return redirect(url_for('.product', id=product_id))
     
-    if quantity > product.stock:
+    # Add to the quantity already in the cart, if any
+    store = cart_store()
+    cart = store.get(session['user_id'])
+    new_quantity = cart.get(product_id, 0) + quantity
+    if new_quantity > product.stock:
         flash(f'Sorry, only {product.stock} items available in stock', 'danger')
-        return redirect(url_for('product', id=product_id))
-    
-    # Check if product already in cart
-    cart_item = CartItem.query.filter_by(
-        user_id=session['user_id'],
-        product_id=product_id
-    ).first()
-    
-    if cart_item:
-        # Update quantity if already in cart
-        new_quantity = cart_item.quantity + quantity
-        if new_quantity > product.stock:
-            flash(f'Sorry, only {product.stock} items available in stock', 'danger')
-            return redirect(url_for('product', id=product_id))
-        
-        cart_item.quantity = new_quantity
-    else:
-        # Add new item to cart
-        cart_item = CartItem(
-            user_id=session['user_id'],
-            product_id=product_id,
-            quantity=quantity
-        )
-        db.session.add(cart_item)
+        return redirect(url_for('.product', id=product_id))
     
-    db.session.commit()
+    store.set_quantity(session['user_id'], product_id, new_quantity)
+    remember_cart_count(len(cart) + (product_id not in cart))
     flash('Item added to cart successfully!', 'success')
     
     # Redirect based on action
     if 'buy_now' in request.form:
-        return redirect(url_for('checkout'))
-    return redirect(url_for('cart'))
+        return redirect(url_for('.checkout'))
+    return redirect(url_for('.cart'))
 
-@app.route('/cart/update/<int:item_id>', methods=['POST'])
+@bp.route('/cart/update/<int:product_id>', methods=['POST'])
 @login_required
-def update_cart(item_id):
-    cart_item = CartItem.query.get_or_404(item_id)
-    
-    # Ensure user owns this cart item
-    if cart_item.user_id != session['user_id']:
-        abort(403)
+@query_budget(2)
+def update_cart(product_id):
+    store = cart_store()
+    cart = store.get(session['user_id'])
+    if product_id not in cart:
+        abort(404)
     
     quantity = int(request.form.get('quantity', 1))
     
     if quantity <= 0:
         # Remove item if quantity is 0 or negative
-        db.session.delete(cart_item)
+        store.set_quantity(session['user_id'], product_id, 0)
+        remember_cart_count(len(cart) - 1)
         flash('Item removed from cart', 'info')
     else:
         # Update quantity
-        if quantity > cart_item.product.stock:
-            flash(f'Sorry, only {cart_item.product.stock} items available in stock', 'danger')
-            quantity = cart_item.product.stock
+        product = cached_product(product_id)
+        stock = product.stock if product else 0
+        if quantity > stock:
+            flash(f'Sorry, only {stock} items available in stock', 'danger')
+            quantity = stock
         
-        cart_item.quantity = quantity
+        store.set_quantity(session['user_id'], product_id, quantity)
+        remember_cart_count(len(cart) - (quantity == 0))
         flash('Cart updated successfully', 'success')
     
-    db.session.commit()
-    return redirect(url_for('cart'))
+    return redirect(url_for('.cart'))
 
-@app.route('/cart/remove/<int:item_id>')
+@bp.route('/cart/remove/<int:product_id>')
 @login_required
-def remove_from_cart(item_id):
-    cart_item = CartItem.query.get_or_404(item_id)
+@query_budget(1)
+def remove_from_cart(product_id):
+    store = cart_store()
+    cart = store.get(session['user_id'])
+    if product_id not in cart:
+        abort(404)
     
-    # Ensure user owns this cart item
-    if cart_item.user_id != session['user_id']:
-        abort(403)
-    
-    db.session.delete(cart_item)
-    db.session.commit()
+    store.set_quantity(session['user_id'], product_id, 0)
+    remember_cart_count(len(cart) - 1)
     
     flash('Item removed from cart', 'success')
-    return redirect(url_for('cart'))
+    return redirect(url_for('.cart'))
 
-@app.route('/checkout', methods=['GET', 'POST'])
+@bp.route('/checkout', methods=['GET', 'POST'])
 @login_required
+@query_budget(4)
 def checkout():
     cart_items, total = get_cart_items()
     
     if not cart_items:
         flash('Your cart is empty', 'info')
-        return redirect(url_for('cart'))
+        return redirect(url_for('.cart'))
     
     # Get user addresses
     addresses = Address.query.filter_by(user_id=session['user_id']).all()
@@ -270,6 +439,16 @@ def checkout():
     form.address_id.choices = [(a.id, f"{a.address_line1}, {a.city}, {a.state} - {a.pincode}") for a in addresses]
     
     if form.validate_on_submit():
+        # Reserve stock for every line before creating anything
+        shortfalls = reserve_stock(cart_items)
+        if shortfalls:
+            requested = [(item.product_id, item.product.name, item.quantity) for item in shortfalls]
+            db.session.rollback()
+            for product_id, name, quantity in requested:
+                available = db.session.query(Product.stock).filter_by(id=product_id).scalar() or 0
+                flash(f'Only {available} of {name} left in stock (you requested {quantity})', 'danger')
+            return redirect(url_for('.cart'))
+        
         # Create order
         order = Order(
             user_id=session['user_id'],
@@ -290,23 +469,31 @@ def checkout():
                 price=cart_item.product.price
             )
             db.session.add(order_item)
-            
-            # Update product stock
-            product = cart_item.product
-            product.stock -= cart_item.quantity
-            
-            # Remove from cart
-            db.session.delete(cart_item)
         
+        # Empty the cart in the same transaction
+        cart_store().clear(session['user_id'])
+        publish_order_event('order.placed', order,
+                            product_ids=[cart_item.product_id for cart_item in cart_items])
+        order_id = order.id
+        category_ids = [cart_item.product.category_id for cart_item in cart_items]
+        db.session.commit()
+        # The order exists now, so the cart can go from memory too
+        cart_store().forget(session['user_id'])
+        remember_cart_count(0)
+        
+        # Invalidate cached stock levels in a separate short transaction so
+        # checkouts do not queue on the version row while holding stock locks
+        bump_catalog_version()
+        refresh_facets_later(category_ids)
         db.session.commit()
         
         # Redirect to payment page with order ID
-        return redirect(url_for('payment', order_id=order.id))
+        return redirect(url_for('.payment', order_id=order_id))
     
     # If no address exists, redirect to add address page
     if not addresses:
         flash('Please add a delivery address first', 'info')
-        return redirect(url_for('add_address', next=url_for('checkout')))
+        return redirect(url_for('.add_address', next=url_for('.checkout')))
     
     return render_template('checkout.html', 
                           cart_items=cart_items, 
@@ -314,10 +501,11 @@ def checkout():
                           form=form,
                           addresses=addresses)
 
-@app.route('/payment/<int:order_id>')
+@bp.route('/payment/<int:order_id>')
 @login_required
+@query_budget(1)
 def payment(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = eager(Order.query, 'address').filter_by(id=order_id).first_or_404()
     
     # Ensure user owns this order
     if order.user_id != session['user_id']:
@@ -325,7 +513,7 @@ def payment(order_id):
     
     return render_template('payment.html', order=order)
 
-@app.route('/payment/process/<int:order_id>', methods=['POST'])
+@bp.route('/payment/process/<int:order_id>', methods=['POST'])
 @login_required
 def process_payment(order_id):
     order = Order.query.get_or_404(order_id)
@@ -334,6 +522,8 @@ def process_payment(order_id):
     if order.user_id != session['user_id']:
         abort(403)
     
+    old_status = order.status
+    
     # Update order status based on payment method
     if order.payment_method == 'cod':
         order.status = 'Processing'
@@ -343,15 +533,18 @@ def process_payment(order_id):
         order.status = 'Processing'
         msg = 'Payment successful! Your order has been placed.'
     
+    if order.status != old_status:
+        publish_order_event('order.status_changed', order, old_status=old_status)
     db.session.commit()
     flash(msg, 'success')
     
-    return redirect(url_for('order_confirmation', order_id=order.id))
+    return redirect(url_for('.order_confirmation', order_id=order.id))
 
-@app.route('/order/confirmation/<int:order_id>')
+@bp.route('/order/confirmation/<int:order_id>')
 @login_required
+@query_budget(1)
 def order_confirmation(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = eager(Order.query, 'address').filter_by(id=order_id).first_or_404()
     
     # Ensure user owns this order
     if order.user_id != session['user_id']:
@@ -359,40 +552,47 @@ def order_confirmation(order_id):
     
     return render_template('order_confirmation.html', order=order)
 
-@app.route('/orders')
+@bp.route('/orders')
 @login_required
+@replica_reads
 def orders():
-    orders = Order.query.filter_by(user_id=session['user_id']).order_by(Order.created_at.desc()).all()
+    orders = keyset_paginate(Order.query.filter_by(user_id=session['user_id']),
+                             [Order.created_at, Order.id],
+                             cursor=request.args.get('cursor'), per_page=10)
     return render_template('orders.html', orders=orders)
 
-@app.route('/order/<int:order_id>')
+@bp.route('/order/<int:order_id>')
 @login_required
+@query_budget(2)
+@replica_reads
 def order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = eager(Order.query, 'address', 'items.product.category').filter_by(id=order_id).first_or_404()
     
     # Ensure user owns this order
-    if order.user_id != session['user_id'] and not session.get('is_admin', False):
+    if order.user_id != session['user_id'] and not current_principal().is_admin:
         abort(403)
     
+    # Delivered and cancelled orders are final, so the browser may keep them for a while
+    final = order.status in ('Delivered', 'Cancelled')
+    not_modified = conditional(etag_for('order', order.id, order.status, order.updated_at),
+                               last_modified_of(order), max_age=3600 if final else 0)
+    if not_modified:
+        return not_modified
+    
     return render_template('order_detail.html', order=order)
 
-@app.route('/address')
+@bp.route('/address')
 @login_required
 def addresses():
     addresses = Address.query.filter_by(user_id=session['user_id']).all()
     return render_template('addresses.html', addresses=addresses)
 
-@app.route('/address/add', methods=['GET', 'POST'])
+@bp.route('/address/add', methods=['GET', 'POST'])
 @login_required
 def add_address():
     form = AddressForm()
     
     if form.validate_on_submit():
-        # Validate pincode
-        if not is_valid_pincode(form.pincode.data):
-            flash('Invalid PIN code. Please enter a valid Indian PIN code.', 'danger')
-            return render_template('address_form.html', form=form, title='Add New Address')
-        
         # If setting as default, unset any current default
         if form.is_default.data:
             Address.query.filter_by(user_id=session['user_id'], is_default=True).update({'is_default': False})
@@ -422,11 +622,11 @@ def add_address():
         next_page = request.args.get('next')
         if next_page:
             return redirect(next_page)
-        return redirect(url_for('addresses'))
+        return redirect(url_for('.addresses'))
     
     return render_template('address_form.html', form=form, title='Add New Address')
 
-@app.route('/address/edit/<int:address_id>', methods=['GET', 'POST'])
+@bp.route('/address/edit/<int:address_id>', methods=['GET', 'POST'])
 @login_required
 def edit_address(address_id):
     address = Address.query.get_or_404(address_id)
@@ -438,11 +638,6 @@ def edit_address(address_id):
     form = AddressForm(obj=address)
     
     if form.validate_on_submit():
-        # Validate pincode
-        if not is_valid_pincode(form.pincode.data):
-            flash('Invalid PIN code. Please enter a valid Indian PIN code.', 'danger')
-            return render_template('address_form.html', form=form, title='Edit Address')
-        
         # If setting as default, unset any current default
         if form.is_default.data and not address.is_default:
             Address.query.filter_by(user_id=session['user_id'], is_default=True).update({'is_default': False})
@@ -466,11 +661,11 @@ def edit_address(address_id):
             session.pop('default_address', None)
         
         flash('Address updated successfully', 'success')
-        return redirect(url_for('addresses'))
+        return redirect(url_for('.addresses'))
     
     return render_template('address_form.html', form=form, title='Edit Address')
 
-@app.route('/address/delete/<int:address_id>')
+@bp.route('/address/delete/<int:address_id>')
 @login_required
 def delete_address(address_id):
     address = Address.query.get_or_404(address_id)
@@ -482,7 +677,7 @@ def delete_address(address_id):
     # Check if address is used in any orders
     if Order.query.filter_by(address_id=address_id).first():
         flash('Cannot delete this address as it is used in orders', 'danger')
-        return redirect(url_for('addresses'))
+        return redirect(url_for('.addresses'))
     
     # If this was the default address, remove it from session
     if address.is_default and 'default_address' in session:
@@ -492,9 +687,9 @@ def delete_address(address_id):
     db.session.commit()
     
     flash('Address deleted successfully', 'success')
-    return redirect(url_for('addresses'))
+    return redirect(url_for('.addresses'))
 
-@app.route('/pincode/validate', methods=['POST'])
+@bp.route('/pincode/validate', methods=['POST'])
 def validate_pincode():
     pincode = request.form.get('pincode')
     is_valid = is_valid_pincode(pincode)
@@ -504,32 +699,80 @@ def validate_pincode():
         'message': 'Valid PIN code' if is_valid else 'Invalid PIN code'
     })
 
+@bp.route('/pincode/validate/bulk', methods=['POST'])
+def validate_pincodes_bulk():
+    data = request.get_json(silent=True) or {}
+    pincodes = data.get('pincodes')
+    
+    if not isinstance(pincodes, list) or len(pincodes) > 1000:
+        return jsonify({'error': "Expected a JSON body with a 'pincodes' list of at most 1000 items"}), 400
+    
+    return jsonify({'results': validate_pincodes(pincodes)})
+
 # Admin routes
-@app.route('/admin')
+@bp.route('/admin')
 @admin_required
+@query_budget(7)
+@replica_reads
 def admin_dashboard():
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
-    total_users = User.query.filter_by(is_admin=False).count()
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    days = request.args.get('days', 30, type=int)
+    if days not in (7, 30, 90, 365):
+        days = 30
     
-    # Calculate revenue
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
+    # Maintained counts: no scans of the product or user tables
+    total_products = product_count()
+    total_users = customer_count()
+    recent_orders = eager(Order.query, 'user').order_by(Order.created_at.desc()).limit(5).all()
+    
+    # Order counts, revenue and charts come from the rollup tables
+    sales = sales_summary(days)
     
     return render_template('admin/dashboard.html', 
                           total_products=total_products,
-                          total_orders=total_orders,
+                          total_orders=sales['total_orders'],
                           total_users=total_users,
-                          total_revenue=total_revenue,
-                          recent_orders=recent_orders)
+                          total_revenue=sales['total_revenue'],
+                          recent_orders=recent_orders,
+                          sales=sales,
+                          days=days)
 
-@app.route('/admin/products')
+@bp.route('/admin/products')
 @admin_required
+@query_budget(2)
+@replica_reads
 def admin_products():
-    products = Product.query.all()
-    return render_template('admin/products.html', products=products)
+    products = keyset_paginate(eager(Product.query, 'category'), [Product.id],
+                               cursor=request.args.get('cursor'), per_page=20)
+    return render_template('admin/products.html', products=products, import_form=ProductImportForm())
+
+@bp.route('/admin/products/import', methods=['POST'])
+@admin_required
+def admin_import_products():
+    form = ProductImportForm()
+    if not form.validate_on_submit():
+        for error in form.feed.errors:
+            flash(error, 'danger')
+        return redirect(url_for('.admin_products'))
+    
+    # Large feeds would time out the request, so a background job imports it
+    queue_import(form.feed.data)
+    db.session.commit()
+    
+    flash('Import queued: products will be added or updated in the background; '
+          'invalid rows are logged', 'info')
+    return redirect(url_for('.admin_products'))
 
-@app.route('/admin/product/add', methods=['GET', 'POST'])
+@bp.route('/admin/products/export')
+@admin_required
+def admin_export_products():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(export_products(fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=products.{fmt}'})
+
+@bp.route('/admin/product/add', methods=['GET', 'POST'])
 @admin_required
 def admin_add_product():
     form = ProductForm()
@@ -538,6 +781,7 @@ def admin_add_product():
     if form.validate_on_submit():
         product = Product(
             name=form.name.data,
+            sku=form.sku.data or None,
             description=form.description.data,
             price=form.price.data,
             stock=form.stock.data,
@@ -547,22 +791,30 @@ def admin_add_product():
         )
         
         db.session.add(product)
+        db.session.flush()
+        product.sku = product.sku or default_sku(product.id)
+        index_product(product)
+        bump_catalog_version()
+        refresh_facets_later([product.category_id])
         db.session.commit()
         
         flash('Product added successfully', 'success')
-        return redirect(url_for('admin_products'))
+        return redirect(url_for('.admin_products'))
     
     return render_template('admin/product_form.html', form=form, title='Add New Product')
 
-@app.route('/admin/product/edit/<int:product_id>', methods=['GET', 'POST'])
+@bp.route('/admin/product/edit/<int:product_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_edit_product(product_id):
     product = Product.query.get_or_404(product_id)
     form = ProductForm(obj=product)
+    form.product_id = product.id
     form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
     
     if form.validate_on_submit():
+        old_category_id = product.category_id
         product.name = form.name.data
+        product.sku = form.sku.data or default_sku(product.id)
         product.description = form.description.data
         product.price = form.price.data
         product.stock = form.stock.data
@@ -570,14 +822,17 @@ def admin_edit_product(product_id):
         product.category_id = form.category_id.data
         product.featured = form.featured.data
         
+        index_product(product)
+        bump_catalog_version()
+        refresh_facets_later([old_category_id, product.category_id])
         db.session.commit()
         
         flash('Product updated successfully', 'success')
-        return redirect(url_for('admin_products'))
+        return redirect(url_for('.admin_products'))
     
     return render_template('admin/product_form.html', form=form, title='Edit Product')
 
-@app.route('/admin/product/delete/<int:product_id>')
+@bp.route('/admin/product/delete/<int:product_id>')
 @admin_required
 def admin_delete_product(product_id):
     product = Product.query.get_or_404(product_id)
@@ -585,58 +840,87 @@ def admin_delete_product(product_id):
     # Check if product is in any order
     if OrderItem.query.filter_by(product_id=product_id).first():
         flash('Cannot delete this product as it appears in orders', 'danger')
-        return redirect(url_for('admin_products'))
+        return redirect(url_for('.admin_products'))
     
     # Remove from all carts
     CartItem.query.filter_by(product_id=product_id).delete()
     
+    remove_product(product_id)
+    category_id = product.category_id
     db.session.delete(product)
+    bump_catalog_version()
+    refresh_facets_later([category_id])
     db.session.commit()
     
     flash('Product deleted successfully', 'success')
-    return redirect(url_for('admin_products'))
+    return redirect(url_for('.admin_products'))
 
-@app.route('/admin/orders')
+@bp.route('/admin/cache/stats')
 @admin_required
+def admin_cache_stats():
+    return jsonify(catalog=dict(catalog_cache.stats(), version=catalog_version()),
+                   fragments=fragment_cache.stats())
+
+@bp.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/admin/orders')
+@admin_required
+@query_budget(2)
+@replica_reads
 def admin_orders():
     status_filter = request.args.get('status', '')
+    query = eager(Order.query, 'user')
     
     if status_filter:
-        orders = Order.query.filter_by(status=status_filter).order_by(Order.created_at.desc()).all()
-    else:
-        orders = Order.query.order_by(Order.created_at.desc()).all()
+        query = query.filter_by(status=status_filter)
+    
+    orders = keyset_paginate(query, [Order.created_at, Order.id],
+                             cursor=request.args.get('cursor'), per_page=20)
     
     return render_template('admin/orders.html', orders=orders, current_status=status_filter)
 
-@app.route('/admin/order/<int:order_id>')
+@bp.route('/admin/order/<int:order_id>')
 @admin_required
+@query_budget(3)
+@replica_reads
 def admin_order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = eager(Order.query, 'user', 'address', 'items.product.category').filter_by(id=order_id).first_or_404()
     return render_template('admin/order_detail.html', order=order)
 
-@app.route('/admin/order/status/<int:order_id>', methods=['POST'])
+@bp.route('/admin/order/status/<int:order_id>', methods=['POST'])
 @admin_required
 def admin_update_order_status(order_id):
     order = Order.query.get_or_404(order_id)
     status = request.form.get('status')
     
     if status in ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']:
+        old_status = order.status
         order.status = status
+        if status != old_status:
+            publish_order_event('order.status_changed', order, old_status=old_status)
         db.session.commit()
         flash(f'Order status updated to {status}', 'success')
     else:
         flash('Invalid status', 'danger')
     
-    return redirect(url_for('admin_order_detail', order_id=order_id))
+    return redirect(url_for('.admin_order_detail', order_id=order_id))
 
-@app.route('/admin/users')
+@bp.route('/admin/users')
 @admin_required
+@query_budget(3)
+@replica_reads
 def admin_users():
-    users = User.query.filter_by(is_admin=False).all()
-    return render_template('admin/users.html', users=users)
+    users = keyset_paginate(User.query.filter_by(is_admin=False), [User.id],
+                            cursor=request.args.get('cursor'), per_page=20)
+    order_counts = count_by(Order.user_id, [u.id for u in users])
+    return render_template('admin/users.html', users=users, order_counts=order_counts)
 
-@app.route('/admin/user/<int:user_id>')
+@bp.route('/admin/user/<int:user_id>')
 @admin_required
+@replica_reads
 def admin_user_detail(user_id):
     user = User.query.get_or_404(user_id)
     orders = Order.query.filter_by(user_id=user_id).order_by(Order.created_at.desc()).all()
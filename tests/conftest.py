@@ -0,0 +1,64 @@
+import pytest
+
+from app import create_app, db
+from models import Address, User
+from utils.bootstrap import ensure_admin, init_db, seed_catalog
+from utils.logs import shutdown_logging
+
+
+@pytest.fixture
+def app_config():
+    """Extra config for the ``app`` fixture; override it in a test module."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/test.db',
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'JOB_WORKER_THREADS': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'LOG_LEVEL': 'WARNING',
+        **app_config,
+    })
+    with app.app_context():
+        init_db()
+        seed_catalog()
+        ensure_admin('admin@example.com', 'admin123')
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # Before pytest closes the captured output the logging thread writes to
+    shutdown_logging()
+
+
+@pytest.fixture
+def admin(app):
+    client = app.test_client()
+    client.post('/login', data={'email': 'admin@example.com', 'password': 'admin123'})
+    return client
+
+
+@pytest.fixture
+def customer(app):
+    """
+    Returns a function that signs up a customer with a default address and
+    returns (logged-in client, user id, address id).
+    """
+    def sign_up(email='bob@example.com'):
+        client = app.test_client()
+        client.post('/register', data={'name': 'Bob', 'email': email,
+                                       'password': 'secret1', 'confirm_password': 'secret1'})
+        client.post('/login', data={'email': email, 'password': 'secret1'})
+        client.post('/address/add', data={'address_line1': '1 Main St', 'city': 'Delhi', 'state': 'Delhi',
+                                          'pincode': '110001', 'phone': '9999999999', 'is_default': 'y'})
+        with app.app_context():
+            user_id = User.query.filter_by(email=email).one().id
+            address_id = Address.query.filter_by(user_id=user_id).one().id
+        return client, user_id, address_id
+    return sign_up
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from models import CartItem, Order
+from utils import carts
+
+
+@pytest.fixture
+def memory_store(app, monkeypatch):
+    store = carts.WriteBehindCartStore(carts.MemoryCartTable(), app, flush_interval=60)
+    # Flushed by hand below instead of from a background thread
+    monkeypatch.setattr(store, '_start_flusher', lambda: None)
+    monkeypatch.setitem(carts._store, 'value', store)
+    return store
+
+
+def test_failed_checkout_keeps_the_cart(app, memory_store, monkeypatch, customer):
+    client, user_id, address_id = customer()
+    client.post('/cart/add/1', data={'quantity': '2'})
+
+    def fail():
+        raise OperationalError('COMMIT', {}, Exception('database is locked'))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', fail)
+        with pytest.raises(OperationalError):
+            client.post('/checkout', data={'address_id': str(address_id), 'payment_method': 'cod'})
+
+    with app.app_context():
+        assert memory_store.get(user_id) == {1: 2}
+        assert Order.query.filter_by(user_id=user_id).count() == 0
+
+    response = client.post('/checkout', data={'address_id': str(address_id), 'payment_method': 'cod'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert memory_store.get(user_id) == {}
+        assert Order.query.filter_by(user_id=user_id).count() == 1
+        memory_store.flush()
+        assert CartItem.query.filter_by(user_id=user_id).count() == 0
+
+
+@pytest.fixture
+def shared_table():
+    table = carts.MemoryCartTable()
+    carts.CartServer.register('carts', callable=lambda: table)
+    server = carts.CartServer(address=('127.0.0.1', 0), authkey=b'test')
+    server.start()
+    host, port = server.address
+    yield carts.connect_cart_server(f'{host}:{port}', 'test')
+    server.shutdown()
+
+
+@pytest.mark.parametrize('table', ['memory', 'shared'])
+def test_concurrent_adds_keep_every_line(app, monkeypatch, request, table):
+    table = carts.MemoryCartTable() if table == 'memory' else request.getfixturevalue('shared_table')
+    store = carts.WriteBehindCartStore(table, app, flush_interval=60)
+    monkeypatch.setattr(store, '_start_flusher', lambda: None)
+    with app.app_context():
+        store.get(1)
+
+    threads = [threading.Thread(target=store.set_quantity, args=(1, product_id, 1)) for product_id in range(1, 11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.get(1) == {product_id: 1 for product_id in range(1, 11)}
@@ -0,0 +1,56 @@
+import threading
+
+from app import db
+from models import Order, Product
+
+
+def set_stock(app, product_id, stock):
+    with app.app_context():
+        db.session.get(Product, product_id).stock = stock
+        db.session.commit()
+
+
+def stock_and_orders(app, product_id):
+    with app.app_context():
+        return db.session.get(Product, product_id).stock, Order.query.count()
+
+
+def test_concurrent_checkouts_of_the_last_unit_sell_it_once(app, customer):
+    buyers = [customer(f'buyer{n}@example.com') for n in range(5)]
+    set_stock(app, 1, 1)
+    for client, _, _ in buyers:
+        client.post('/cart/add/1', data={'quantity': '1'})
+
+    statuses, go = [], threading.Barrier(len(buyers))
+
+    def check_out(client, address_id):
+        go.wait()
+        response = client.post('/checkout', data={'address_id': str(address_id), 'payment_method': 'cod'})
+        statuses.append(response.headers['Location'])
+
+    threads = [threading.Thread(target=check_out, args=(client, address_id)) for client, _, address_id in buyers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stock_and_orders(app, 1) == (0, 1)
+    assert sorted(location.split('/')[1] for location in statuses) == ['cart'] * 4 + ['payment']
+
+
+def test_a_short_line_rolls_back_the_whole_checkout(app, customer):
+    client, _, address_id = customer()
+    set_stock(app, 1, 5)
+    set_stock(app, 2, 5)
+    client.post('/cart/add/1', data={'quantity': '2'})
+    client.post('/cart/add/2', data={'quantity': '3'})
+    # Someone else bought most of product 2 meanwhile
+    set_stock(app, 2, 1)
+
+    response = client.post('/checkout', data={'address_id': str(address_id), 'payment_method': 'cod'},
+                           follow_redirects=True)
+
+    assert response.request.path == '/cart'
+    assert 'Only 1 of' in response.get_data(as_text=True)
+    assert stock_and_orders(app, 1) == (5, 0)
+    assert stock_and_orders(app, 2)[0] == 1
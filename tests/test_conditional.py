@@ -0,0 +1,41 @@
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+from app import db
+from models import Product
+
+
+def test_matching_etag_gets_304_until_the_catalog_changes(app, admin):
+    client = app.test_client()
+    first = client.get('/product/1')
+    etag = first.headers['ETag']
+
+    assert client.get('/product/1', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        product = db.session.get(Product, 1)
+        form = {'name': product.name, 'description': product.description, 'price': '499',
+                'stock': str(product.stock), 'image_url': product.image_url,
+                'category_id': str(product.category_id)}
+    admin.post('/admin/product/edit/1', data=form)
+
+    response = client.get('/product/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_catalog_pages_ignore_if_modified_since(app, admin):
+    client = app.test_client()
+    url = '/category/1'
+    with app.app_context():
+        product_id = Product.query.filter_by(category_id=1).first().id
+    first = client.get(url)
+    assert 'Last-Modified' not in first.headers
+    assert f'/product/{product_id}"'.encode() in first.data
+    admin.get(f'/admin/product/delete/{product_id}')
+
+    # A date after every row's updated_at, as a client that saw the page could send
+    since = format_datetime(datetime.now(timezone.utc), usegmt=True)
+    response = client.get(url, headers={'If-Modified-Since': since})
+    assert response.status_code == 200
+    assert f'/product/{product_id}"'.encode() not in response.data
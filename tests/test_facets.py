@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from app import db
+from models import Job, Product
+from utils.jobs import drain
+
+
+def run_queued_jobs(app):
+    """Runs every queued job now, including those delayed to batch changes."""
+    with app.app_context():
+        Job.query.filter_by(status='queued').update({'run_at': datetime.utcnow()})
+        db.session.commit()
+    drain(app)
+
+
+def test_edit_then_recount_updates_facet_counts(app, admin):
+    with app.app_context():
+        product = db.session.get(Product, 1)
+        form = {'name': product.name, 'sku': product.sku, 'description': product.description,
+                'price': '499', 'stock': str(product.stock), 'image_url': product.image_url,
+                'category_id': str(product.category_id)}
+        category_id = product.category_id
+
+    # Cache the category page's facets before the edit
+    assert 'Under ₹500 (0)' in admin.get(f'/category/{category_id}').get_data(as_text=True)
+
+    assert admin.post('/admin/product/edit/1', data=form).status_code == 302
+    # Viewed before the recount: the stale counts must not outlive it
+    admin.get(f'/category/{category_id}?price=under-500')
+    run_queued_jobs(app)
+
+    page = admin.get(f'/category/{category_id}?price=under-500').get_data(as_text=True)
+    assert 'Under ₹500 (1)' in page
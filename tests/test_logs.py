@@ -0,0 +1,34 @@
+import logging
+
+import pytest
+
+from utils.logs import access_logger
+
+
+@pytest.fixture
+def app_config():
+    return {'LOG_SLOW_REQUEST_MS': 0}
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_slow_request_is_logged_once_with_its_sql(app):
+    handler = Records()
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        app.test_client().get('/product/1')
+    finally:
+        root.removeHandler(handler)
+
+    slow = [record for record in handler.records if record.levelno == logging.WARNING]
+    assert [record.name for record in slow] == [access_logger.name]
+    assert slow[0].sql_count > 0
+    assert slow[0].slowest_statements
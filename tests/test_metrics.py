@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from utils.metrics import EXITED_SNAPSHOT, metrics
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_snapshot(directory, pid, requests, in_flight, age=0.0):
+    path = os.path.join(directory, f'{pid}.json')
+    with open(path, 'w') as f:
+        json.dump({'pid': pid,
+                   'values': [['http_requests_total', [['endpoint', 'main.index']], requests],
+                              ['http_requests_in_flight', [], in_flight]],
+                   'histograms': []}, f)
+    if age:
+        os.utime(path, (time.time() - age, time.time() - age))
+    return path
+
+
+def test_exited_workers_snapshots_are_folded_and_deleted(app):
+    directory = metrics.directory
+    os.makedirs(directory, exist_ok=True)
+    # An exited worker, and one whose pid was reused by a live process
+    dead = write_snapshot(directory, exited_pid(), requests=3, in_flight=1)
+    stale = write_snapshot(directory, os.getppid(), requests=4, in_flight=1,
+                           age=(metrics.flush_interval * 4))
+
+    key = ('http_requests_total', (('endpoint', 'main.index'),))
+    values, _ = metrics.collect()
+    assert values[key] == 7
+    # Their gauges are dropped
+    assert values.get(('http_requests_in_flight', ()), 0) <= 0
+
+    assert not os.path.exists(dead) and not os.path.exists(stale)
+    assert sorted(os.listdir(directory)) == sorted(['.lock', EXITED_SNAPSHOT, f'{os.getpid()}.json'])
+    # Totals never go backwards once the snapshots are gone
+    assert metrics.collect()[0][key] == 7
+
+
+def test_concurrent_flushes_do_not_collide(app):
+    errors = []
+
+    def flush_many():
+        for _ in range(200):
+            try:
+                metrics.flush(force=True)
+            except OSError as exc:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=flush_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,35 @@
+import re
+from html import unescape
+
+from app import db
+from models import Product
+
+
+def page(client, url):
+    html = client.get(url).get_data(as_text=True)
+    ids = [int(product_id) for product_id in re.findall(r'/admin/product/edit/(\d+)"', html)]
+    links = {rel: unescape(href) for href, rel in
+             re.findall(r'href="(/admin/products\?cursor=[^"]+)">(?:&laquo; )?(Previous|Next)', html)}
+    return ids, links
+
+
+def test_cursor_round_trip(app, admin):
+    with app.app_context():
+        all_ids = [row.id for row in db.session.query(Product.id).order_by(Product.id.desc())]
+
+    first, links = page(admin, '/admin/products')
+    assert first == all_ids[:20]
+    assert set(links) == {'Next'}
+
+    second, links = page(admin, links['Next'])
+    assert second == all_ids[20:40]
+    assert set(links) == ({'Previous', 'Next'} if len(all_ids) > 40 else {'Previous'})
+
+    back, _ = page(admin, links['Previous'])
+    assert back == first
+
+
+def test_malformed_cursor_is_a_bad_request(app, admin):
+    for cursor in ('not-a-cursor', 'eyJkIjoibmV4dCJ9', 'eyJkIjoidXAiLCJrIjpbMV19'):
+        assert admin.get('/admin/products', query_string={'cursor': cursor}).status_code == 400
+    assert app.test_client().get('/category/1', query_string={'paging': 'cursor', 'cursor': '%%%'}).status_code == 400
@@ -0,0 +1,50 @@
+from werkzeug.security import generate_password_hash
+
+from app import db
+from models import User
+from utils import passwords
+
+
+def test_login_rehashes_old_hashes_in_the_hashing_pool(app, monkeypatch):
+    with app.app_context():
+        user = User.query.filter_by(email='admin@example.com').one()
+        user.password = generate_password_hash('admin123', 'pbkdf2:sha256:1000')
+        db.session.commit()
+
+    pooled = []
+    run = passwords._run
+
+    def record(fn, *args):
+        pooled.append(fn.__name__)
+        return run(fn, *args)
+
+    monkeypatch.setattr(passwords, '_run', record)
+    # Learnt again on first use, like a freshly started worker
+    monkeypatch.setitem(passwords._pool, 'target', None)
+    response = app.test_client().post('/login', data={'email': 'admin@example.com', 'password': 'admin123'})
+
+    assert response.status_code == 302
+    # Checking the password, learning the target form and rehashing all go through the pool
+    assert pooled == ['check_password_hash', 'generate_password_hash', 'generate_password_hash']
+    with app.app_context():
+        assert User.query.filter_by(email='admin@example.com').one().password.startswith('scrypt:')
+
+
+def test_login_skips_the_rehash_when_the_pool_is_full(app, monkeypatch):
+    with app.app_context():
+        user = User.query.filter_by(email='admin@example.com').one()
+        user.password = old = generate_password_hash('admin123', 'pbkdf2:sha256:1000')
+        db.session.commit()
+
+    def busy_after_check(fn, *args):
+        if fn.__name__ != 'check_password_hash':
+            raise passwords.PasswordHashingBusy('Password hashing queue is full')
+        return fn(*args)
+
+    monkeypatch.setattr(passwords, '_run', busy_after_check)
+    monkeypatch.setitem(passwords._pool, 'target', None)
+    response = app.test_client().post('/login', data={'email': 'admin@example.com', 'password': 'admin123'})
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert User.query.filter_by(email='admin@example.com').one().password == old
@@ -0,0 +1,31 @@
+import pytest
+
+from utils.pincodes import build_pincode_directory
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    path = str(tmp_path / 'pincodes.bin')
+    build_pincode_directory([('110001', 'new delhi', 'DELHI'), ('560001', 'bangalore', 'KARNATAKA')], path)
+    return {'PINCODE_DIRECTORY': path}
+
+
+def test_bulk_validation_uses_the_configured_directory(app):
+    response = app.test_client().post('/pincode/validate/bulk', json={'pincodes': ['110001', '110002', '12']})
+
+    assert response.get_json()['results'] == [
+        {'pincode': '110001', 'valid': True, 'state': 'Delhi', 'district': 'New Delhi'},
+        # In Delhi's prefix but not listed in the directory
+        {'pincode': '110002', 'valid': False, 'state': None, 'district': None},
+        {'pincode': '12', 'valid': False, 'state': None, 'district': None},
+    ]
+
+
+def test_build_pincodes_command(app, tmp_path):
+    csv_path = tmp_path / 'pincodes.csv'
+    csv_path.write_text('Pincode,District,StateName\n110001,new delhi,DELHI\n110001,other,DELHI\n')
+    output = tmp_path / 'out.bin'
+
+    result = app.test_cli_runner().invoke(args=['build-pincodes', str(csv_path), str(output)])
+
+    assert result.output == f'Wrote 1 PIN codes to {output}\n'
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from app import db
+from models import Address, Order, OrderItem, Product, ProductNeighbour, User
+from utils.recommendations import also_bought, bought_together, rebuild_recommendations
+
+# Orders over products A-D, as product letters. Hand-computed:
+#   orders containing  A: 7   B: 5   C: 4   D: 1
+#   bought together    AB: 4  AC: 3  BC: 2  AD: 1 (below MIN_TOGETHER)
+#   cosine             AB: 4/sqrt(7*5)  AC: 3/sqrt(7*4)  BC: 2/sqrt(5*4)
+ORDERS = ['AB', 'AB', 'AC', 'AC', 'ABC', 'BC', 'AB', 'AD']
+EXPECTED = {
+    'A': [('B', 4 / math.sqrt(35)), ('C', 3 / math.sqrt(28))],
+    'B': [('A', 4 / math.sqrt(35)), ('C', 2 / math.sqrt(20))],
+    'C': [('A', 3 / math.sqrt(28)), ('B', 2 / math.sqrt(20))],
+    'D': [],
+}
+
+
+@pytest.fixture
+def products(app):
+    with app.app_context():
+        user = User(name='Buyer', email='buyer@example.com', password='x')
+        db.session.add(user)
+        db.session.flush()
+        address = Address(user_id=user.id, address_line1='1 Test Street', city='New Delhi', state='Delhi',
+                          pincode='110001', phone='9999999999')
+        db.session.add(address)
+        db.session.flush()
+        ids = dict(zip('ABCD', [row[0] for row in db.session.query(Product.id).order_by(Product.id).limit(4)]))
+        for n, letters in enumerate(ORDERS):
+            order = Order(order_number=f'TEST{n}', total_amount=1, user_id=user.id, address_id=address.id)
+            db.session.add(order)
+            db.session.flush()
+            db.session.add_all([OrderItem(order_id=order.id, product_id=ids[letter], price=1)
+                                for letter in letters])
+        db.session.commit()
+        rebuild_recommendations(log=lambda line: None)
+        yield ids
+
+
+def test_neighbours_match_hand_computed_cosine(app, products):
+    letters = {product_id: letter for letter, product_id in products.items()}
+    with app.app_context():
+        for letter, expected in EXPECTED.items():
+            rows = ProductNeighbour.query.filter_by(product_id=products[letter]) \
+                .order_by(ProductNeighbour.rank).all()
+            assert [letters[row.neighbour_id] for row in rows] == [other for other, _ in expected]
+            assert [row.score for row in rows] == pytest.approx([score for _, score in expected])
+
+
+def test_lookups_rank_by_similarity(app, products):
+    with app.app_context():
+        assert [p.id for p in also_bought(products['B'])] == [products['A'], products['C']]
+        # C: A 0.567 + B 0.447; nothing else is a neighbour of A or B
+        assert [p.id for p in bought_together([products['A'], products['B']])] == [products['C']]
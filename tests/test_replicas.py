@@ -0,0 +1,52 @@
+import pytest
+
+from app import db
+from models import Product
+from utils.cache import bump_catalog_version
+from utils.replicas import PIN_COOKIE, snapshot_sqlite
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    # The catalog version is re-read on every request, so the primary's bump is seen at once
+    return {'DATABASE_REPLICA_URLS': f'sqlite:///{tmp_path}/replica.db', 'READ_YOUR_WRITES_SECONDS': 10,
+            'CATALOG_VERSION_CHECK_INTERVAL': 0}
+
+
+@pytest.fixture
+def primary_only_product(app, tmp_path):
+    """A product added to the primary after the replica was copied from it."""
+    snapshot_sqlite(str(tmp_path / 'test.db'), str(tmp_path / 'replica.db'))
+    with app.app_context():
+        product = Product(name='Only on primary', description='New', price=5, stock=3, category_id=1)
+        db.session.add(product)
+        bump_catalog_version()
+        db.session.commit()
+        return product.id
+
+
+def test_reads_go_to_the_replica_until_the_client_writes(app, customer, primary_only_product):
+    reader = app.test_client()
+    response = reader.get(f'/product/{primary_only_product}')
+    assert response.status_code == 404
+    assert reader.get_cookie(PIN_COOKIE) is None
+
+    client, _, address_id = customer()
+    pin = client.get_cookie(PIN_COOKIE)
+    assert pin is not None
+    assert pin.max_age == 10
+    assert client.get(f'/product/{primary_only_product}').status_code == 200
+
+
+def test_new_order_is_listed_right_after_checkout(app, customer, primary_only_product):
+    client, _, address_id = customer()
+    client.post('/cart/add/1', data={'quantity': '1'})
+    response = client.post('/checkout', data={'address_id': str(address_id), 'payment_method': 'cod'})
+    order_id = response.headers['Location'].rsplit('/', 1)[1]
+
+    assert client.get_cookie(PIN_COOKIE) is not None
+    assert f'/order/{order_id}"' in client.get('/orders').get_data(as_text=True)
+
+    # Without the cookie the order history is read from the replica, which has no orders
+    client.delete_cookie(PIN_COOKIE)
+    assert f'/order/{order_id}"' not in client.get('/orders').get_data(as_text=True)
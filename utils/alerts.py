@@ -0,0 +1,22 @@
+import logging
+
+from flask import current_app
+
+from app import db
+from utils.jobs import job
+
+# Products whose stock ran low after an order, for whoever restocks them
+low_stock_logger = logging.getLogger('low_stock')
+
+
+@job('alerts.low_stock', events=['order.placed'])
+def check_low_stock(product_ids, **event):
+    """Warns about the ordered products that are down to ``LOW_STOCK_THRESHOLD`` or fewer."""
+    from models import Product
+
+    threshold = current_app.config.get('LOW_STOCK_THRESHOLD', 5)
+    rows = db.session.query(Product.id, Product.name, Product.stock) \
+        .filter(Product.id.in_(product_ids), Product.stock <= threshold).all()
+    for product_id, name, stock in rows:
+        low_stock_logger.warning('%s (product %d) is down to %d in stock', name, product_id, stock,
+                                 extra={'product_id': product_id, 'stock': stock})
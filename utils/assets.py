@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+
+import click
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # .br variants are only written when brotli is installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Built assets go here, under the static folder, next to their manifest
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Static files that are fingerprinted by `flask build-assets`
+ASSET_EXTENSIONS = ('.css', '.js', '.svg')
+
+# Fingerprinted URLs never change content, so they may be cached for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Precompressed variants, best first: Content-Encoding and file suffix
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Variants that don't save at least this many bytes are not written
+MIN_SAVING = 256
+
+_manifest = {'assets': {}, 'built': frozenset(), 'fingerprint': ''}
+
+
+def _fingerprinted_name(filename, content):
+    stem, ext = os.path.splitext(filename)
+    return f'{DIST_DIR}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def build_assets(static_folder):
+    """
+    Copies every asset under ``static_folder`` to ``dist/`` with a content
+    hash in its name, writes gzip (and, with brotli installed, brotli)
+    variants next to it and records the names in ``dist/manifest.json``.
+    Files from earlier builds are kept, so pages rendered before a deploy
+    can still load the assets they name.
+
+    Returns:
+        dict: Source file name (e.g. 'css/custom.css') to built name
+    """
+    assets = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != os.path.join(static_folder, DIST_DIR))
+        for name in sorted(files):
+            if not name.endswith(ASSET_EXTENSIONS):
+                continue
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            built = _fingerprinted_name(filename, content)
+            target = os.path.join(static_folder, built)
+            _write(target, content)
+            variants = {'.gz': gzip.compress(content, 9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(content, quality=11)
+            for suffix, compressed in variants.items():
+                if len(content) - len(compressed) >= MIN_SAVING:
+                    _write(target + suffix, compressed)
+            assets[filename] = built
+            logger.info('Built %s as %s (%s)', filename, built,
+                        ', '.join(f'{suffix[1:]} {len(compressed)}B' for suffix, compressed in variants.items()))
+    _write(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME),
+           json.dumps(assets, indent=2, sort_keys=True).encode() + b'\n')
+    return assets
+
+
+def load_manifest(static_folder):
+    """Reads ``dist/manifest.json``; without one, assets are served unfingerprinted."""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as f:
+            assets = json.load(f)
+    except FileNotFoundError:
+        assets = {}
+    _manifest['assets'] = assets
+    _manifest['built'] = frozenset(assets.values())
+    _manifest['fingerprint'] = hashlib.sha1(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:12]
+    return assets
+
+
+def manifest_fingerprint():
+    """Hashes the loaded manifest, so pages that link the assets change when they are rebuilt."""
+    return _manifest['fingerprint']
+
+
+def asset_url(filename, **values):
+    """
+    Like ``url_for('static', filename=...)``, but returns the fingerprinted
+    URL when the asset has been built, so browsers can cache it for good.
+    """
+    return url_for('static', filename=_manifest['assets'].get(filename, filename), **values)
+
+
+def init_assets(app):
+    """
+    Loads the asset manifest, adds the ``asset_url()`` template global, serves
+    fingerprinted files precompressed with immutable cache headers, and
+    registers ``flask build-assets``.
+    """
+    load_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = asset_url
+    send_static_file = app.view_functions['static']
+
+    def static(filename):
+        if filename not in _manifest['built']:
+            return send_static_file(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0]
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if accepted[encoding] > 0 and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix, max_age=IMMUTABLE_MAX_AGE)
+                response.mimetype = mimetype
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint and precompress the static CSS and JS for production."""
+        if brotli is None:
+            click.echo('brotli is not installed; writing gzip variants only', err=True)
+        for filename, built in build_assets(app.static_folder).items():
+            click.echo(f'{filename} -> {built}')
@@ -0,0 +1,248 @@
+import logging
+
+import click
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def init_db():
+    """
+    Brings the database schema up to date: creates missing tables, adds
+    columns and indexes introduced since the tables were created, gives SKUs
+    to products without one, creates the search index and backfills the sales
+    rollups, category facet counts and product recommendations. Safe to run
+    repeatedly.
+    """
+    import models  # noqa: F401  (registers every table on db.metadata)
+    from utils.catalog_io import backfill_skus
+    from utils.indexes import add_missing_columns, create_missing_indexes
+    from utils.search import ensure_search_index
+    from utils.rollups import backfill_rollups
+    from utils.facets import backfill_facets
+    from utils.recommendations import backfill_recommendations
+
+    db.create_all()
+    for name in add_missing_columns():
+        logger.info('Added column %s', name)
+    for name in create_missing_indexes():
+        logger.info('Created index %s', name)
+    if backfill_skus():
+        db.session.commit()
+    ensure_search_index()
+    backfill_rollups()
+    backfill_facets()
+    backfill_recommendations()
+
+
+def seed_catalog():
+    """
+    Adds the demo categories and products to an empty catalog.
+
+    Returns:
+        int: Number of products added, 0 if the catalog already has categories
+    """
+    from models import Category, Product
+    from utils.cache import bump_catalog_version
+    from utils.catalog_io import backfill_skus
+    from utils.facets import refresh_facets
+    from utils.search import rebuild_search_index
+
+    if Category.query.first():
+        return 0
+
+    categories = [
+        Category(name="Electronics", description="Electronic devices and gadgets"),
+        Category(name="Clothing", description="Fashion clothing for men and women"),
+        Category(name="Books", description="Books of various genres"),
+        Category(name="Home & Kitchen", description="Home and kitchen appliances"),
+        Category(name="Sports", description="Sports equipment and accessories"),
+        Category(name="Beauty", description="Beauty and personal care products")
+    ]
+    db.session.add_all(categories)
+    db.session.commit()
+    
+    # Add some products to each category
+    electronics = [
+        Product(name="Smartphone", description="Latest smartphone with advanced features", 
+               price=12999.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/mobile-alt.svg", 
+               category_id=1, featured=True),
+        Product(name="Laptop", description="High-performance laptop for professional use", 
+               price=49999.00, stock=30, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/laptop.svg", 
+               category_id=1, featured=True),
+        Product(name="Smartwatch", description="Fitness tracking smartwatch", 
+               price=2999.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/clock.svg", 
+               category_id=1),
+        Product(name="Headphones", description="Noise cancelling wireless headphones", 
+               price=1999.00, stock=75, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/headphones.svg", 
+               category_id=1),
+        Product(name="Bluetooth Speaker", description="Portable bluetooth speaker with great sound", 
+               price=1499.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/volume-up.svg", 
+               category_id=1),
+        Product(name="Power Bank", description="10000mAh fast charging power bank", 
+               price=999.00, stock=120, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/battery-full.svg", 
+               category_id=1)
+    ]
+    
+    clothing = [
+        Product(name="Men's T-Shirt", description="Cotton t-shirt for men", 
+               price=499.00, stock=200, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/tshirt.svg", 
+               category_id=2, featured=True),
+        Product(name="Women's Dress", description="Elegant dress for women", 
+               price=1299.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/female.svg", 
+               category_id=2),
+        Product(name="Jeans", description="Comfortable denim jeans", 
+               price=999.00, stock=150, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user.svg", 
+               category_id=2),
+        Product(name="Jacket", description="Winter jacket for cold weather", 
+               price=1999.00, stock=70, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user-tie.svg", 
+               category_id=2),
+        Product(name="Formal Shirt", description="Formal shirt for office wear", 
+               price=799.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user-tie.svg", 
+               category_id=2),
+        Product(name="Sports Shoes", description="Comfortable sports shoes for running", 
+               price=1499.00, stock=90, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/shoe-prints.svg", 
+               category_id=2, featured=True)
+    ]
+    
+    books = [
+        Product(name="Fiction Novel", description="Bestselling fiction novel", 
+               price=299.00, stock=200, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/book.svg", 
+               category_id=3),
+        Product(name="Self-Help Book", description="Book for personal development", 
+               price=399.00, stock=150, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/book-reader.svg", 
+               category_id=3, featured=True),
+        Product(name="Cookbook", description="Collection of delicious recipes", 
+               price=499.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/utensils.svg", 
+               category_id=3),
+        Product(name="Biography", description="Biography of a famous personality", 
+               price=349.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/user.svg", 
+               category_id=3),
+        Product(name="Academic Textbook", description="College textbook for students", 
+               price=899.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/graduation-cap.svg", 
+               category_id=3),
+        Product(name="Children's Book", description="Illustrated book for children", 
+               price=199.00, stock=120, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/child.svg", 
+               category_id=3)
+    ]
+    
+    home_kitchen = [
+        Product(name="Blender", description="Multi-purpose kitchen blender", 
+               price=1999.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/blender.svg", 
+               category_id=4, featured=True),
+        Product(name="Coffee Maker", description="Automatic coffee maker for home", 
+               price=2499.00, stock=40, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/coffee.svg", 
+               category_id=4),
+        Product(name="Bedsheet Set", description="Cotton bedsheet set with pillowcases", 
+               price=899.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/bed.svg", 
+               category_id=4),
+        Product(name="Dining Table", description="Wooden dining table for 6 people", 
+               price=12999.00, stock=20, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/chair.svg", 
+               category_id=4),
+        Product(name="Microwave Oven", description="Digital microwave oven for kitchen", 
+               price=6999.00, stock=30, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/temperature-high.svg", 
+               category_id=4),
+        Product(name="Water Purifier", description="RO water purifier for home", 
+               price=8999.00, stock=25, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/tint.svg", 
+               category_id=4)
+    ]
+    
+    sports = [
+        Product(name="Cricket Bat", description="Professional cricket bat", 
+               price=1499.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/table-tennis.svg", 
+               category_id=5),
+        Product(name="Football", description="Standard size football", 
+               price=799.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/futbol.svg", 
+               category_id=5, featured=True),
+        Product(name="Yoga Mat", description="Anti-slip yoga mat for fitness", 
+               price=499.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/spa.svg", 
+               category_id=5),
+        Product(name="Dumbbells", description="Set of 5kg dumbbells", 
+               price=999.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/dumbbell.svg", 
+               category_id=5),
+        Product(name="Badminton Racket", description="Professional badminton racket", 
+               price=899.00, stock=70, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/table-tennis.svg", 
+               category_id=5),
+        Product(name="Treadmill", description="Motorized treadmill for home gym", 
+               price=24999.00, stock=15, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/running.svg", 
+               category_id=5)
+    ]
+    
+    beauty = [
+        Product(name="Face Cream", description="Moisturizing face cream", 
+               price=499.00, stock=120, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/magic.svg", 
+               category_id=6, featured=True),
+        Product(name="Perfume", description="Luxury perfume for men and women", 
+               price=1999.00, stock=80, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/spray-can.svg", 
+               category_id=6),
+        Product(name="Hair Dryer", description="Professional hair dryer with styling tools", 
+               price=1499.00, stock=50, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/wind.svg", 
+               category_id=6),
+        Product(name="Makeup Kit", description="Complete makeup kit with brushes", 
+               price=2499.00, stock=40, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/palette.svg", 
+               category_id=6),
+        Product(name="Hair Serum", description="Anti-frizz hair serum for smooth hair", 
+               price=399.00, stock=100, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/tint.svg", 
+               category_id=6),
+        Product(name="Beard Grooming Kit", description="Complete beard grooming kit for men", 
+               price=899.00, stock=60, image_url="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0-beta3/svgs/solid/cut.svg", 
+               category_id=6)
+    ]
+    
+    all_products = electronics + clothing + books + home_kitchen + sports + beauty
+    db.session.add_all(all_products)
+    db.session.flush()
+    backfill_skus()
+    bump_catalog_version()
+    db.session.commit()
+    rebuild_search_index()
+    refresh_facets()
+    return len(all_products)
+
+
+def ensure_admin(email, password, name='Admin'):
+    """
+    Creates an admin account, or grants admin access to an existing account.
+    The password is only hashed when a new account is created.
+
+    Returns:
+        str: 'created', 'promoted' or 'exists'
+    """
+    from models import User
+    from utils.passwords import hash_password
+    from utils.rollups import count_customers
+    from utils.principal import bump_auth_version
+
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        db.session.add(User(name=name, email=email, password=hash_password(password), is_admin=True))
+        db.session.commit()
+        return 'created'
+    if not user.is_admin:
+        count_customers(-1)
+        user.is_admin = True
+        bump_auth_version(user.id)
+        db.session.commit()
+        return 'promoted'
+    return 'exists'
+
+
+def init_setup_commands(app):
+    """Registers the ``flask init-db`` and ``flask seed`` commands."""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create or upgrade the database schema."""
+        init_db()
+        click.echo('Database is up to date')
+
+    @app.cli.command('seed')
+    @click.option('--admin-email', default='admin@example.com', show_default=True)
+    @click.option('--admin-password', envvar='ADMIN_PASSWORD', default='admin123',
+                  help='Used only when the admin account is created (env: ADMIN_PASSWORD).')
+    def seed_command(admin_email, admin_password):
+        """Add the demo catalog and the admin account if they are missing."""
+        click.echo(f'Added {seed_catalog()} products')
+        status = ensure_admin(admin_email, admin_password)
+        click.echo(f'Admin user {admin_email}: {status}')
@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import inspect
+
+from utils.queries import unbudgeted
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded cache whose entries also expire after ``ttl`` seconds.
+
+    The least recently used entry is evicted once ``maxsize`` entries are stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, loader):
+        """
+        Returns the cached value for ``key``, calling ``loader()`` to fill it on a miss.
+
+        Concurrent misses for the same key may both call the loader; the last
+        one to finish wins, which is harmless for read-only catalog data.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class CachedPagination(Pagination):
+    """A ``Pagination`` built from already loaded items, safe to keep across requests."""
+
+    def _query_items(self):
+        return self._query_args['items']
+
+    def _query_count(self):
+        return self._query_args['total']
+
+
+def freeze_pagination(pagination):
+    """
+    Copies a query pagination into a ``CachedPagination`` that no longer
+    references the query or its session.
+    """
+    return CachedPagination(page=pagination.page, per_page=pagination.per_page,
+                            error_out=False, items=detach(pagination.items),
+                            total=pagination.total)
+
+
+def detach(value):
+    """
+    Removes loaded model instances (and the many-to-one objects already loaded
+    on them) from their session, so a later commit cannot expire the copies
+    kept in the cache.
+
+    Args:
+        value: A model instance, a list of instances, or None
+
+    Returns:
+        The same value, for chaining
+    """
+    seen = set()
+
+    def _detach(obj):
+        if obj is None or id(obj) in seen:
+            return
+        seen.add(id(obj))
+        state = inspect(obj)
+        for rel in state.mapper.relationships:
+            if not rel.uselist and rel.key in state.dict:
+                _detach(state.dict[rel.key])
+        if state.session is not None:
+            state.session.expunge(obj)
+
+    for obj in (value if isinstance(value, (list, tuple)) else [value]):
+        _detach(obj)
+    return value
+
+
+catalog_cache = LRUCache()
+
+_version_lock = threading.Lock()
+_versions = {}
+
+
+def shared_version(name):
+    """
+    Returns the current value of a named version counter, re-reading it from
+    the database at most once per ``CATALOG_VERSION_CHECK_INTERVAL`` seconds so
+    that bumps made by other workers are picked up.
+
+    Args:
+        name (str): The counter, e.g. 'catalog'
+    """
+    from app import db
+    from models import CacheVersion
+
+    interval = current_app.config.get('CATALOG_VERSION_CHECK_INTERVAL', 1.0)
+    now = time.monotonic()
+    with _version_lock:
+        cached = _versions.get(name)
+        if cached is not None and now - cached[1] < interval:
+            return cached[0]
+
+    with unbudgeted():
+        value = db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+    with _version_lock:
+        _versions[name] = (value, now)
+    return value
+
+
+def bump_shared_version(name):
+    """
+    Increments a named version counter. Call it inside the transaction that
+    makes the change so the bump commits together with it.
+    """
+    from app import db
+    from models import CacheVersion
+
+    updated = CacheVersion.query.filter_by(name=name).update(
+        {'version': CacheVersion.version + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+    with _version_lock:
+        _versions.pop(name, None)
+
+
+def catalog_version():
+    """Returns the current catalog version (see ``shared_version``)."""
+    return shared_version('catalog')
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached catalog entry. Call it inside the transaction that
+    changes products or stock so the bump commits together with the change.
+    """
+    bump_shared_version('catalog')
+    catalog_cache.clear()
+
+
+def catalog_cached(name, loader, *params):
+    """
+    Read-through lookup in the catalog cache.
+
+    Args:
+        name (str): Which query is cached, e.g. 'featured'
+        loader (callable): Loads the value on a miss
+        *params: Filter, sort and page arguments that select the value
+
+    Returns:
+        The cached or freshly loaded value
+    """
+    key = (name, catalog_version()) + params
+    return catalog_cache.get_or_set(key, loader)
+
+
+def init_catalog_cache(app):
+    """Sizes the catalog cache from ``CATALOG_CACHE_SIZE`` and ``CATALOG_CACHE_TTL``."""
+    catalog_cache.maxsize = app.config.get('CATALOG_CACHE_SIZE', 1024)
+    catalog_cache.ttl = app.config.get('CATALOG_CACHE_TTL', 300)
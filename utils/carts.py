@@ -0,0 +1,341 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from multiprocessing.managers import BaseManager
+
+import click
+from flask import session
+from sqlalchemy import delete, insert
+
+from app import db
+from utils.queries import eager, unbudgeted
+
+logger = logging.getLogger(__name__)
+
+# One line of a cart as the cart and checkout pages use it
+CartLine = namedtuple('CartLine', ['product_id', 'product', 'quantity'])
+
+# Users whose carts are written per flush transaction
+FLUSH_BATCH = 500
+
+
+class DatabaseCartStore:
+    """
+    Keeps carts in the ``CartItem`` table, one row per cart line. Every change
+    is a write transaction, but carts are shared by all workers and hosts.
+
+    A cart is a dict of product id to quantity.
+    """
+
+    def get(self, user_id):
+        from models import CartItem
+
+        rows = db.session.query(CartItem.product_id, db.func.sum(CartItem.quantity)) \
+            .filter_by(user_id=user_id).group_by(CartItem.product_id)
+        return dict(rows)
+
+    def set_quantity(self, user_id, product_id, quantity):
+        """Sets one line's quantity and commits; 0 removes the line."""
+        from models import CartItem
+
+        CartItem.query.filter_by(user_id=user_id, product_id=product_id).delete()
+        if quantity > 0:
+            db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+        db.session.commit()
+
+    def clear(self, user_id):
+        """Empties a cart inside the caller's transaction (checkout commits it)."""
+        from models import CartItem
+
+        CartItem.query.filter_by(user_id=user_id).delete()
+
+    def forget(self, user_id):
+        """Called once the transaction that cleared a cart commits; nothing is kept elsewhere."""
+
+    def flush(self):
+        return 0
+
+
+class MemoryCartTable:
+    """
+    Carts and the set of carts changed since the last flush, in a dict.
+
+    Used directly for the 'memory' store, and served to every worker by
+    ``flask cart-server`` for the 'shared' store.
+    """
+
+    def __init__(self):
+        self._carts = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            return dict(cart) if cart is not None else None
+
+    def load(self, user_id, cart):
+        """Stores a cart read from the database, unless a newer one got there first."""
+        with self._lock:
+            self._carts.setdefault(user_id, dict(cart))
+
+    def put(self, user_id, cart):
+        with self._lock:
+            self._carts[user_id] = dict(cart)
+            self._dirty.add(user_id)
+
+    def set_line(self, user_id, product_id, quantity):
+        """Sets one line of a cart in one step, so concurrent changes to other lines are kept; 0 removes it."""
+        with self._lock:
+            cart = self._carts.setdefault(user_id, {})
+            if quantity > 0:
+                cart[product_id] = quantity
+            else:
+                cart.pop(product_id, None)
+            self._dirty.add(user_id)
+
+    def take_dirty(self, limit):
+        """Removes and returns up to ``limit`` changed carts as (user id, cart) pairs."""
+        with self._lock:
+            users = [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+            return [(user_id, dict(self._carts.get(user_id, {}))) for user_id in users]
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_ids)
+
+
+class CartServer(BaseManager):
+    """Serves one ``MemoryCartTable`` to every worker over a local socket."""
+
+
+class WriteBehindCartStore:
+    """
+    Keeps carts in a ``MemoryCartTable`` and copies changed carts to the
+    ``CartItem`` table from a background thread every ``flush_interval``
+    seconds, so adding to or changing a cart never waits on the database.
+    A cart missing from the table is read from ``CartItem`` once.
+
+    Carts changed in the last ``flush_interval`` seconds are lost if the
+    table's process dies. Emptying a cart at checkout deletes its rows in
+    the checkout transaction, so a bought cart is never restored; the table
+    keeps the cart until ``forget`` is called after that transaction
+    commits, so a failed checkout leaves it intact.
+
+    Args:
+        table: A ``MemoryCartTable`` or a proxy to one
+        app: The app whose database carts are flushed to
+        flush_interval (float): Seconds between flushes
+    """
+
+    def __init__(self, table, app, flush_interval=2.0):
+        self.table = table
+        self.app = app
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    def get(self, user_id):
+        cart = self.table.get(user_id)
+        if cart is None:
+            self.table.load(user_id, DatabaseCartStore().get(user_id))
+            cart = self.table.get(user_id)
+        return cart
+
+    def set_quantity(self, user_id, product_id, quantity):
+        # Loads the cart from CartItem first if the table does not have it yet
+        self.get(user_id)
+        self.table.set_line(user_id, product_id, quantity)
+        self._start_flusher()
+
+    def clear(self, user_id):
+        """Deletes a cart's rows inside the caller's transaction."""
+        DatabaseCartStore().clear(user_id)
+
+    def forget(self, user_id):
+        """Empties a cart in the table; call it after the transaction that cleared it commits."""
+        self.table.put(user_id, {})
+        self._start_flusher()
+
+    def flush(self):
+        """
+        Writes every changed cart to ``CartItem``. Carts whose write fails are
+        marked changed again and retried on the next flush.
+
+        Returns:
+            int: Number of carts written
+        """
+        from models import CartItem
+
+        written = 0
+        while True:
+            carts = self.table.take_dirty(FLUSH_BATCH)
+            if not carts:
+                return written
+            try:
+                db.session.execute(delete(CartItem).where(CartItem.user_id.in_([user_id for user_id, _ in carts])))
+                rows = [{'user_id': user_id, 'product_id': product_id, 'quantity': quantity}
+                        for user_id, cart in carts for product_id, quantity in cart.items()]
+                if rows:
+                    db.session.execute(insert(CartItem), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.table.mark_dirty([user_id for user_id, _ in carts])
+                raise
+            written += len(carts)
+
+    def _start_flusher(self):
+        # Started on first use rather than at import so it runs in each
+        # gunicorn worker, not in the master process that forks them
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_forever, name='cart-flusher', daemon=True)
+                self._flusher.start()
+                atexit.register(self._flush_in_app)
+
+    def _flush_in_app(self):
+        with self.app.app_context():
+            return self.flush()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self._flush_in_app()
+            except Exception:
+                logger.exception('Cart flush failed, retrying in %.1fs', self.flush_interval)
+
+
+_store = {'value': DatabaseCartStore()}
+
+
+def cart_store():
+    """Returns the cart store chosen by ``CART_STORE``."""
+    return _store['value']
+
+
+def connect_cart_server(address, authkey):
+    """
+    Returns a proxy to the ``MemoryCartTable`` served by ``flask cart-server``.
+    """
+    host, _, port = address.rpartition(':')
+    CartServer.register('carts')
+    manager = CartServer(address=(host, int(port)), authkey=authkey.encode())
+    manager.connect()
+    return manager.carts()
+
+
+def cart_lines(user_id):
+    """
+    Loads a user's cart with its products (and their categories) in one query.
+    Lines whose product has been deleted are dropped from the cart.
+
+    Returns:
+        tuple: (list of ``CartLine``, total price)
+    """
+    from models import Product
+
+    store = cart_store()
+    cart = store.get(user_id)
+    products = {}
+    if cart:
+        products = {product.id: product for product in
+                    eager(Product.query, 'category').filter(Product.id.in_(list(cart))).all()}
+    lines = []
+    for product_id, quantity in sorted(cart.items()):
+        if product_id in products:
+            lines.append(CartLine(product_id, products[product_id], quantity))
+        else:
+            store.set_quantity(user_id, product_id, 0)
+    remember_cart_count(len(lines))
+    return lines, sum(line.product.price * line.quantity for line in lines)
+
+
+def remember_cart_count(count):
+    """Caches the number of lines in the cart in the session, for the navbar badge."""
+    session['cart_count'] = count
+
+
+def cart_count():
+    """
+    Returns the number of lines in the logged-in user's cart, reading the cart
+    only when the session has no cached count.
+    """
+    from utils.principal import current_principal
+
+    principal = current_principal()
+    if principal is None:
+        return 0
+    if 'cart_count' not in session:
+        with unbudgeted():
+            remember_cart_count(len(cart_store().get(principal.id)))
+    return session['cart_count']
+
+
+class _LazyServerTable:
+    """Connects to ``flask cart-server`` on first use in each process."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._table = None
+        self._pid = None
+
+    def __getattr__(self, name):
+        if self._pid != os.getpid():
+            self._table = connect_cart_server(self.address, self.authkey)
+            self._pid = os.getpid()
+        return getattr(self._table, name)
+
+
+def init_carts(app):
+    """
+    Picks the cart store from ``CART_STORE``, supplies ``cart_count`` to every
+    template and registers the ``flask cart-server`` and ``flask flush-carts``
+    commands.
+
+    - 'database' (default): the ``CartItem`` table. Right for any number of
+      workers and hosts.
+    - 'memory': a table in each worker process, flushed write-behind. Only
+      correct with a single worker process per deployment.
+    - 'shared': a table served to all workers on a host by
+      ``flask cart-server`` at ``CART_SERVER_ADDRESS``, flushed write-behind.
+      Stands in for a Redis-like service; correct for one host.
+    """
+    kind = app.config.get('CART_STORE', 'database')
+    interval = app.config.get('CART_FLUSH_INTERVAL', 2.0)
+    address = app.config.get('CART_SERVER_ADDRESS', '127.0.0.1:5055')
+    if kind == 'database':
+        _store['value'] = DatabaseCartStore()
+    elif kind == 'memory':
+        _store['value'] = WriteBehindCartStore(MemoryCartTable(), app, interval)
+    elif kind == 'shared':
+        # Connected lazily so each forked worker opens its own socket
+        _store['value'] = WriteBehindCartStore(_LazyServerTable(address, app.secret_key), app, interval)
+    else:
+        raise ValueError(f'Unknown CART_STORE {kind!r}')
+
+    @app.context_processor
+    def inject_cart_count():
+        return {'cart_count': cart_count}
+
+    @app.cli.command('cart-server')
+    def cart_server_command():
+        """Serve the shared cart table for CART_STORE=shared."""
+        table = MemoryCartTable()
+        CartServer.register('carts', callable=lambda: table)
+        host, _, port = address.rpartition(':')
+        server = CartServer(address=(host, int(port)), authkey=app.secret_key.encode()).get_server()
+        click.echo(f'Serving carts on {address}')
+        server.serve_forever()
+
+    @app.cli.command('flush-carts')
+    def flush_carts_command():
+        """Write carts changed in the shared cart table to the database now."""
+        click.echo(f'Flushed {cart_store().flush()} carts')
@@ -0,0 +1,335 @@
+import csv
+import io
+import json
+import logging
+import math
+import os
+import uuid
+from collections import namedtuple
+
+import click
+from sqlalchemy import String, bindparam, cast, exists, insert, or_, select, update
+from sqlalchemy.orm import aliased
+
+from app import db
+from utils.jobs import enqueue, job
+from utils.search import index_products
+
+logger = logging.getLogger(__name__)
+
+# Columns of a product feed, in export order. Products are matched on 'sku'
+# and categories are given by name.
+FEED_FIELDS = ['sku', 'name', 'description', 'price', 'stock', 'image_url', 'category', 'featured']
+
+FORMATS = ('csv', 'jsonl')
+
+# Only the first errors are kept for reporting; the rest are just counted
+MAX_REPORTED_ERRORS = 100
+
+_TRUE = {'1', 'true', 'yes', 'y'}
+_FALSE = {'', '0', 'false', 'no', 'n'}
+
+_settings = {'import_dir': None}
+
+ImportResult = namedtuple('ImportResult', ['inserted', 'updated', 'failed', 'errors'])
+
+
+def feed_format(filename, default='csv'):
+    """Picks the feed format from a file name: 'jsonl' for .jsonl/.ndjson, else ``default``."""
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return default
+
+
+def read_feed(stream, fmt):
+    """
+    Yields one dict per product in a text stream, without reading it all in.
+
+    Args:
+        stream: A text file object
+        fmt (str): 'csv' (with a header row) or 'jsonl'
+
+    Yields:
+        tuple: (line number, row dict); the dict is None for lines that are not valid JSON
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def _text(row, field, max_length=None, required=True):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{field} is required')
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+def _number(row, field, kind):
+    try:
+        value = kind(str(row.get(field)).strip())
+    except ValueError:
+        raise ValueError(f'{field} must be {"a whole number" if kind is int else "a number"}') from None
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f'{field} cannot be negative or infinite')
+    return value
+
+
+def validate_row(row, category_ids):
+    """
+    Checks one feed row against the same rules as ``ProductForm``.
+
+    Args:
+        row (dict): A row from ``read_feed``
+        category_ids (dict): Category name to id, from ``category_id_map``
+
+    Returns:
+        dict: Product column values ready to write
+
+    Raises:
+        ValueError: Describing the first problem found
+    """
+    if row is None:
+        raise ValueError('not a JSON object')
+
+    category = _text(row, 'category')
+    if category not in category_ids:
+        raise ValueError(f'unknown category {category!r}')
+
+    featured = row.get('featured')
+    if not isinstance(featured, bool):
+        featured = '' if featured is None else str(featured).strip().lower()
+        if featured not in _TRUE | _FALSE:
+            raise ValueError('featured must be true or false')
+        featured = featured in _TRUE
+
+    return {
+        'sku': _text(row, 'sku', 64),
+        'name': _text(row, 'name', 100),
+        'description': _text(row, 'description'),
+        'price': _number(row, 'price', float),
+        'stock': _number(row, 'stock', int),
+        'image_url': _text(row, 'image_url', 200),
+        'category_id': category_ids[category],
+        'featured': featured,
+    }
+
+
+def default_sku(product_id):
+    """The SKU given to a product that has none, so every product can be exported and re-imported."""
+    return f'P{product_id}'
+
+
+def backfill_skus():
+    """
+    Gives ``default_sku`` to products without a SKU (created before SKUs
+    existed, or left blank in the admin form), unless another product already
+    uses it.
+
+    Returns:
+        int: Number of products given a SKU
+    """
+    from models import Product
+
+    other = aliased(Product)
+    sku = 'P' + cast(Product.id, String)
+    return db.session.execute(update(Product).where(
+        or_(Product.sku.is_(None), Product.sku == ''),
+        ~exists().where(other.sku == sku),
+    ).values(sku=sku).execution_options(synchronize_session=False)).rowcount
+
+
+def category_id_map():
+    """Returns a dict of category name to id."""
+    from models import Category
+    return dict(db.session.query(Category.name, Category.id))
+
+
+def _write_batch(batch):
+    """
+    Upserts one batch by SKU: one SELECT finds the existing SKUs, then one
+    executemany INSERT and one executemany UPDATE write the rows. The batch's
+    products are reindexed for search in the same transaction.
+
+    Returns:
+        tuple: (inserted, updated)
+    """
+    from models import Product
+
+    table = Product.__table__
+    existing = set(db.session.scalars(select(table.c.sku).where(table.c.sku.in_(list(batch)))))
+    inserts = [values for sku, values in batch.items() if sku not in existing]
+    updates = [{f'new_{name}': value for name, value in values.items()}
+               for sku, values in batch.items() if sku in existing]
+
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    if updates:
+        # Bind names must differ from the column names they set
+        db.session.execute(
+            update(table).where(table.c.sku == bindparam('new_sku'))
+            .values({name[4:]: bindparam(name) for name in updates[0] if name != 'new_sku'}),
+            updates,
+        )
+    index_products(db.session.scalars(select(table.c.id).where(table.c.sku.in_(list(batch)))))
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def import_products(rows, batch_size=1000):
+    """
+    Inserts or updates products from a feed, committing every ``batch_size``
+    rows. Invalid rows are skipped and reported rather than aborting the import.
+    Within a batch, a later row for the same SKU replaces an earlier one.
+
+    Args:
+        rows (iterable): (line number, row dict) pairs, e.g. from ``read_feed``
+        batch_size (int): Rows written per transaction
+
+    Returns:
+        ImportResult: Counts, and up to ``MAX_REPORTED_ERRORS`` (line, message) pairs
+    """
+    from utils.cache import bump_catalog_version
+    from utils.facets import refresh_facets_later
+
+    category_ids = category_id_map()
+    inserted = updated = failed = 0
+    errors = []
+    batch = {}
+
+    for line_number, row in rows:
+        try:
+            values = validate_row(row, category_ids)
+        except ValueError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append((line_number, str(e)))
+            continue
+        batch[values['sku']] = values
+        if len(batch) >= batch_size:
+            counts = _write_batch(batch)
+            inserted, updated = inserted + counts[0], updated + counts[1]
+            batch = {}
+
+    if batch:
+        counts = _write_batch(batch)
+        inserted, updated = inserted + counts[0], updated + counts[1]
+
+    if inserted or updated:
+        bump_catalog_version()
+        refresh_facets_later(category_ids.values())
+        db.session.commit()
+    logger.info('Product import: %d inserted, %d updated, %d failed', inserted, updated, failed)
+    return ImportResult(inserted, updated, failed, errors)
+
+
+def queue_import(upload):
+    """
+    Saves an uploaded feed to ``IMPORT_DIR`` and queues its import, inside the
+    caller's transaction, so a large feed never ties up a web request.
+
+    Args:
+        upload (FileStorage): The uploaded feed file
+    """
+    os.makedirs(_settings['import_dir'], exist_ok=True)
+    fmt = feed_format(upload.filename)
+    path = os.path.join(_settings['import_dir'], f'{uuid.uuid4().hex}.{fmt}')
+    upload.save(path)
+    enqueue('catalog.import', {'path': path, 'fmt': fmt, 'filename': upload.filename})
+
+
+@job('catalog.import')
+def import_feed(path, fmt, filename=None):
+    """
+    Imports a feed saved by ``queue_import`` and deletes the file. Batches
+    commit as they go; a retried import upserts the same SKUs again, and one
+    whose file is gone has already finished.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8', newline='') as feed:
+        result = import_products(read_feed(feed, fmt))
+    for line_number, message in result.errors:
+        logger.warning('Product import %s line %d: %s', filename or path, line_number, message)
+    os.remove(path)
+
+
+def export_products(fmt, batch_size=1000):
+    """
+    Streams the catalog as a feed that ``import_products`` accepts. Rows are
+    read with a server-side cursor where the database supports it and written
+    out a batch at a time, so memory use does not grow with the catalog.
+
+    Args:
+        fmt (str): 'csv' or 'jsonl'
+        batch_size (int): Rows fetched and emitted per chunk
+
+    Yields:
+        str: Chunks of feed text
+    """
+    from models import Product, Category
+
+    stmt = select(Product.sku, Product.name, Product.description, Product.price, Product.stock,
+                  Product.image_url, Category.name, Product.featured) \
+        .join(Category, Category.id == Product.category_id).order_by(Product.id)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(FEED_FIELDS)
+
+    result = db.session.execute(stmt, execution_options={'stream_results': True, 'yield_per': batch_size})
+    for rows in result.partitions():
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow(row[:-1] + ('true' if row[-1] else 'false',))
+            else:
+                buffer.write(json.dumps(dict(zip(FEED_FIELDS, row))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if fmt == 'csv' and buffer.tell():
+        yield buffer.getvalue()
+
+
+def init_catalog_io(app):
+    """
+    Sets where uploaded feeds wait for their import job (``IMPORT_DIR``) and
+    registers the ``flask import-products`` and ``flask export-products`` commands.
+    """
+    _settings['import_dir'] = app.config.get('IMPORT_DIR') or os.path.join(app.instance_path, 'imports')
+
+    @app.cli.command('import-products')
+    @click.argument('feed', type=click.File('r', encoding='utf-8', lazy=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                  help='Feed format (default: from the file extension, else csv).')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+    def import_products_command(feed, fmt, batch_size):
+        """Insert or update products from a CSV or JSON Lines feed, matched on SKU."""
+        result = import_products(read_feed(feed, fmt or feed_format(feed.name)), batch_size)
+        for line_number, message in result.errors:
+            click.echo(f'line {line_number}: {message}', err=True)
+        if result.failed > len(result.errors):
+            click.echo(f'... and {result.failed - len(result.errors)} more', err=True)
+        click.echo(f'{result.inserted} inserted, {result.updated} updated, {result.failed} failed')
+
+    @app.cli.command('export-products')
+    @click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                  help='Feed format (default: from the file extension, else csv).')
+    def export_products_command(output, fmt):
+        """Write every product as a CSV or JSON Lines feed (to stdout by default)."""
+        for chunk in export_products(fmt or feed_format(output.name)):
+            output.write(chunk)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+
+from flask import Response, after_this_request, request, session
+
+from utils.assets import manifest_fingerprint
+from utils.principal import current_principal
+
+_release = {'value': ''}
+
+
+def _template_fingerprint(app):
+    """Hashes template names, sizes and mtimes so a deploy changes every ETag."""
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f'{root}/{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:12]
+
+
+def etag_for(*parts, personal=True):
+    """
+    Builds a strong ETag from the data a page is rendered from.
+
+    The logged-in user, their delivery location and cart count are included
+    since the layout shows them, and so are fingerprints of the templates
+    and of the asset manifest, whose file names the pages link to.
+
+    Args:
+        *parts: Values that identify the page's data, e.g. ids and versions
+        personal (bool): False for responses that are the same for every
+                         visitor, such as the JSON API
+
+    Returns:
+        str: The ETag value (without quotes)
+    """
+    principal = current_principal() if personal else None
+    viewer = (principal.id, principal.auth_version, principal.name, principal.is_admin,
+              session.get('default_address'), session.get('cart_count')) if principal else None
+    return hashlib.sha1(repr((_release['value'], manifest_fingerprint(), viewer) + parts).encode()).hexdigest()
+
+
+def last_modified_of(*items):
+    """
+    Returns the latest ``updated_at`` among model instances (lists are
+    flattened), or None if any of them has no timestamp yet, in which case
+    no Last-Modified header is sent.
+    """
+    latest = None
+    for item in items:
+        for obj in (item if isinstance(item, (list, tuple)) else [item]):
+            updated_at = getattr(obj, 'updated_at', None)
+            if updated_at is None:
+                return None
+            latest = max(latest, updated_at) if latest else updated_at
+    return latest
+
+
+def conditional(etag, last_modified=None, public=False, max_age=0, personal=True):
+    """
+    Answers a conditional GET before the page is rendered.
+
+    The ETag, Last-Modified and Cache-Control headers are added to whatever
+    response the view returns. ``public`` pages are only marked publicly
+    cacheable for anonymous visitors, unless they are not ``personal``.
+
+    Only pass ``last_modified`` when it covers everything the page shows:
+    a page built from a listing also changes when a row leaves it. It is
+    never used to answer If-Modified-Since for a signed-in visitor of a
+    ``personal`` page, whose greeting and cart count it does not cover.
+
+    Args:
+        etag (str): From ``etag_for``
+        last_modified (datetime): Naive UTC time the data last changed, or None
+        public (bool): Whether a shared cache may store the page
+        max_age (int): Seconds clients and caches may reuse it without asking
+        personal (bool): False for responses that never show the session or
+                         flash messages, such as the JSON API; the session
+                         is then not read, so no Vary: Cookie is added
+
+    Returns:
+        Response: An empty 304 response if the client's copy is current,
+                  otherwise None and the view renders as usual
+    """
+    # Pending flash messages are rendered into the page, so it has to be sent
+    if personal and session.get('_flashes'):
+        return None
+
+    shared = public and (not personal or current_principal() is None)
+    # Signed-in visitors of public pages always revalidate, since the page greets them
+    max_age = max_age if shared or not public else 0
+    last_modified = last_modified.replace(microsecond=0) if last_modified else None
+
+    @after_this_request
+    def add_validators(response):
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        if shared:
+            response.cache_control.public = True
+        else:
+            response.cache_control.private = True
+        if max_age:
+            response.cache_control.max_age = max_age
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        matches = request.if_none_match.contains(etag)
+    elif personal and current_principal() is not None:
+        matches = False
+    else:
+        matches = bool(last_modified and request.if_modified_since
+                       and last_modified <= request.if_modified_since.replace(tzinfo=None))
+    return Response(status=304) if matches else None
+
+
+def init_conditional(app):
+    """Fingerprints the templates for ``etag_for``."""
+    _release['value'] = _template_fingerprint(app)
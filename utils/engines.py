@@ -0,0 +1,159 @@
+import sqlite3
+
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import Pool, QueuePool
+
+# Options every engine got before profiles existed, kept for other databases
+# and for DB_ENGINE_PROFILE=default
+DEFAULT_OPTIONS = {'pool_recycle': 300, 'pool_pre_ping': True}
+
+_settings = {
+    'enabled': True,
+    'sqlite_busy_timeout_ms': 5000,
+    'sqlite_cache_size_mb': 64,
+    'sqlite_mmap_size_mb': 256,
+    'statement_timeout_ms': 30000,
+}
+
+
+def _sqlite_options(url, config):
+    if url.database in (None, '', ':memory:') or 'mode=memory' in url.database:
+        # Flask-SQLAlchemy shares one connection for in-memory databases
+        return {}
+    # Connections to a local file never go stale, so they are kept for good
+    # and not pinged; WAL lets every pooled connection read while one writes.
+    return {
+        'poolclass': QueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_POOL_SIZE', 5),
+        'pool_timeout': 30,
+        'pool_recycle': -1,
+        'pool_pre_ping': False,
+    }
+
+
+def _postgres_options(url, config):
+    # Each web process gets an equal share of the server's connections; the
+    # overflow absorbs bursts without exceeding that share
+    workers = max(config.get('WEB_CONCURRENCY', 1), 1)
+    share = max(config.get('DB_MAX_CONNECTIONS', 80) // workers, 1)
+    pool_size = min(config.get('DB_POOL_SIZE', 5), share)
+    idle_ms = config.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000)
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': min(share - pool_size, pool_size),
+        'pool_timeout': 10,
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+        # Idle connections beyond the steady load age out instead of being rotated through
+        'pool_use_lifo': True,
+        'connect_args': {
+            'connect_timeout': 5,
+            'application_name': config.get('DB_APPLICATION_NAME', 'shop'),
+            'options': f'-c idle_in_transaction_session_timeout={int(idle_ms)}',
+        },
+    }
+
+
+def engine_options(url, config):
+    """
+    Engine options for the database at ``url``, chosen by its backend.
+
+    Args:
+        url (str): A SQLAlchemy database URL
+        config (dict): App config with the ``DB_*`` and ``SQLITE_*`` settings
+
+    Returns:
+        dict: Keyword arguments for ``create_engine``
+    """
+    if config.get('DB_ENGINE_PROFILE', 'auto') == 'default':
+        return dict(DEFAULT_OPTIONS)
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        return _sqlite_options(url, config)
+    if backend == 'postgresql':
+        return _postgres_options(url, config)
+    return dict(DEFAULT_OPTIONS)
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    if not _settings['enabled'] or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        try:
+            # Persistent in the file; read-only replicas keep whatever they have
+            cursor.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.OperationalError:
+            pass
+        # In WAL mode NORMAL only risks the last commits on power loss, never corruption
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f"PRAGMA busy_timeout={int(_settings['sqlite_busy_timeout_ms'])}")
+        cursor.execute(f"PRAGMA cache_size=-{int(_settings['sqlite_cache_size_mb'] * 1024)}")
+        cursor.execute(f"PRAGMA mmap_size={int(_settings['sqlite_mmap_size_mb'] * 1024 * 1024)}")
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+def _statement_timeout(conn):
+    # Requests are cut off after DB_STATEMENT_TIMEOUT_MS; jobs and commands
+    # (rebuilds, imports, migrations) may run as long as they need. The SET is
+    # only sent when a connection switches between the two.
+    if not _settings['enabled'] or conn.dialect.name != 'postgresql':
+        return
+    wanted = _settings['statement_timeout_ms'] if has_request_context() else 0
+    info = conn.connection.info
+    if info.get('statement_timeout') != wanted:
+        dbapi_connection = conn.connection.dbapi_connection
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'SET statement_timeout = {int(wanted)}')
+        finally:
+            cursor.close()
+        # Committed so a rollback of the next transaction keeps it
+        dbapi_connection.commit()
+        info['statement_timeout'] = wanted
+
+
+def init_engines(app):
+    """
+    Picks engine options for the primary database and each bind from its URL.
+    Call it after ``init_replicas`` and before ``db.init_app``.
+
+    SQLite files get a kept-open connection pool and, on every new connection,
+    WAL journaling, ``synchronous=NORMAL``, a ``SQLITE_BUSY_TIMEOUT_MS`` busy
+    timeout and ``SQLITE_CACHE_SIZE_MB``/``SQLITE_MMAP_SIZE_MB`` page cache
+    and memory map. Postgres gets a pinged LIFO pool sized so ``WEB_CONCURRENCY``
+    processes stay within ``DB_MAX_CONNECTIONS``, and requests' statements are
+    cancelled after ``DB_STATEMENT_TIMEOUT_MS``. Options in
+    ``SQLALCHEMY_ENGINE_OPTIONS`` override the primary's profile.
+
+    ``DB_ENGINE_PROFILE=default`` turns all of this off.
+    """
+    config = app.config
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(config['SQLALCHEMY_DATABASE_URI'], config),
+        **(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}),
+    }
+    binds = {}
+    for key, bind in (config.get('SQLALCHEMY_BINDS') or {}).items():
+        if not isinstance(bind, dict):
+            bind = {'url': bind}
+        binds[key] = {**engine_options(bind['url'], config), **bind}
+    config['SQLALCHEMY_BINDS'] = binds
+    _settings.update(
+        enabled=config.get('DB_ENGINE_PROFILE', 'auto') != 'default',
+        sqlite_busy_timeout_ms=config.get('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        sqlite_cache_size_mb=config.get('SQLITE_CACHE_SIZE_MB', 64),
+        sqlite_mmap_size_mb=config.get('SQLITE_MMAP_SIZE_MB', 256),
+        statement_timeout_ms=config.get('DB_STATEMENT_TIMEOUT_MS', 30000),
+    )
+    if not event.contains(Pool, 'connect', _tune_sqlite):
+        event.listen(Pool, 'connect', _tune_sqlite)
+    if not event.contains(Engine, 'engine_connect', _statement_timeout):
+        event.listen(Engine, 'engine_connect', _statement_timeout)
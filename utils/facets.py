@@ -0,0 +1,223 @@
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import case, delete, insert
+
+from app import db
+from utils.jobs import enqueue, job
+
+logger = logging.getLogger(__name__)
+
+# Price facet buckets: (URL key, label, lowest price, price it stops below)
+PRICE_BUCKETS = [
+    ('under-500', 'Under ₹500', None, 500),
+    ('500-2000', '₹500 to ₹2,000', 500, 2000),
+    ('2000-10000', '₹2,000 to ₹10,000', 2000, 10000),
+    ('10000-50000', '₹10,000 to ₹50,000', 10000, 50000),
+    ('50000-up', '₹50,000 and above', 50000, None),
+]
+
+# Products added in the last this many days are new arrivals
+NEW_ARRIVAL_DAYS = 30
+
+# Changes to a category within this many seconds share one recount
+REFRESH_DELAY = 5
+
+# Seconds between recounts of a category that has not changed
+DAILY = 24 * 3600
+
+FacetRow = namedtuple('FacetRow', ['price_bucket', 'in_stock', 'featured', 'new_arrival', 'products'])
+
+# 'price' is a list of (key, label, count, selected) per bucket; the other
+# facets are the number of results if that filter were switched on
+Facets = namedtuple('Facets', ['total', 'price', 'in_stock', 'featured', 'new_arrival'])
+
+
+def price_bucket_index(key):
+    """Returns the position of a price bucket key in ``PRICE_BUCKETS``, or None."""
+    for index, bucket in enumerate(PRICE_BUCKETS):
+        if bucket[0] == key:
+            return index
+    return None
+
+
+def new_arrival_cutoff():
+    return datetime.utcnow() - timedelta(days=NEW_ARRIVAL_DAYS)
+
+
+def facet_filters(query, price=None, in_stock=False, featured=False, new_arrival=False):
+    """
+    Narrows a Product query to the selected facets.
+
+    Args:
+        price (int): Index into ``PRICE_BUCKETS``, or None for any price
+        in_stock, featured, new_arrival (bool): Only products that are
+    """
+    from models import Product
+
+    if price is not None:
+        _, _, low, high = PRICE_BUCKETS[price]
+        if low is not None:
+            query = query.filter(Product.price >= low)
+        if high is not None:
+            query = query.filter(Product.price < high)
+    if in_stock:
+        query = query.filter(Product.stock > 0)
+    if featured:
+        query = query.filter(Product.featured.is_(True))
+    if new_arrival:
+        query = query.filter(Product.created_at >= new_arrival_cutoff())
+    return query
+
+
+def facet_count_query(category_id, min_price=None, max_price=None):
+    """The grouped query behind ``count_facets``."""
+    from models import Product
+
+    bucket = case(*[(Product.price < high, index) for index, (_, _, _, high) in enumerate(PRICE_BUCKETS)
+                    if high is not None], else_=len(PRICE_BUCKETS) - 1)
+    in_stock = case((Product.stock > 0, True), else_=False)
+    featured = case((Product.featured.is_(True), True), else_=False)
+    new_arrival = case((Product.created_at >= new_arrival_cutoff(), True), else_=False)
+    query = db.session.query(bucket, in_stock, featured, new_arrival, db.func.count()) \
+        .filter(Product.category_id == category_id)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    return query.group_by(bucket, in_stock, featured, new_arrival)
+
+
+def count_facets(category_id, min_price=None, max_price=None):
+    """
+    Counts a category's products per facet combination in one grouped query.
+
+    Returns:
+        list: ``FacetRow`` per price bucket x in stock x featured x new arrival
+              combination that has products
+    """
+    rows = facet_count_query(category_id, min_price, max_price).all()
+    return [FacetRow(int(b), bool(s), bool(f), bool(n), count) for b, s, f, n, count in rows]
+
+
+def stored_facets(category_id):
+    """Reads a category's precomputed facet counts."""
+    from models import ProductFacet
+
+    return [FacetRow(*row) for row in db.session.query(
+        ProductFacet.price_bucket, ProductFacet.in_stock, ProductFacet.featured,
+        ProductFacet.new_arrival, ProductFacet.products,
+    ).filter(ProductFacet.category_id == category_id)]
+
+
+def product_count():
+    """The number of products in the catalog, summed from the stored facet counts."""
+    from models import ProductFacet
+
+    return db.session.query(db.func.coalesce(db.func.sum(ProductFacet.products), 0)).scalar()
+
+
+def _recount(category_id):
+    from models import ProductFacet
+    from utils.cache import bump_catalog_version
+
+    rows = count_facets(category_id)
+    # Pages and ETags cached since the product change still carry the old
+    # counts, so they are invalidated, but only when the counts moved
+    if set(rows) != {FacetRow(int(b), bool(s), bool(f), bool(n), count)
+                     for b, s, f, n, count in stored_facets(category_id)}:
+        db.session.execute(delete(ProductFacet).where(ProductFacet.category_id == category_id))
+        if rows:
+            now = datetime.utcnow()
+            db.session.execute(insert(ProductFacet), [
+                {'category_id': category_id, 'computed_at': now, **row._asdict()} for row in rows])
+        bump_catalog_version()
+    # Recount daily even without changes, as products stop being new arrivals
+    tomorrow = (datetime.utcnow() + timedelta(seconds=DAILY)).date()
+    enqueue('facets.refresh', {'category_id': category_id},
+            key=f'facets.refresh:{category_id}:{tomorrow.isoformat()}', delay=DAILY)
+
+
+def refresh_facets(category_ids=None):
+    """
+    Recounts the stored facets of the given categories (every category by
+    default) and commits.
+
+    Returns:
+        int: Number of categories recounted
+    """
+    from models import Category
+
+    if category_ids is None:
+        category_ids = [row.id for row in db.session.query(Category.id)]
+    for category_id in category_ids:
+        _recount(category_id)
+    db.session.commit()
+    return len(category_ids)
+
+
+def refresh_facets_later(category_ids):
+    """
+    Queues a recount of each category's stored facets inside the caller's
+    transaction. Changes to a category within ``REFRESH_DELAY`` seconds of each
+    other share one recount, run once the window has passed.
+    """
+    window = int(time.time() // REFRESH_DELAY)
+    for category_id in sorted(set(category_ids)):
+        enqueue('facets.refresh', {'category_id': category_id},
+                key=f'facets.refresh:{category_id}:{window}', delay=REFRESH_DELAY)
+
+
+@job('facets.refresh')
+def refresh_category_facets(category_id):
+    """Recounts one category's stored facets."""
+    _recount(category_id)
+
+
+def summarize(rows, price=None, in_stock=False, featured=False, new_arrival=False):
+    """
+    Works out the result count of every facet from facet rows, given the
+    facets already selected.
+
+    Returns:
+        Facets: The total for the current selection, and per facet the total
+                it would give; price buckets count as alternatives to each other
+    """
+    selected = {'price': price, 'in_stock': in_stock, 'featured': featured, 'new_arrival': new_arrival}
+
+    def count(**changes):
+        wanted = dict(selected, **changes)
+        return sum(row.products for row in rows
+                   if (wanted['price'] is None or row.price_bucket == wanted['price'])
+                   and (row.in_stock or not wanted['in_stock'])
+                   and (row.featured or not wanted['featured'])
+                   and (row.new_arrival or not wanted['new_arrival']))
+
+    return Facets(
+        total=count(),
+        price=[(key, label, count(price=index), index == price)
+               for index, (key, label, _, _) in enumerate(PRICE_BUCKETS)],
+        in_stock=count(in_stock=True),
+        featured=count(featured=True),
+        new_arrival=count(new_arrival=True),
+    )
+
+
+def backfill_facets():
+    """Counts facets once for databases that have products but no stored facets yet."""
+    from models import Product, ProductFacet
+
+    if not db.session.query(ProductFacet.category_id).first() and db.session.query(Product.id).first():
+        logger.info('Counted facets for %d categories', refresh_facets())
+
+
+def init_facets(app):
+    """Registers the ``flask refresh-facets`` command."""
+
+    @app.cli.command('refresh-facets')
+    def refresh_facets_command():
+        """Recount the stored category facet counts."""
+        click.echo(f'Counted facets for {refresh_facets()} categories')
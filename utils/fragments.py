@@ -0,0 +1,57 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from utils.cache import LRUCache, catalog_cached, catalog_version, detach
+from utils.queries import unbudgeted
+
+fragment_cache = LRUCache(maxsize=4096, ttl=3600)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Adds a ``{% cache %}`` tag that stores the rendered HTML of its body in
+    ``fragment_cache``. The key is the tag's arguments, which must name
+    everything the body depends on::
+
+        {% cache 'product-card', product.id, catalog_version() %}
+            ...
+        {% endcache %}
+
+    The body is only rendered on a miss, so it must not depend on the
+    request, the session or the logged-in user.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.Tuple(key, 'load')]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return fragment_cache.get_or_set(key, caller)
+
+
+def nav_categories():
+    """Returns every category for the layout menus, from the catalog cache."""
+    from models import Category
+
+    def load():
+        with unbudgeted():
+            return detach(Category.query.all())
+    return catalog_cached('categories', load)
+
+
+def init_fragment_cache(app):
+    """
+    Registers the ``{% cache %}`` tag and the ``catalog_version()`` and
+    ``nav_categories()`` template globals, and sizes the cache from
+    ``FRAGMENT_CACHE_SIZE``.
+    """
+    fragment_cache.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', 4096)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals.update(catalog_version=catalog_version, nav_categories=nav_categories)
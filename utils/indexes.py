@@ -0,0 +1,226 @@
+import sys
+from datetime import datetime
+
+import click
+from sqlalchemy import tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import db
+
+# Plan fragments that mean a table is read without an index
+_SQLITE_INDEXED = ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY', 'USING PRIMARY KEY',
+                   'VIRTUAL TABLE INDEX')
+
+# Tables that hold one row per order status or counter, so reading them whole is fine
+_SMALL_TABLES = ('sales_total', 'site_total')
+
+
+class Explain(Executable, ClauseElement):
+    """An EXPLAIN wrapper around a SELECT, compiled per dialect below."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, 'sqlite')
+def _compile_explain_sqlite(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+
+
+def add_missing_columns():
+    """
+    Adds columns declared on the models that existing tables do not have yet.
+    ``db.create_all()`` never alters a table that already exists, so this runs
+    at startup to keep older databases in step with the models. New columns
+    must be nullable or have a server default; uniqueness belongs in an index,
+    which ``create_missing_indexes`` then adds.
+
+    Returns:
+        list: 'table.column' names of the columns that were added
+    """
+    added = []
+    with db.engine.begin() as conn:
+        inspector = db.inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                quote = conn.dialect.identifier_preparer.quote
+                ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} ' \
+                      f'{column.type.compile(conn.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                conn.execute(db.text(ddl))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def create_missing_indexes():
+    """
+    Creates every index declared on the models that the database does not have yet.
+    ``db.create_all()`` only creates indexes together with new tables, so this is
+    the upgrade path for databases created before an index was added.
+
+    Returns:
+        list: Names of the indexes that were created
+    """
+    created = []
+    with db.engine.begin() as conn:
+        existing = {}
+        for table in db.metadata.sorted_tables:
+            existing[table.name] = {ix['name'] for ix in db.inspect(conn).get_indexes(table.name)}
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing[table.name]:
+                    index.create(conn)
+                    created.append(index.name)
+    return created
+
+
+def route_queries():
+    """
+    Returns the queries each route issues, built the same way the routes build
+    them and bound to ids sampled from the current database.
+
+    Returns:
+        list: (route, description, query) tuples
+    """
+    from models import (User, Product, Category, Order, OrderItem, CartItem, Address, Job,
+                        ProductFacet, ProductNeighbour, SalesRollup, SalesTotal)
+    from utils.facets import facet_count_query
+    from utils.jobs import CLAIM_BATCH
+    from utils.rollups import ALL_CATEGORIES
+    from utils.search import search_products
+
+    category_id = db.session.query(Category.id).limit(1).scalar() or 1
+    user_id = db.session.query(User.id).filter_by(is_admin=False).limit(1).scalar() or 1
+    product_id = db.session.query(Product.id).limit(1).scalar() or 1
+    order_id = db.session.query(Order.id).limit(1).scalar() or 1
+    address_id = db.session.query(Address.id).limit(1).scalar() or 1
+    now = datetime.utcnow()
+
+    listing = Product.query.filter_by(category_id=category_id).filter(Product.price >= 0, Product.price <= 100000)
+    user_orders = Order.query.filter_by(user_id=user_id)
+    processing = Order.query.filter_by(status='Processing')
+    neighbours = Product.query.join(ProductNeighbour, ProductNeighbour.neighbour_id == Product.id)
+    recent_rollups = SalesRollup.query.filter(SalesRollup.day >= now.date())
+
+    return [
+        ('index', 'featured products', Product.query.filter_by(featured=True).limit(8)),
+        ('category', 'listing by price', listing.order_by(Product.price.asc()).limit(6)),
+        ('category', 'listing by newest', listing.order_by(Product.created_at.desc()).limit(6)),
+        ('category', 'listing count', listing.order_by(None).with_entities(db.func.count())),
+        ('category', 'cursor page by price',
+         listing.filter(tuple_(Product.price, Product.id) > tuple_(500.0, product_id))
+         .order_by(Product.price.asc(), Product.id.asc()).limit(7)),
+        ('category', 'stored facet counts', ProductFacet.query.filter_by(category_id=category_id)),
+        ('category', 'live facet counts for a price range', facet_count_query(category_id, 500.0, 20000.0)),
+        ('search', 'full-text search', search_products('phone case')),
+        ('search', 'full-text search in a category', search_products('phone', category_id=category_id)),
+        ('product', 'related products',
+         Product.query.filter_by(category_id=category_id).filter(Product.id != product_id).limit(4)),
+        ('product', 'also bought',
+         neighbours.filter(ProductNeighbour.product_id == product_id).order_by(ProductNeighbour.rank).limit(4)),
+        ('cart', 'bought together',
+         neighbours.filter(ProductNeighbour.product_id.in_([product_id]), Product.id.not_in([product_id]),
+                           Product.stock > 0).group_by(Product.id)
+         .order_by(db.func.sum(ProductNeighbour.score).desc(), Product.id).limit(4)),
+        ('cart', 'cart items', CartItem.query.filter_by(user_id=user_id)),
+        ('add_to_cart', 'existing cart line', CartItem.query.filter_by(user_id=user_id, product_id=product_id)),
+        ('checkout', 'user addresses', Address.query.filter_by(user_id=user_id)),
+        ('login', 'default address', Address.query.filter_by(user_id=user_id, is_default=True)),
+        ('orders', 'order history page',
+         user_orders.order_by(Order.created_at.desc(), Order.id.desc()).limit(11)),
+        ('orders', 'order history next page',
+         user_orders.filter(tuple_(Order.created_at, Order.id) < tuple_(now, order_id))
+         .order_by(Order.created_at.desc(), Order.id.desc()).limit(11)),
+        ('order_detail', 'order items', OrderItem.query.filter(OrderItem.order_id.in_([order_id]))),
+        ('delete_address', 'address in use', Order.query.filter_by(address_id=address_id).limit(1)),
+        ('admin_dashboard', 'recent orders', Order.query.order_by(Order.created_at.desc()).limit(5)),
+        ('admin_dashboard', 'sales totals', SalesTotal.query.filter(SalesTotal.orders > 0)),
+        ('admin_dashboard', 'daily sales',
+         recent_rollups.filter(SalesRollup.category_id == ALL_CATEGORIES)
+         .with_entities(SalesRollup.day, db.func.sum(SalesRollup.revenue)).group_by(SalesRollup.day)),
+        ('admin_dashboard', 'sales by category',
+         recent_rollups.filter(SalesRollup.category_id != ALL_CATEGORIES)
+         .with_entities(SalesRollup.category_id, db.func.sum(SalesRollup.revenue))
+         .group_by(SalesRollup.category_id)),
+        ('admin_orders', 'all orders page',
+         Order.query.order_by(Order.created_at.desc(), Order.id.desc()).limit(21)),
+        ('admin_orders', 'orders by status page',
+         processing.order_by(Order.created_at.desc(), Order.id.desc()).limit(21)),
+        ('admin_users', 'order counts',
+         db.session.query(Order.user_id, db.func.count()).filter(Order.user_id.in_([user_id]))
+         .group_by(Order.user_id)),
+        ('admin_delete_product', 'product in orders', OrderItem.query.filter_by(product_id=product_id).limit(1)),
+        ('job worker', 'due jobs',
+         Job.query.filter(Job.status == 'queued', Job.run_at <= now,
+                          db.or_(Job.locked_until.is_(None), Job.locked_until < now))
+         .order_by(Job.run_at, Job.id).limit(CLAIM_BATCH)),
+    ]
+
+
+def explain(query):
+    """
+    Runs EXPLAIN QUERY PLAN (SQLite) or EXPLAIN (Postgres) for a query.
+
+    Args:
+        query: A ``Model.query`` style query
+
+    Returns:
+        tuple: (plan lines, lines that read a table without an index)
+    """
+    if db.engine.dialect.name == 'sqlite':
+        rows = db.session.execute(Explain(query.statement)).all()
+        lines = [row[-1] for row in rows]
+        flagged = [line for line in lines
+                   if line.startswith('SCAN') and not any(marker in line for marker in _SQLITE_INDEXED)
+                   and line.split()[1] not in _SMALL_TABLES]
+    else:
+        # With sequential scans priced out, any Seq Scan left has no usable index
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+        rows = db.session.execute(Explain(query.statement)).all()
+        lines = [row[0] for row in rows]
+        flagged = [line for line in lines
+                   if 'Seq Scan' in line and not any(f' on {table}' in line for table in _SMALL_TABLES)]
+    return lines, flagged
+
+
+def init_index_commands(app):
+    """Registers the ``flask create-indexes`` and ``flask index-report`` commands."""
+
+    @app.cli.command('create-indexes')
+    def create_indexes_command():
+        """Create indexes declared on the models that are missing from the database."""
+        created = create_missing_indexes()
+        for name in created:
+            click.echo(f'Created {name}')
+        click.echo(f'{len(created)} index(es) created')
+
+    @app.cli.command('index-report')
+    @click.option('--verbose', is_flag=True, help='Print the full plan for every query.')
+    def index_report_command(verbose):
+        """Explain each route's queries and flag full table scans."""
+        problems = 0
+        for route, description, query in route_queries():
+            lines, flagged = explain(query)
+            status = 'SCAN' if flagged else 'ok'
+            click.echo(f'[{status:>4}] {route}: {description}')
+            for line in (lines if verbose else flagged):
+                click.echo(f'         {line}')
+            problems += bool(flagged)
+        db.session.rollback()
+        click.echo(f'{problems} quer{"y" if problems == 1 else "ies"} with full table scans')
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,313 @@
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, insert, or_, update
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Modules whose @job handlers must be registered before jobs are published or run
+JOB_MODULES = ('utils.alerts', 'utils.facets', 'utils.recommendations', 'utils.catalog_io')
+
+# Retries wait JOB_RETRY_DELAY, then twice that, and so on, up to this many seconds
+MAX_RETRY_DELAY = 3600
+
+# Due jobs looked at per claim; workers race for them, so more than one
+CLAIM_BATCH = 10
+
+# Job name: handler function
+HANDLERS = {}
+
+# Event name: names of the jobs queued when it is published
+SUBSCRIBERS = {}
+
+_settings = {
+    'worker_threads': 1,
+    'poll_interval': 1.0,
+    'visibility_timeout': 60.0,
+    'max_attempts': 5,
+    'retry_delay': 5.0,
+}
+
+_pool = {'app': None, 'pid': None, 'lock': threading.Lock()}
+
+
+def job(name, events=()):
+    """
+    Registers the decorated function as the handler for jobs called ``name``,
+    queued for every event in ``events``. It is called with the job's payload
+    as keyword arguments, inside a transaction that also marks the job done,
+    so its database writes happen exactly once even when the job is retried.
+    """
+    def decorator(fn):
+        HANDLERS[name] = fn
+        for event in events:
+            SUBSCRIBERS.setdefault(event, []).append(name)
+        return fn
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Adds a job to the queue inside the caller's transaction, so it is only
+    queued if the caller commits. Does nothing if a job with the same ``key``
+    has already been queued.
+
+    Args:
+        name (str): A name registered with ``job``
+        payload (dict): JSON-serializable keyword arguments for the handler
+        key (str): Idempotency key, or None to always queue
+        delay (float): Seconds to wait before the job may run
+        max_attempts (int): Tries before the job is marked failed (default: JOB_MAX_ATTEMPTS)
+    """
+    from models import Job
+
+    values = {
+        'name': name,
+        'key': key,
+        'payload': json.dumps(payload or {}),
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': max_attempts or _settings['max_attempts'],
+        'run_at': datetime.utcnow() + timedelta(seconds=delay),
+        'created_at': datetime.utcnow(),
+    }
+    table = Job.__table__
+    dialect = db.session.get_bind().dialect.name
+    if key is None:
+        db.session.execute(insert(table).values(**values))
+    elif dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        db.session.execute(dialect_insert(table).values(**values).on_conflict_do_nothing(index_elements=['key']))
+    elif not db.session.query(Job.id).filter_by(key=key).first():
+        db.session.execute(insert(table).values(**values))
+    _start_pool()
+
+
+def publish(event, payload=None, key=None):
+    """
+    Queues every job subscribed to ``event`` with the same payload, inside the
+    caller's transaction. With a ``key``, each subscriber's job is queued at
+    most once per key.
+    """
+    for name in SUBSCRIBERS.get(event, ()):
+        enqueue(name, payload, key=f'{key}:{name}' if key else None)
+
+
+def _retry_delay(attempts):
+    delay = min(_settings['retry_delay'] * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim():
+    """
+    Leases the next due job for ``JOB_VISIBILITY_TIMEOUT`` seconds. A worker
+    that dies mid-job loses its lease and the job is run again.
+
+    Returns:
+        tuple: (job id, name, payload dict, attempts, max attempts, lease), or None
+    """
+    from models import Job
+
+    now = datetime.utcnow()
+    available = [Job.status == 'queued', Job.run_at <= now,
+                 or_(Job.locked_until.is_(None), Job.locked_until < now)]
+    candidates = db.session.query(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts) \
+        .filter(*available).order_by(Job.run_at, Job.id).limit(CLAIM_BATCH).all()
+    db.session.rollback()
+    random.shuffle(candidates)
+    lease = now + timedelta(seconds=_settings['visibility_timeout'])
+    for row in candidates:
+        # Only one worker's UPDATE can match while the job is still available
+        claimed = db.session.execute(update(Job).where(Job.id == row.id, *available)
+                                     .values(locked_until=lease, attempts=Job.attempts + 1)).rowcount
+        db.session.commit()
+        if claimed:
+            return row.id, row.name, json.loads(row.payload), row.attempts + 1, row.max_attempts, lease
+    return None
+
+
+def run_next():
+    """
+    Claims and runs one job. A failed job is retried with exponential backoff
+    until it has used its attempts, then marked failed.
+
+    Returns:
+        bool: Whether there was a job to run
+    """
+    from models import Job
+
+    claimed = claim()
+    if claimed is None:
+        return False
+    job_id, name, payload, attempts, max_attempts, lease = claimed
+    held = [Job.id == job_id, Job.locked_until == lease]
+    try:
+        handler = HANDLERS.get(name)
+        if handler is None:
+            raise LookupError(f'No handler registered for job {name!r}')
+        handler(**payload)
+        finished = db.session.execute(update(Job).where(*held).values(
+            status='done', locked_until=None, last_error=None, finished_at=datetime.utcnow())).rowcount
+        if not finished:
+            # Another worker took the job over after our lease ran out
+            db.session.rollback()
+            logger.warning('Job %d (%s) outlived its lease; its changes were rolled back', job_id, name)
+            return True
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+        if attempts >= max_attempts:
+            values = {'status': 'failed', 'finished_at': datetime.utcnow()}
+            logger.exception('Job %d (%s) failed for good after %d attempts', job_id, name, attempts)
+        else:
+            delay = _retry_delay(attempts)
+            values = {'run_at': datetime.utcnow() + timedelta(seconds=delay)}
+            logger.warning('Job %d (%s) failed (attempt %d of %d), retrying in %.0fs: %s',
+                           job_id, name, attempts, max_attempts, delay, error)
+        db.session.execute(update(Job).where(*held).values(locked_until=None, last_error=error, **values))
+        db.session.commit()
+    return True
+
+
+def work(app, stop, poll_interval=None):
+    """Runs jobs until ``stop`` is set, sleeping ``poll_interval`` seconds when the queue is empty."""
+    poll_interval = poll_interval or _settings['poll_interval']
+    while not stop.is_set():
+        try:
+            with app.app_context():
+                ran = run_next()
+        except Exception:
+            logger.exception('Job worker error, retrying in %.1fs', poll_interval)
+            ran = False
+        if not ran:
+            stop.wait(poll_interval)
+
+
+def drain(app):
+    """Runs due jobs until none are left. Returns the number run."""
+    count = 0
+    with app.app_context():
+        while run_next():
+            count += 1
+    return count
+
+
+def _start_threads(app, count, stop, prefix='job-worker'):
+    threads = [threading.Thread(target=work, args=(app, stop), name=f'{prefix}-{n}', daemon=True)
+               for n in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _start_pool():
+    # Started on first use, like the cart flusher, so each gunicorn worker
+    # runs its own threads rather than the master that forks them
+    app = _pool['app']
+    if app is None or not _settings['worker_threads'] or _pool['pid'] == os.getpid():
+        return
+    with _pool['lock']:
+        if _pool['pid'] != os.getpid():
+            _pool['pid'] = os.getpid()
+            _start_threads(app, _settings['worker_threads'], threading.Event())
+
+
+def _worker_process(app, threads, stop):
+    # Connections inherited from the parent must not be shared with it
+    _pool['pid'] = os.getpid()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    # The parent sets ``stop`` on either signal; running jobs are finished first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    for thread in _start_threads(app, threads, stop):
+        thread.join()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def purge_jobs(days):
+    """
+    Deletes jobs that finished successfully more than ``days`` days ago.
+
+    Returns:
+        int: Number of jobs deleted
+    """
+    from models import Job
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = db.session.execute(delete(Job).where(Job.status == 'done', Job.finished_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def init_jobs(app):
+    """
+    Registers the job handlers, sizes the queue from the ``JOB_*`` settings
+    and registers the ``flask worker`` and ``flask purge-jobs`` commands.
+
+    Each web process runs ``JOB_WORKER_THREADS`` worker threads from the first
+    job it queues; set it to 0 when ``flask worker`` processes run the queue.
+    """
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+    _settings.update(
+        worker_threads=app.config.get('JOB_WORKER_THREADS', 1),
+        poll_interval=app.config.get('JOB_POLL_INTERVAL', 1.0),
+        visibility_timeout=app.config.get('JOB_VISIBILITY_TIMEOUT', 60.0),
+        max_attempts=app.config.get('JOB_MAX_ATTEMPTS', 5),
+        retry_delay=app.config.get('JOB_RETRY_DELAY', 5.0),
+    )
+    _pool['app'] = app
+
+    @app.cli.command('worker')
+    @click.option('--threads', default=4, show_default=True, help='Worker threads per process.')
+    @click.option('--processes', default=1, show_default=True, help='Worker processes.')
+    @click.option('--once', is_flag=True, help='Run the jobs that are due, then exit.')
+    def worker_command(threads, processes, once):
+        """Run queued background jobs until interrupted."""
+        if once:
+            click.echo(f'Ran {drain(app)} jobs')
+            return
+        # Jobs queued by this command's own process are left to the pool below
+        _pool['pid'] = os.getpid()
+        ctx = multiprocessing.get_context('fork')
+        stop = ctx.Event()
+        children = [ctx.Process(target=_worker_process, args=(app, threads, stop), name=f'job-worker-{n}')
+                    for n in range(processes)]
+        for child in children:
+            child.start()
+        signal.signal(signal.SIGTERM, _interrupt)
+        click.echo(f'Running jobs with {processes} processes x {threads} threads')
+        try:
+            while any(child.is_alive() for child in children):
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            click.echo('Stopping after the running jobs finish')
+        stop.set()
+        for child in children:
+            child.join()
+
+    @app.cli.command('purge-jobs')
+    @click.option('--days', default=7, show_default=True, help='Keep finished jobs this many days.')
+    def purge_jobs_command(days):
+        """Delete finished background jobs older than --days."""
+        click.echo(f'Deleted {purge_jobs(days)} jobs')
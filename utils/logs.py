@@ -0,0 +1,252 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# One record per request, with method, path, status and latency
+access_logger = logging.getLogger('access')
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+# Request ids accepted from an upstream proxy's X-Request-ID header
+_REQUEST_ID = re.compile(r'^[\w.:-]{1,64}$')
+
+_pipeline = {'listener': None, 'handler': None}
+
+
+def parse_pairs(value):
+    """
+    Parses a 'name=value,name=value' setting such as ``LOG_LEVELS``.
+
+    Returns:
+        dict: name to value, both stripped; empty for a blank setting
+    """
+    pairs = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            name, _, setting = item.partition('=')
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the request id, route and user id of the request that
+    logged them ('-' outside a request). It runs when the record is queued,
+    since the request is gone by the time the logging thread writes it.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            principal = g.get('principal')
+            record.request_id = g.get('request_id', '-')
+            record.route = request.endpoint or '-'
+            record.user_id = principal.id if principal else None
+        else:
+            record.request_id = record.route = '-'
+            record.user_id = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the INFO and DEBUG records of high-volume loggers.
+    Warnings and errors are always kept.
+
+    Within a request one random draw decides for every sampled logger, so a
+    kept request keeps all its lines rather than a scattering of them.
+
+    Args:
+        rates (dict): Logger name (a prefix of the dotted name) to the
+                      fraction of records to keep, e.g. {'access': 0.1}
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {name: float(rate) for name, rate in rates.items()}
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        if has_request_context():
+            if '_log_draw' not in g:
+                g._log_draw = random.random()
+            return g._log_draw < rate
+        return random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: time, level, logger,
+    message, request id, route and user id, any fields passed with
+    ``extra``, and the traceback if there is one.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to the logging thread without formatting them.
+
+    The stock ``QueueHandler`` formats each record before queueing it so it
+    can cross a process boundary; this queue stays in the process, so the
+    record is passed as is and all formatting happens on the logging thread.
+    When the queue is full (the output is stalled) records are dropped and
+    counted instead of blocking requests.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            BackgroundHandler.dropped += 1
+
+
+def configure_logging(level='INFO', levels=None, fmt='json', sample_rates=None,
+                      queue_size=10000, stream=None):
+    """
+    Routes all logging through a queue to a thread that formats and writes
+    it, so a request only pays for building the record. Replaces any earlier
+    configuration, including one from ``logging.basicConfig``.
+
+    Args:
+        level (str): Root logger level
+        levels (dict): Logger name to level, e.g. {'sqlalchemy.engine': 'INFO'}
+        fmt (str): 'json' for one JSON object per line, or 'text'
+        sample_rates (dict): Logger name to fraction of INFO/DEBUG records kept
+        queue_size (int): Records buffered before new ones are dropped
+        stream: Where records are written (default: stderr)
+    """
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    handler = BackgroundHandler(queue.Queue(queue_size))
+    handler.addFilter(SamplingFilter(sample_rates or {}))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, name_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(name_level.upper())
+
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+    _pipeline.update(listener=listener, handler=handler)
+
+
+def shutdown_logging():
+    """Writes out queued records and stops the logging thread, if running."""
+    listener, handler = _pipeline['listener'], _pipeline['handler']
+    if listener is None:
+        return
+    listener.stop()
+    for output in listener.handlers:
+        output.flush()
+    logging.getLogger().removeHandler(handler)
+    _pipeline.update(listener=None, handler=None)
+
+
+atexit.register(shutdown_logging)
+
+
+def init_logging(app):
+    """
+    Configures logging from the ``LOG_*`` settings and logs one access record
+    per request, tagged with a request id that is echoed in the X-Request-ID
+    response header (an id sent by a proxy is kept).
+
+    Requests slower than ``LOG_SLOW_REQUEST_MS`` are logged as warnings, and
+    server errors as errors, so sampling never drops them. ``init_metrics``
+    adds each request's SQL figures to its record.
+    """
+    configure_logging(
+        level=app.config.get('LOG_LEVEL', 'INFO'),
+        levels=parse_pairs(app.config.get('LOG_LEVELS')),
+        fmt=app.config.get('LOG_FORMAT', 'json'),
+        sample_rates=parse_pairs(app.config.get('LOG_SAMPLE_RATES')),
+        queue_size=app.config.get('LOG_QUEUE_SIZE', 10000),
+    )
+    slow_ms = app.config.get('LOG_SLOW_REQUEST_MS', 1000)
+
+    @app.before_request
+    def start_request_log():
+        g._request_started = time.perf_counter()
+        supplied = request.headers.get('X-Request-ID', '')
+        g.request_id = supplied if _REQUEST_ID.match(supplied) else uuid.uuid4().hex
+
+    @app.after_request
+    def write_access_log(response):
+        if '_request_started' not in g:
+            return response
+        duration_ms = round((time.perf_counter() - g._request_started) * 1000, 2)
+        if response.status_code >= 500:
+            level = logging.ERROR
+        elif duration_ms >= slow_ms:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        if access_logger.isEnabledFor(level):
+            access_logger.log(level, '%s %s %s %.1fms', request.method, request.path,
+                              response.status_code, duration_ms, extra={
+                                  'method': request.method,
+                                  'path': request.path,
+                                  'status': response.status_code,
+                                  'duration_ms': duration_ms,
+                                  # SQL count, time and slowest statements from init_metrics
+                                  **g.get('access_log_fields', {}),
+                              })
+        response.headers['X-Request-ID'] = g.request_id
+        return response
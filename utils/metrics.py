@@ -0,0 +1,366 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements kept per request for the slow-request log
+SLOWEST_STATEMENTS = 3
+
+# Flush intervals after which a snapshot that was not rewritten counts as an
+# exited worker's, even if its pid has been reused
+STALE_FLUSHES = 3
+
+# Counters and histograms of exited workers, folded into one snapshot
+EXITED_SNAPSHOT = 'exited.json'
+
+# name: (type, help); histograms use LATENCY_BUCKETS
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time to serve a request, by endpoint.'),
+    'http_requests_in_flight': ('gauge', 'Requests being served right now.'),
+    'db_statements_total': ('counter', 'SQL statements executed, by endpoint.'),
+    'db_statement_seconds_total': ('counter', 'Time spent executing SQL, by endpoint.'),
+    'db_request_sql_seconds': ('histogram', 'SQL time per request, by endpoint.'),
+    'db_pool_checkout_seconds': ('histogram', 'Time a request waited for a database connection.'),
+    'log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full.'),
+    'password_hashes_shed_total': ('counter', 'Sign-ins and sign-ups refused because password hashing was backed up.'),
+}
+
+
+class MetricsStore:
+    """
+    This worker's counters, gauges and histograms, keyed by metric name and
+    a sorted tuple of (label, value) pairs.
+
+    Each worker writes a snapshot to ``directory`` every ``flush_interval``
+    seconds and at exit; ``collect`` merges every worker's snapshot, so any
+    worker can answer a scrape for the whole server. Snapshots of exited
+    workers have their counters and histograms folded into one
+    ``EXITED_SNAPSHOT`` and are deleted, so totals never go backwards and the
+    directory holds one file per live worker; their gauges are dropped.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.flush_interval = 5.0
+        self._values = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+        # SQL statements of this process's latest request, read by benchmarks.load
+        self.last_request_statements = 0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(sorted(labels)))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels)))
+        with self._lock:
+            buckets = self._histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[len(LATENCY_BUCKETS)] += 1
+            # The last slot holds the sum; the count is the sum of the buckets
+            buckets[-1] += value
+
+    def snapshot(self):
+        from utils.logs import BackgroundHandler
+
+        with self._lock:
+            self._values[('log_records_dropped_total', ())] = BackgroundHandler.dropped
+            return {
+                'pid': os.getpid(),
+                'values': [[name, labels, value] for (name, labels), value in self._values.items()],
+                'histograms': [[name, labels, buckets] for (name, labels), buckets in self._histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Writes this worker's snapshot if ``flush_interval`` has passed (or ``force``)."""
+        if self.directory is None:
+            return
+        # Request threads and the flusher thread share one tmp file per process
+        with self._flush_lock:
+            now = time.monotonic()
+            if not force and now - self._flushed_at < self.flush_interval:
+                return
+            self._flushed_at = now
+            self._start_flusher()
+            os.makedirs(self.directory, exist_ok=True)
+            _write(os.path.join(self.directory, f'{os.getpid()}.json'), self.snapshot())
+
+    def _start_flusher(self):
+        # Started on first flush so it runs in each gunicorn worker; it keeps
+        # an idle worker's snapshot fresh so it is not taken for an exited one
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name='metrics-flusher', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush(force=True)
+            except OSError:
+                logger.exception('Writing the metrics snapshot failed')
+
+    def retire_exited(self):
+        """
+        Folds the snapshots of exited workers into ``EXITED_SNAPSHOT`` and
+        deletes them. A snapshot is an exited worker's when its process is
+        gone or it was not rewritten for ``STALE_FLUSHES`` flush intervals.
+        """
+        stale_before = time.time() - STALE_FLUSHES * self.flush_interval
+        exited_path = os.path.join(self.directory, EXITED_SNAPSHOT)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            # One worker at a time, so no snapshot is folded in twice
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = {}
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                if os.path.basename(path) == EXITED_SNAPSHOT:
+                    continue
+                snapshot = _read(path)
+                try:
+                    stale = os.path.getmtime(path) < stale_before
+                except OSError:
+                    continue
+                if snapshot is not None and snapshot['pid'] != os.getpid() \
+                        and (stale or not _pid_alive(snapshot['pid'])):
+                    exited[path] = dict(snapshot, pid=None)
+            if not exited:
+                return
+            previous = _read(exited_path)
+            values, histograms = _merge(([previous] if previous else []) + list(exited.values()))
+            _write(exited_path, {
+                'pid': None,
+                'values': [[name, labels, value] for (name, labels), value in values.items()],
+                'histograms': [[name, labels, buckets] for (name, labels), buckets in histograms.items()],
+            })
+            for path in exited:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        """
+        Merges the snapshots of every worker, including this one's current state.
+
+        Returns:
+            tuple: (values, histograms) dicts keyed like the store's own
+        """
+        if not self.directory:
+            return _merge([self.snapshot()])
+        self.flush(force=True)
+        self.retire_exited()
+        snapshots = [_read(path) for path in glob.glob(os.path.join(self.directory, '*.json'))]
+        return _merge([snapshot for snapshot in snapshots if snapshot is not None])
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, snapshot):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(path + '.tmp', path)
+
+
+def _merge(snapshots):
+    """Sums snapshots into (values, histograms), leaving out gauges of exited workers."""
+    values, histograms = {}, {}
+    for snapshot in snapshots:
+        alive = snapshot['pid'] is not None and _pid_alive(snapshot['pid'])
+        for name, labels, value in snapshot['values']:
+            if METRICS[name][0] == 'gauge' and not alive:
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, buckets in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [0] * len(buckets))
+            histograms[key] = [a + b for a, b in zip(merged, buckets)]
+    return values, histograms
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = MetricsStore()
+
+atexit.register(lambda: metrics.flush(force=True))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_metrics():
+    """
+    Returns every worker's metrics in the Prometheus text exposition format.
+    """
+    values, histograms = metrics.collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), buckets in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {buckets[-1]}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        else:
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['_metrics_started'] = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if not has_request_context() or '_metrics_started' not in g:
+        return
+    g._sql_count += 1
+    g._sql_seconds += elapsed
+    slowest = g._sql_slowest
+    if len(slowest) < SLOWEST_STATEMENTS or elapsed > slowest[-1][0]:
+        slowest.append((elapsed, ' '.join(statement.split())[:300]))
+        slowest.sort(reverse=True)
+        del slowest[SLOWEST_STATEMENTS:]
+
+
+def _time_checkouts(engine):
+    """Wraps ``engine.raw_connection`` to time how long a pool checkout takes."""
+    raw_connection = engine.raw_connection
+    if getattr(raw_connection, '_timed', False):
+        return
+
+    @wraps(raw_connection)
+    def timed_raw_connection(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            if has_request_context():
+                metrics.observe('db_pool_checkout_seconds', (), time.perf_counter() - started)
+    timed_raw_connection._timed = True
+    engine.raw_connection = timed_raw_connection
+
+
+def init_metrics(app):
+    """
+    Records request latency, status and in-flight counts per endpoint, and
+    each request's SQL statement count, SQL time and pool checkout wait.
+
+    Worker snapshots are shared through ``METRICS_DIR`` (one JSON file per
+    process, written every ``METRICS_FLUSH_INTERVAL`` seconds). Each request's
+    access log record gets its statement count and SQL time, and requests
+    slower than ``LOG_SLOW_REQUEST_MS`` their slowest statements too. Call it
+    after ``init_logging`` so the access log runs after this.
+    """
+    from app import db
+
+    metrics.directory = app.config.get('METRICS_DIR') or None
+    metrics.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+    slow_ms = app.config.get('LOG_SLOW_REQUEST_MS', 1000)
+
+    for fn, name in ((_before_execute, 'before_cursor_execute'), (_after_execute, 'after_cursor_execute')):
+        if not event.contains(Engine, name, fn):
+            event.listen(Engine, name, fn)
+    with app.app_context():
+        for engine in db.engines.values():
+            _time_checkouts(engine)
+
+    @app.before_request
+    def start_request_metrics():
+        g._metrics_started = time.perf_counter()
+        g._sql_count = 0
+        g._sql_seconds = 0.0
+        g._sql_slowest = []
+        metrics.inc('http_requests_in_flight')
+
+    @app.after_request
+    def record_request_metrics(response):
+        if '_metrics_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g._metrics_started
+        endpoint = request.endpoint or 'unmatched'
+        labels = [('endpoint', endpoint)]
+        metrics.inc('http_requests_total', labels + [('method', request.method),
+                                                     ('status', str(response.status_code))])
+        metrics.observe('http_request_duration_seconds', labels, elapsed)
+        metrics.inc('db_statements_total', labels, g._sql_count)
+        metrics.inc('db_statement_seconds_total', labels, g._sql_seconds)
+        metrics.observe('db_request_sql_seconds', labels, g._sql_seconds)
+        metrics.last_request_statements = g._sql_count
+
+        # Written by the access log, which runs after this hook
+        g.access_log_fields = {'sql_count': g._sql_count, 'sql_ms': round(g._sql_seconds * 1000, 2)}
+        if elapsed * 1000 >= slow_ms:
+            g.access_log_fields['slowest_statements'] = [
+                {'ms': round(seconds * 1000, 2), 'sql': sql} for seconds, sql in g._sql_slowest]
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('_metrics_started', None) is not None:
+            metrics.inc('http_requests_in_flight', value=-1)
+            try:
+                metrics.flush()
+            except OSError:
+                # The request is done; the next flush writes these numbers too
+                logger.exception('Writing the metrics snapshot failed')
@@ -0,0 +1,142 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """
+    One page of a keyset (cursor) paginated query.
+
+    ``next_cursor``/``prev_cursor`` are opaque strings to pass back as the
+    ``cursor`` query argument; they are None when there is no such page.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _key_value(row, column):
+    value = getattr(row, column.key)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(row, keys, direction):
+    """
+    Encodes the key values of ``row`` into an opaque, URL-safe cursor.
+
+    Args:
+        row: The model instance at the page boundary
+        keys (list): Columns the listing is ordered by
+        direction (str): 'next' to continue after the row, 'prev' to go before it
+
+    Returns:
+        str: The cursor
+    """
+    payload = {'d': direction, 'k': [_key_value(row, column) for column in keys]}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """
+    Decodes a cursor produced by ``encode_cursor``.
+
+    Args:
+        cursor (str): The cursor from the request
+        keys (list): Columns the listing is ordered by
+
+    Returns:
+        tuple: (direction, key values) or None if the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction = payload['d']
+        values = payload['k']
+        if direction not in ('next', 'prev') or len(values) != len(keys):
+            return None
+        decoded = []
+        for column, value in zip(keys, values):
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            decoded.append(value)
+        return direction, decoded
+    except (ValueError, TypeError, KeyError, NotImplementedError):
+        return None
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=20, descending=True):
+    """
+    Paginates ``query`` by seeking past the last seen key instead of using OFFSET,
+    so every page costs the same no matter how deep it is.
+
+    The keys must form a unique ordering (end with the primary key) and should
+    be backed by an index that also covers any filters already on the query.
+
+    Args:
+        query: A filtered query without ORDER BY/LIMIT
+        keys (list): Columns to order by, e.g. [Order.created_at, Order.id]
+        cursor (str): Cursor from a previous page, or None for the first page
+        per_page (int): Number of items per page
+        descending (bool): Whether the listing is ordered newest/highest first
+
+    Returns:
+        KeysetPage: The requested page with its neighbouring cursors
+    """
+    direction = 'next'
+    if cursor:
+        decoded = decode_cursor(cursor, keys)
+        if decoded is None:
+            abort(400)
+        direction, values = decoded
+        key_tuple = tuple_(*keys)
+        seek_forward = (direction == 'next') == descending
+        if seek_forward:
+            query = query.filter(key_tuple < tuple_(*values))
+        else:
+            query = query.filter(key_tuple > tuple_(*values))
+
+    # Walk backwards for 'prev' pages, then flip the rows back into display order
+    ascending = (direction == 'prev') == descending
+    order = [column.asc() if ascending else column.desc() for column in keys]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage([])
+
+    if direction == 'next':
+        has_next, has_prev = has_more, bool(cursor)
+    else:
+        has_next, has_prev = True, has_more
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], keys, 'next') if has_next else None,
+        prev_cursor=encode_cursor(rows[0], keys, 'prev') if has_prev else None,
+    )
@@ -0,0 +1,133 @@
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from utils.metrics import metrics
+
+_settings = {
+    'method': 'scrypt',
+    'workers': 2,
+    'queue': 8,
+    'timeout': 5.0,
+}
+
+_pool = {'executor': None, 'slots': None, 'pid': None, 'target': None, 'lock': threading.Lock()}
+
+
+class PasswordHashingBusy(RuntimeError):
+    """Raised when too many passwords are already waiting to be hashed; answer with a 429."""
+
+
+def _exit_with_parent(parent):
+    # A hashing process outlives a killed web worker otherwise
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1.0)
+        os._exit(0)
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
+
+
+def _executor():
+    # One pool per process, so forked gunicorn workers never share the
+    # master's. Hashing processes are forked rather than spawned so they
+    # start fast and don't re-run the server's main module; they only ever
+    # call werkzeug's hash functions. ``init_passwords`` creates the pool
+    # before the app starts any thread; it is only created here when a
+    # process was forked from one that already had it, or the pool broke.
+    if _pool['pid'] != os.getpid():
+        with _pool['lock']:
+            if _pool['pid'] != os.getpid():
+                executor = ProcessPoolExecutor(_settings['workers'], mp_context=multiprocessing.get_context('fork'),
+                                               initializer=_exit_with_parent, initargs=(os.getpid(),))
+                # Forked processes start all hashing processes on first submit
+                executor.submit(int).result()
+                # Stopped before multiprocessing waits for child processes at
+                # exit, which would otherwise wait on the idle hashing processes
+                # forever when this process is itself a multiprocessing child
+                multiprocessing.util.Finalize(executor, executor.shutdown,
+                                              kwargs={'cancel_futures': True}, exitpriority=10)
+                _pool['executor'] = executor
+                _pool['slots'] = threading.BoundedSemaphore(_settings['workers'] + _settings['queue'])
+                _pool['pid'] = os.getpid()
+    return _pool['executor'], _pool['slots']
+
+
+def _run(fn, *args):
+    """
+    Runs ``fn`` in the hashing pool and waits for its result. At most
+    ``PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE`` calls may be running or
+    waiting per process; any more are refused straight away.
+    """
+    if not _settings['workers']:
+        return fn(*args)
+    executor, slots = _executor()
+    if not slots.acquire(blocking=False):
+        metrics.inc('password_hashes_shed_total')
+        raise PasswordHashingBusy('Password hashing queue is full')
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(_settings['timeout'])
+    except FutureTimeout:
+        metrics.inc('password_hashes_shed_total')
+        raise PasswordHashingBusy('Password hashing timed out')
+    except BrokenProcessPool:
+        # A hashing process died; start a new pool on the next call
+        with _pool['lock']:
+            _pool['pid'] = None
+        raise
+
+
+def hash_password(password):
+    """Hashes a password with ``PASSWORD_HASH_METHOD`` in the hashing pool."""
+    return _run(generate_password_hash, password, _settings['method'])
+
+
+def check_password(stored, password):
+    """Checks a password against a stored hash in the hashing pool."""
+    return _run(check_password_hash, stored, password)
+
+
+def needs_rehash(stored):
+    """
+    Whether a stored hash was made with other parameters than
+    ``PASSWORD_HASH_METHOD`` (another algorithm, or fewer iterations).
+
+    Raises:
+        PasswordHashingBusy: If the target is not known yet and the hashing
+            pool is full
+    """
+    if _pool['target'] is None:
+        # 'scrypt' is stored as 'scrypt:32768:8:1'; hash once, in the pool like
+        # any other hash, to learn the full form
+        _pool['target'] = hash_password('').split('$', 1)[0]
+    return stored.split('$', 1)[0] != _pool['target']
+
+
+def init_passwords(app):
+    """
+    Sizes the password hashing pool from ``PASSWORD_HASH_WORKERS`` (0 hashes
+    on the request thread), ``PASSWORD_HASH_QUEUE`` and ``PASSWORD_HASH_TIMEOUT``,
+    and sets the target ``PASSWORD_HASH_METHOD``. Call it before anything
+    that starts a thread: the hashing processes are forked here, so they
+    copy no lock another thread holds.
+    """
+    _settings.update(
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        queue=app.config.get('PASSWORD_HASH_QUEUE', 8),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 5.0),
+    )
+    _pool['target'] = None
+    if _settings['workers']:
+        _executor()
@@ -1,4 +1,12 @@
-import re
+import bisect
+import csv
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+import click
+from flask import current_app
 
 # Dictionary of Indian states and their PIN code prefixes
 INDIAN_PIN_PREFIXES = {
@@ -25,49 +33,226 @@ INDIAN_PIN_PREFIXES = {
     'Chhattisgarh': '49'
 }
 
+PincodeInfo = namedtuple('PincodeInfo', ['pincode', 'state', 'district'])
+
+def _compile_prefixes(prefixes):
+    """
+    Compiles the prefix dictionary into a 100-entry list indexed by the
+    two-digit prefix.
+
+    Some prefixes are shared (Bihar/Jharkhand on 81-83, Madhya Pradesh/
+    Chhattisgarh on 49); the state listed first in the dictionary wins, so
+    lookups are deterministic.
+    """
+    states = [None] * 100
+    for state, prefix_list in prefixes.items():
+        for prefix in prefix_list.split(','):
+            index = int(prefix)
+            if states[index] is None:
+                states[index] = state
+    return states
+
+_PREFIX_STATES = _compile_prefixes(INDIAN_PIN_PREFIXES)
+
+def _prefix_index(pincode):
+    """Returns the two-digit prefix as an int, or None if this is not a 6-digit PIN code."""
+    if not isinstance(pincode, str) or len(pincode) != 6 or not pincode.isascii() or not pincode.isdigit():
+        return None
+    return int(pincode[:2])
+
+# Full PIN code directory
+#
+# An optional binary file mapping every 6-digit PIN code to its district and
+# state, built by ``build_pincode_directory``. Layout (little endian):
+#
+#   header   b'PIN1', record count (uint32), string count (uint32)
+#   records  sorted by PIN: pin (uint32), district string id (uint16), state string id (uint16)
+#   strings  length (uint16) + UTF-8 bytes, one after another
+#
+# The file is mmapped and searched with bisect, so it is shared between
+# worker processes through the page cache and never parsed in full.
+
+_MAGIC = b'PIN1'
+_HEADER = struct.Struct('<4sII')
+_RECORD = struct.Struct('<IHH')
+_LENGTH = struct.Struct('<H')
+
+class PincodeDirectory:
+    """Read-only view of a PIN code directory file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, string_count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f'{path} is not a PIN code directory file')
+
+        self._strings = []
+        offset = _HEADER.size + self._count * _RECORD.size
+        for _ in range(string_count):
+            (length,) = _LENGTH.unpack_from(self._map, offset)
+            offset += _LENGTH.size
+            self._strings.append(self._map[offset:offset + length].decode('utf-8'))
+            offset += length
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        # Lets bisect search the PIN column in place
+        return _RECORD.unpack_from(self._map, _HEADER.size + index * _RECORD.size)[0]
+
+    def lookup(self, pin):
+        """
+        Args:
+            pin (int): The PIN code as an integer
+
+        Returns:
+            tuple: (state, district) or None if the PIN code is not listed
+        """
+        index = bisect.bisect_left(self, pin)
+        if index == self._count:
+            return None
+        found, district_id, state_id = _RECORD.unpack_from(self._map, _HEADER.size + index * _RECORD.size)
+        if found != pin:
+            return None
+        return self._strings[state_id], self._strings[district_id]
+
+_directory = {'path': None, 'value': None}
+
+def get_pincode_directory():
+    """
+    Returns the PIN code directory named by the app's ``PINCODE_DIRECTORY``
+    setting, opening it on first use, or None when none is configured.
+    """
+    path = current_app.config.get('PINCODE_DIRECTORY') or None
+    if path != _directory['path']:
+        _directory['value'] = PincodeDirectory(path) if path and os.path.exists(path) else None
+        _directory['path'] = path
+    return _directory['value']
+
+def build_pincode_directory(rows, path):
+    """
+    Writes a directory file from (pincode, district, state) rows.
+
+    Duplicate PIN codes (one per post office in India Post's data) keep the
+    first row seen.
+
+    Args:
+        rows (iterable): (pincode, district, state) tuples
+        path (str): Output file path
+
+    Returns:
+        int: Number of PIN codes written
+    """
+    entries = {}
+    strings = {}
+    for pincode, district, state in rows:
+        pincode = str(pincode).strip()
+        if _prefix_index(pincode) is None or int(pincode) in entries:
+            continue
+        district = district.strip().title()
+        state = state.strip().title()
+        for value in (district, state):
+            strings.setdefault(value, len(strings))
+        entries[int(pincode)] = (strings[district], strings[state])
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(entries), len(strings)))
+        for pin in sorted(entries):
+            f.write(_RECORD.pack(pin, *entries[pin]))
+        for value in strings:
+            encoded = value.encode('utf-8')
+            f.write(_LENGTH.pack(len(encoded)))
+            f.write(encoded)
+    return len(entries)
+
+def lookup_pincode(pincode):
+    """
+    Looks up the state, and the district when the full directory is available.
+
+    Args:
+        pincode (str): The PIN code
+
+    Returns:
+        PincodeInfo: The match, or None if the PIN code is not valid
+    """
+    prefix = _prefix_index(pincode)
+    if prefix is None or _PREFIX_STATES[prefix] is None:
+        return None
+
+    directory = get_pincode_directory()
+    if directory is None:
+        return PincodeInfo(pincode, _PREFIX_STATES[prefix], None)
+
+    found = directory.lookup(int(pincode))
+    if found is None:
+        return None
+    state, district = found
+    return PincodeInfo(pincode, state, district)
+
 def is_valid_pincode(pincode):
     """
     Validates if the given string is a valid Indian PIN code.
     Valid Indian PIN codes are 6 digits and start with certain prefixes.
-    
+    When the full directory is configured the PIN code must also be listed in it.
+
     Args:
         pincode (str): The PIN code to validate
-        
+
     Returns:
         bool: True if the PIN code is valid, False otherwise
     """
-    # Check if it's a 6-digit string
-    if not pincode or not re.match(r'^\d{6}$', pincode):
-        return False
-    
-    # Check if it starts with a valid prefix
-    prefix_valid = False
-    for prefixes in INDIAN_PIN_PREFIXES.values():
-        for prefix in prefixes.replace(' ', '').split(','):
-            if pincode.startswith(prefix):
-                prefix_valid = True
-                break
-        if prefix_valid:
-            break
-    
-    return prefix_valid
+    return lookup_pincode(pincode) is not None
 
 def get_state_from_pincode(pincode):
     """
     Returns the state name for a given PIN code.
-    
+
     Args:
         pincode (str): The PIN code
-        
+
     Returns:
         str: The state name or None if not found
     """
-    if not is_valid_pincode(pincode):
-        return None
-    
-    for state, prefixes in INDIAN_PIN_PREFIXES.items():
-        for prefix in prefixes.replace(' ', '').split(','):
-            if pincode.startswith(prefix):
-                return state
-    
-    return None
+    info = lookup_pincode(pincode)
+    return info.state if info else None
+
+def validate_pincodes(pincodes):
+    """
+    Validates many PIN codes in one call.
+
+    Args:
+        pincodes (iterable): PIN codes to validate
+
+    Returns:
+        list: One dict per input with 'pincode', 'valid', 'state' and 'district'
+    """
+    results = []
+    for pincode in pincodes:
+        info = lookup_pincode(pincode)
+        results.append({
+            'pincode': pincode,
+            'valid': info is not None,
+            'state': info.state if info else None,
+            'district': info.district if info else None,
+        })
+    return results
+
+def init_pincodes(app):
+    """Registers the ``flask build-pincodes`` command."""
+
+    @app.cli.command('build-pincodes')
+    @click.argument('csv_path', metavar='CSV', type=click.Path(exists=True, dir_okay=False))
+    @click.argument('output', type=click.Path(dir_okay=False, writable=True))
+    def build_pincodes_command(csv_path, output):
+        """
+        Build a PIN code directory file from a CSV with 'pincode', 'district'
+        and 'statename' columns (India Post format). Point PINCODE_DIRECTORY
+        at OUTPUT to use it.
+        """
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            fields = {name.lower(): name for name in reader.fieldnames}
+            rows = ((row[fields['pincode']], row[fields['district']], row[fields['statename']]) for row in reader)
+            click.echo(f'Wrote {build_pincode_directory(rows, output)} PIN codes to {output}')
@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+import click
+from flask import g, session
+
+from app import db
+from utils.cache import LRUCache, bump_shared_version, shared_version
+from utils.queries import unbudgeted
+
+# What permission checks and templates need to know about the logged-in user
+Principal = namedtuple('Principal', ['id', 'name', 'email', 'is_admin', 'auth_version'])
+
+# Session keys that belong to a login, cleared together on logout or revocation
+SESSION_KEYS = ('user_id', 'auth_version', 'default_address', 'cart_count')
+
+principal_cache = LRUCache(maxsize=10000, ttl=300)
+
+
+def _load_principal(user_id, auth_version):
+    from models import User
+
+    with unbudgeted():
+        row = db.session.query(User.id, User.name, User.email, User.is_admin, User.auth_version) \
+            .filter_by(id=user_id).first()
+    if row is None or row.auth_version != auth_version:
+        return None
+    return Principal(*row)
+
+
+def current_principal():
+    """
+    Returns the logged-in user as a ``Principal``, or None for anonymous
+    requests and for sessions whose user was deleted or had their access
+    changed since logging in (those sessions are cleared).
+
+    The lookup runs at most once per request and is cached across requests,
+    keyed by user id, the auth version stored in the session at login and the
+    shared 'auth' version, so a ``bump_auth_version`` on any worker invalidates
+    every worker's entries.
+    """
+    if 'principal' in g:
+        return g.principal
+
+    principal = None
+    user_id = session.get('user_id')
+    if user_id is not None:
+        auth_version = session.get('auth_version', 0)
+        key = (shared_version('auth'), user_id, auth_version)
+        principal = principal_cache.get_or_set(key, lambda: _load_principal(user_id, auth_version))
+        if principal is None:
+            logout_user()
+
+    g.principal = principal
+    return principal
+
+
+def login_user(user):
+    """Starts a session for ``user``."""
+    session['user_id'] = user.id
+    session['auth_version'] = user.auth_version or 0
+    session.pop('cart_count', None)
+    g.pop('principal', None)
+
+
+def logout_user():
+    for key in SESSION_KEYS:
+        session.pop(key, None)
+    g.principal = None
+
+
+def bump_auth_version(user_id):
+    """
+    Ends every existing session of a user and drops their cached principal on
+    all workers. Call it inside the transaction that changes the user's access
+    (demotion, promotion, deletion), before deleting the row.
+    """
+    from models import User
+
+    User.query.filter_by(id=user_id).update(
+        {'auth_version': User.auth_version + 1}, synchronize_session=False)
+    bump_shared_version('auth')
+
+
+def init_principal(app):
+    """
+    Makes the logged-in user available to templates as ``principal`` and
+    registers the ``flask set-admin`` command.
+    """
+
+    @app.context_processor
+    def inject_principal():
+        return {'principal': current_principal()}
+
+    @app.cli.command('set-admin')
+    @click.argument('email')
+    @click.option('--revoke', is_flag=True, help='Remove admin access instead of granting it.')
+    def set_admin_command(email, revoke):
+        """Grant or revoke admin access, signing the user out everywhere."""
+        from models import User
+        from utils.rollups import count_customers
+
+        user = User.query.filter_by(email=email).first()
+        if not user:
+            raise click.ClickException(f'No user with email {email}')
+        if bool(user.is_admin) == revoke:
+            count_customers(1 if revoke else -1)
+        user.is_admin = not revoke
+        bump_auth_version(user.id)
+        db.session.commit()
+        click.echo(f'{email} is {"no longer" if revoke else "now"} an admin')
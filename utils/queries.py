@@ -0,0 +1,149 @@
+import logging
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload, selectinload
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised when a route issues more SELECTs than its declared budget."""
+
+
+def _loader_for(path, entity):
+    """
+    Builds a loader option chain for a dotted relationship path.
+
+    Many-to-one hops are joined into the parent SELECT, collections are
+    fetched with one extra ``SELECT ... IN`` per hop.
+
+    Args:
+        path (str): Relationship path such as 'items.product.category'
+        entity: The mapped class the path starts from
+
+    Returns:
+        The loader option to pass to ``Query.options``
+    """
+    option = None
+    for name in path.split('.'):
+        attr = getattr(entity, name)
+        prop = attr.property
+        if option is None:
+            option = selectinload(attr) if prop.uselist else joinedload(attr)
+        else:
+            option = option.selectinload(attr) if prop.uselist else option.joinedload(attr)
+        entity = prop.mapper.class_
+    return option
+
+
+def eager(query, *paths):
+    """
+    Declares the relationships a view is going to touch so they are loaded
+    up front instead of one lazy SELECT per row.
+
+    Args:
+        query: A ``Model.query`` style query
+        *paths (str): Dotted relationship paths, e.g. 'user' or 'product.category'
+
+    Returns:
+        The query with the matching loader options applied
+    """
+    entity = query.column_descriptions[0]['entity']
+    return query.options(*[_loader_for(path, entity) for path in paths])
+
+
+def count_by(column, ids):
+    """
+    Counts rows grouped by ``column`` for the given ids in a single query.
+
+    Args:
+        column: Foreign key column to group on, e.g. ``Order.user_id``
+        ids (iterable): Values of ``column`` to count for
+
+    Returns:
+        dict: Mapping of id to row count; ids with no rows are omitted
+    """
+    from app import db
+
+    ids = list(ids)
+    if not ids:
+        return {}
+    rows = db.session.query(column, db.func.count()).filter(column.in_(ids)).group_by(column).all()
+    return dict(rows)
+
+
+def query_budget(limit):
+    """
+    Declares the maximum number of SELECT statements a route may issue per
+    request. Writes are not counted, only the reads that lazy loading multiplies.
+
+    Args:
+        limit (int): Statement budget for the decorated view
+    """
+    def decorator(f):
+        f._query_budget = limit
+        return f
+    return decorator
+
+
+@contextmanager
+def unbudgeted():
+    """
+    Leaves the SELECTs issued inside the block out of the route's budget. Meant
+    for shared reads whose cost is spread over many requests (cache version
+    checks, the logged-in user, layout menus), not for a view's own queries.
+    """
+    if not has_request_context():
+        yield
+        return
+    g._query_paused = g.get('_query_paused', 0) + 1
+    try:
+        yield
+    finally:
+        g._query_paused -= 1
+
+
+def query_count():
+    """The number of SELECTs counted against the current request's budget so far."""
+    return g.get('_query_count', 0)
+
+
+def discard_queries(since):
+    """
+    Leaves the SELECTs counted after ``since`` (a ``query_count``) out of the
+    route's budget, e.g. those of a failed attempt that is being retried.
+    """
+    g._query_count = since
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and not g.get('_query_paused') and statement.lstrip()[:6].upper() == 'SELECT':
+        g._query_count = g.get('_query_count', 0) + 1
+
+
+def init_query_budget(app):
+    """
+    Counts SELECT statements per request and checks them against the budget
+    declared with ``query_budget``.
+
+    Over-budget requests raise ``QueryBudgetExceeded`` when
+    ``QUERY_BUDGET_ENFORCE`` is set (defaults to on in debug and testing),
+    otherwise they are logged as warnings.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    @app.after_request
+    def check_query_budget(response):
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, '_query_budget', None)
+        count = g.get('_query_count', 0)
+        if limit is not None and count > limit:
+            message = f'{request.endpoint} issued {count} queries (budget {limit})'
+            enforce = current_app.config.get('QUERY_BUDGET_ENFORCE', app.debug or app.testing)
+            if enforce:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,250 @@
+import heapq
+import logging
+import math
+import time
+
+import click
+from sqlalchemy import and_, delete, insert, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from utils.jobs import enqueue, job
+from utils.rollups import upsert_counts
+
+logger = logging.getLogger(__name__)
+
+# Neighbours stored per product; the product page shows 4, the cart up to 4
+TOP_K = 8
+
+# Pairs bought together in fewer orders than this are treated as noise
+MIN_TOGETHER = 2
+
+# Anchor products whose neighbours one rebuild query computes
+CHUNK_SIZE = 2000
+
+# Orders for a product within this many seconds share one recount
+REFRESH_DELAY = 60
+
+# Products per IN list
+BATCH_SIZE = 500
+
+
+def _batched(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _recount_orders():
+    """
+    Regenerates ProductOrderCount from OrderItem.
+
+    Returns:
+        dict: {product id: number of orders containing it}
+    """
+    from models import OrderItem, ProductOrderCount
+
+    table = ProductOrderCount.__table__
+    db.session.execute(delete(ProductOrderCount))
+    db.session.execute(insert(table).from_select([table.c.product_id, table.c.orders], select(
+        OrderItem.product_id, db.func.count(db.distinct(OrderItem.order_id)),
+    ).group_by(OrderItem.product_id)))
+    return dict(db.session.query(ProductOrderCount.product_id, ProductOrderCount.orders))
+
+
+def _order_counts(product_ids):
+    """Returns {product id: number of orders containing it} from ProductOrderCount."""
+    from models import ProductOrderCount
+
+    counts = {}
+    for batch in _batched(product_ids):
+        counts.update(db.session.query(ProductOrderCount.product_id, ProductOrderCount.orders)
+                      .filter(ProductOrderCount.product_id.in_(batch)))
+    return counts
+
+
+def _co_purchases(anchors):
+    """
+    Counts, per anchor product and per other product, the orders that hold
+    both: the sparse item-item co-occurrence matrix, computed by the database
+    as a grouped self-join on order_id.
+
+    This is the product of the sparse order x product matrix with its own
+    transpose, done in SQL rather than with NumPy/SciPy sparse matrices on
+    purpose: neither is a dependency, building the matrix in Python would
+    load every order line into each process that rebuilds (gigabytes at 10M
+    lines), and the database already holds the data indexed by order_id. One
+    chunk of anchors at a time comes back already summed, so only the pairs
+    that clear ``MIN_TOGETHER`` cross the wire.
+
+    Args:
+        anchors (callable): Given the anchor OrderItem alias, returns the
+                            condition that selects the anchor products
+
+    Returns:
+        Select: Rows of (anchor id, other id, orders together)
+    """
+    from models import OrderItem
+
+    anchor, other = aliased(OrderItem), aliased(OrderItem)
+    together = db.func.count(db.distinct(anchor.order_id))
+    return select(anchor.product_id, other.product_id, together) \
+        .join(other, and_(other.order_id == anchor.order_id, other.product_id != anchor.product_id)) \
+        .where(anchors(anchor)) \
+        .group_by(anchor.product_id, other.product_id) \
+        .having(together >= MIN_TOGETHER)
+
+
+def _top_neighbours(rows, orders):
+    """
+    Keeps the ``TOP_K`` most similar products per anchor. Similarity is the
+    cosine of the two products' order vectors: orders together divided by
+    the geometric mean of each product's order count, so best sellers do
+    not crowd out everything else.
+
+    Returns:
+        dict: {anchor id: [(score, orders together, neighbour id), ...] best first}
+    """
+    heaps = {}
+    for anchor_id, neighbour_id, together in rows:
+        # A count can trail the order history briefly, but never below ``together``
+        score = together / math.sqrt(max(orders.get(anchor_id, 0), together) *
+                                     max(orders.get(neighbour_id, 0), together))
+        heap = heaps.setdefault(anchor_id, [])
+        entry = (score, together, neighbour_id)
+        if len(heap) < TOP_K:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return {anchor_id: sorted(heap, reverse=True) for anchor_id, heap in heaps.items()}
+
+
+def _store(anchor_ids, neighbours):
+    from models import ProductNeighbour
+
+    for batch in _batched(anchor_ids):
+        db.session.execute(delete(ProductNeighbour).where(ProductNeighbour.product_id.in_(batch)))
+    rows = [{'product_id': anchor_id, 'rank': rank, 'neighbour_id': neighbour_id,
+             'score': score, 'together': together}
+            for anchor_id, top in neighbours.items()
+            for rank, (score, together, neighbour_id) in enumerate(top)]
+    if rows:
+        db.session.execute(insert(ProductNeighbour), rows)
+
+
+def rebuild_recommendations(log=logger.info):
+    """
+    Recomputes every product's neighbours from the whole order history,
+    ``CHUNK_SIZE`` anchor products per query and transaction, so memory stays
+    bounded by a chunk's pairs however many orders there are. Also recounts
+    each product's orders, which new orders then add to.
+
+    Returns:
+        int: Number of products that have neighbours
+    """
+    from models import ProductNeighbour, ProductOrderCount
+
+    started = time.perf_counter()
+    orders = _recount_orders()
+    db.session.commit()
+    anchor_ids = sorted(orders)
+    stored = 0
+    for start in range(0, len(anchor_ids), CHUNK_SIZE):
+        chunk = anchor_ids[start:start + CHUNK_SIZE]
+        low, high = chunk[0], chunk[-1]
+        # A server-side cursor on Postgres, so the chunk's pairs are not all buffered client-side
+        rows = db.session.execute(_co_purchases(lambda anchor: anchor.product_id.between(low, high)),
+                                  execution_options={'stream_results': True, 'yield_per': 10000})
+        neighbours = _top_neighbours(rows, orders)
+        _store(chunk, neighbours)
+        db.session.commit()
+        stored += len(neighbours)
+        log(f'Recommendations: {start + len(chunk):,} of {len(anchor_ids):,} products '
+            f'in {time.perf_counter() - started:.1f}s')
+    # Products that no longer appear in any order
+    db.session.execute(delete(ProductNeighbour).where(
+        ProductNeighbour.product_id.not_in(select(ProductOrderCount.product_id))))
+    db.session.commit()
+    return stored
+
+
+def refresh_neighbours(product_ids):
+    """Recomputes the neighbours of the given products inside the caller's transaction."""
+    product_ids = sorted(set(product_ids))
+    rows = db.session.execute(_co_purchases(lambda anchor: anchor.product_id.in_(product_ids))).all()
+    orders = _order_counts(set(product_ids) | {row[1] for row in rows})
+    _store(product_ids, _top_neighbours(rows, orders))
+
+
+def refresh_neighbours_later(product_ids):
+    """
+    Queues a recount of each product's neighbours inside the caller's
+    transaction. Orders for a product within ``REFRESH_DELAY`` seconds of
+    each other share one recount.
+    """
+    window = int(time.time() // REFRESH_DELAY)
+    for product_id in sorted(set(product_ids)):
+        enqueue('recommendations.refresh', {'product_id': product_id},
+                key=f'recommendations.refresh:{product_id}:{window}', delay=REFRESH_DELAY)
+
+
+@job('recommendations.order_placed', events=['order.placed'])
+def order_placed(product_ids, **event):
+    """Counts a new order for each of its products and queues a recount of their neighbours."""
+    from models import ProductOrderCount
+
+    for product_id in sorted(set(product_ids)):
+        upsert_counts(ProductOrderCount, {'product_id': product_id}, {'orders': 1})
+    refresh_neighbours_later(product_ids)
+
+
+@job('recommendations.refresh')
+def refresh_product_neighbours(product_id):
+    """Recomputes one product's neighbours."""
+    refresh_neighbours([product_id])
+
+
+def also_bought(product_id, limit=4):
+    """
+    The products most often bought with ``product_id``, best first, in one
+    primary key range lookup.
+    """
+    from models import Product, ProductNeighbour
+
+    return Product.query.join(ProductNeighbour, ProductNeighbour.neighbour_id == Product.id) \
+        .filter(ProductNeighbour.product_id == product_id) \
+        .order_by(ProductNeighbour.rank).limit(limit).all()
+
+
+def bought_together(product_ids, limit=4):
+    """
+    The products most often bought with any of ``product_ids`` (e.g. a
+    cart), excluding those products, ranked by their summed similarity.
+    """
+    from models import Product, ProductNeighbour
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    score = db.func.sum(ProductNeighbour.score)
+    return Product.query.join(ProductNeighbour, ProductNeighbour.neighbour_id == Product.id) \
+        .filter(ProductNeighbour.product_id.in_(product_ids), Product.id.not_in(product_ids),
+                Product.stock > 0) \
+        .group_by(Product.id).order_by(score.desc(), Product.id).limit(limit).all()
+
+
+def backfill_recommendations():
+    """Computes neighbours once for databases that have orders but no recommendations yet."""
+    from models import OrderItem, ProductNeighbour
+
+    if not db.session.query(ProductNeighbour.product_id).first() and db.session.query(OrderItem.id).first():
+        logger.info('Found neighbours for %d products', rebuild_recommendations(log=logger.debug))
+
+
+def init_recommendations(app):
+    """Registers the ``flask rebuild-recommendations`` command."""
+
+    @app.cli.command('rebuild-recommendations')
+    def rebuild_recommendations_command():
+        """Recompute every product's frequently-bought-together list from the order history."""
+        click.echo(f'Found neighbours for {rebuild_recommendations(log=click.echo)} products')
@@ -0,0 +1,227 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+import click
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, UpdateBase, event, text
+from sqlalchemy.exc import DBAPIError
+
+from utils.queries import discard_queries, query_count
+
+logger = logging.getLogger(__name__)
+
+# Bind key of the first replica; the others count up from it
+REPLICA_KEY = 'replica-{}'
+
+# Cookie that keeps a client's reads on the primary until it expires. It is
+# separate from the session so that checking it adds no Vary: Cookie to the
+# shared-cacheable API; forging it only sends the forger's reads to the primary.
+PIN_COOKIE = 'read_primary'
+
+# Seconds a standby's replay is behind its primary (0 when caught up or not a standby)
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_settings = {
+    'replicas': [],
+    'max_lag': 5.0,
+    'check_interval': 5.0,
+    'pin_seconds': 10,
+}
+
+# Bind key: time until which the replica is skipped
+_down = {}
+
+_checker = {'app': None, 'pid': None, 'lock': threading.Lock()}
+
+
+class RoutingSession(Session):
+    """
+    Sends the reads of views marked with ``replica_reads`` to a healthy read
+    replica, and everything else to the primary: writes, ``FOR UPDATE``
+    reads, raw SQL, and every statement outside such views (jobs, commands).
+
+    Once a request has written, its later reads go to the primary too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g._db_wrote = True
+                g._db_replicas = False
+            elif g.get('_db_replicas') and isinstance(clause, Select) and clause._for_update_arg is None:
+                replica = _pick_replica()
+                if replica is not None:
+                    return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _pick_replica():
+    # One replica per request, so its reads see a single point in time
+    if '_db_replica' not in g:
+        now = time.monotonic()
+        healthy = [key for key in _settings['replicas'] if _down.get(key, 0) <= now]
+        g._db_replica = random.choice(healthy) if healthy else None
+    return g._db_replica
+
+
+def mark_down(key, seconds=None):
+    """Skips a replica for ``seconds`` (default: until the next health check)."""
+    _down[key] = time.monotonic() + (seconds or _settings['check_interval'])
+
+
+def replica_reads(f):
+    """
+    Marks a view as read-only so its queries may be served by a read replica.
+    A user who wrote anything in the last ``READ_YOUR_WRITES_SECONDS`` is kept
+    on the primary. If the replica fails mid-request, it is skipped until the
+    next health check and the view runs again on the primary.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not _settings['replicas'] or PIN_COOKIE in request.cookies:
+            return f(*args, **kwargs)
+        _start_checks()
+        g._db_replicas = True
+        queries = query_count()
+        try:
+            return f(*args, **kwargs)
+        except DBAPIError as e:
+            replica = g.get('_db_replica')
+            if not g.get('_db_replica_failed'):
+                raise
+            from app import db
+            db.session.rollback()
+            mark_down(replica)
+            logger.warning('Replica %s failed, retrying on the primary: %s', replica, e.orig)
+            g._db_replicas = False
+            discard_queries(queries)
+            return f(*args, **kwargs)
+        finally:
+            g._db_replicas = False
+    return decorated_function
+
+
+def replica_lag(engine):
+    """
+    Seconds the replica behind ``engine`` trails its primary. SQLite copies
+    are snapshots, so they never report lag.
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            return float(conn.execute(POSTGRES_LAG).scalar() or 0)
+        conn.execute(text('SELECT 1'))
+        return 0.0
+
+
+def check_replicas(app):
+    """Marks each replica up or down by whether it answers and is within ``REPLICA_MAX_LAG``."""
+    from app import db
+
+    with app.app_context():
+        for key in _settings['replicas']:
+            try:
+                lag = replica_lag(db.engines[key])
+            except Exception as e:
+                mark_down(key)
+                logger.warning('Replica %s is unreachable: %s', key, e)
+                continue
+            if lag > _settings['max_lag']:
+                mark_down(key)
+                logger.warning('Replica %s is %.1fs behind, reading from the primary', key, lag)
+            elif _down.pop(key, None) is not None:
+                logger.info('Replica %s is back (%.1fs behind)', key, lag)
+
+
+def _on_error(context):
+    # Registered on replica engines only
+    if has_request_context():
+        g._db_replica_failed = True
+    if context.is_disconnect or context.connection is None:
+        mark_down(context.engine._replica_key)
+
+
+def _start_checks():
+    # Started on first use, like the job workers, so each gunicorn worker
+    # checks the replicas itself rather than the master that forks them
+    if _checker['pid'] == os.getpid():
+        return
+    with _checker['lock']:
+        if _checker['pid'] == os.getpid():
+            return
+        _checker['pid'] = os.getpid()
+        app = _checker['app']
+        from app import db
+        with app.app_context():
+            for key in _settings['replicas']:
+                engine = db.engines[key]
+                engine._replica_key = key
+                if not event.contains(engine, 'handle_error', _on_error):
+                    event.listen(engine, 'handle_error', _on_error)
+
+        def run():
+            while True:
+                check_replicas(app)
+                time.sleep(_settings['check_interval'])
+        threading.Thread(target=run, name='replica-checks', daemon=True).start()
+
+
+def snapshot_sqlite(source, target):
+    """Copies SQLite database ``source`` to ``target`` with the online backup API."""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def init_replicas(app):
+    """
+    Registers the replicas in ``DATABASE_REPLICA_URLS`` as database binds and
+    sets the lag limit, health check interval and read-your-writes window.
+    Call it before ``db.init_app``.
+
+    Registers the ``flask snapshot-replica`` command, which copies a SQLite
+    primary to a file that can then be used as a local replica.
+    """
+    urls = [url.strip() for url in app.config.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for n, url in enumerate(urls, 1):
+        binds[REPLICA_KEY.format(n)] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    _settings.update(
+        replicas=[REPLICA_KEY.format(n) for n in range(1, len(urls) + 1)],
+        max_lag=app.config.get('REPLICA_MAX_LAG', 5.0),
+        check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 5.0),
+        pin_seconds=app.config.get('READ_YOUR_WRITES_SECONDS', 10),
+    )
+    _down.clear()
+    _checker.update(app=app, pid=None)
+
+    @app.after_request
+    def pin_writers_to_primary(response):
+        # Replicas may not have this request's writes yet
+        if _settings['replicas'] and g.get('_db_wrote'):
+            response.set_cookie(PIN_COOKIE, '1', max_age=_settings['pin_seconds'], httponly=True,
+                                samesite='Lax', secure=request.is_secure)
+        return response
+
+    @app.cli.command('snapshot-replica')
+    @click.argument('path')
+    def snapshot_replica_command(path):
+        """Copy the SQLite primary database to PATH for use as a local replica."""
+        from app import db
+
+        if db.engine.dialect.name != 'sqlite':
+            raise click.UsageError('snapshot-replica only copies SQLite databases')
+        snapshot_sqlite(db.engine.url.database, path)
+        click.echo(f'Copied {db.engine.url.database} to {path}')
@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+
+import logging
+
+import click
+from sqlalchemy import delete, insert, literal, select, update
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# category_id of the rows that hold whole-order figures
+ALL_CATEGORIES = 0
+
+# SiteTotal row counting non-admin accounts
+CUSTOMERS = 'customers'
+
+
+def upsert_counts(model, keys, deltas):
+    """
+    Adds ``deltas`` to the row identified by ``keys``, creating it if needed,
+    in a single INSERT ... ON CONFLICT DO UPDATE statement.
+    """
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        # No portable upsert: update first and insert when nothing matched
+        conditions = [table.c[key] == value for key, value in keys.items()]
+        values = {name: table.c[name] + value for name, value in deltas.items()}
+        if not db.session.execute(update(table).where(*conditions).values(**values)).rowcount:
+            db.session.execute(insert(table).values(**keys, **deltas))
+        return
+
+    stmt = dialect_insert(table).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+    )
+    db.session.execute(stmt)
+
+
+def _apply(order, status, sign):
+    from models import Product, OrderItem, SalesRollup, SalesTotal
+
+    breakdown = db.session.query(
+        Product.category_id,
+        db.func.sum(OrderItem.price * OrderItem.quantity),
+        db.func.sum(OrderItem.quantity),
+    ).join(Product, Product.id == OrderItem.product_id) \
+        .filter(OrderItem.order_id == order.id) \
+        .group_by(Product.category_id).all()
+
+    day = order.created_at.date()
+    units = sum(row[2] for row in breakdown)
+    whole_order = {'revenue': sign * order.total_amount, 'orders': sign, 'units': sign * units}
+
+    upsert_counts(SalesRollup, {'day': day, 'status': status, 'category_id': ALL_CATEGORIES}, whole_order)
+    for category_id, revenue, category_units in breakdown:
+        upsert_counts(SalesRollup, {'day': day, 'status': status, 'category_id': category_id},
+                {'revenue': sign * revenue, 'orders': sign, 'units': sign * category_units})
+    upsert_counts(SalesTotal, {'status': status}, whole_order)
+
+
+def add_order(order):
+    """
+    Adds a new order to the rollups under its status, inside the caller's
+    transaction, so the dashboard counts it as soon as it commits.
+    """
+    _apply(order, order.status, 1)
+
+
+def move_order(order, old_status):
+    """Moves an order's figures from ``old_status`` to its current status inside the caller's transaction."""
+    _apply(order, old_status, -1)
+    _apply(order, order.status, 1)
+
+
+def count_customers(delta):
+    """Adds ``delta`` to the customer count inside the caller's transaction (-1 for a new admin)."""
+    from models import SiteTotal
+
+    upsert_counts(SiteTotal, {'name': CUSTOMERS}, {'value': delta})
+
+
+def customer_count():
+    """The number of non-admin accounts, read from SiteTotal."""
+    from models import SiteTotal
+
+    return db.session.query(SiteTotal.value).filter_by(name=CUSTOMERS).scalar() or 0
+
+
+def _recount_customers():
+    from models import SiteTotal, User
+
+    db.session.execute(delete(SiteTotal).where(SiteTotal.name == CUSTOMERS))
+    db.session.execute(insert(SiteTotal).values(
+        name=CUSTOMERS, value=User.query.filter_by(is_admin=False).count()))
+
+
+def rebuild_rollups():
+    """
+    Regenerates both rollup tables from Order and OrderItem, and the
+    customer count from User.
+
+    Returns:
+        int: Number of orders rolled up
+    """
+    from models import Order, OrderItem, Product, SalesRollup, SalesTotal
+
+    rollup = SalesRollup.__table__
+    day = db.func.date(Order.created_at)
+    columns = [rollup.c.day, rollup.c.status, rollup.c.category_id,
+               rollup.c.revenue, rollup.c.orders, rollup.c.units]
+
+    db.session.execute(delete(SalesRollup))
+    db.session.execute(delete(SalesTotal))
+    _recount_customers()
+
+    units_per_order = select(OrderItem.order_id, db.func.sum(OrderItem.quantity).label('units')) \
+        .group_by(OrderItem.order_id).subquery()
+    db.session.execute(insert(rollup).from_select(columns, select(
+        day, Order.status, literal(ALL_CATEGORIES),
+        db.func.sum(Order.total_amount), db.func.count(Order.id),
+        db.func.coalesce(db.func.sum(units_per_order.c.units), 0),
+    ).outerjoin(units_per_order, units_per_order.c.order_id == Order.id)
+        .group_by(day, Order.status)))
+
+    db.session.execute(insert(rollup).from_select(columns, select(
+        day, Order.status, Product.category_id,
+        db.func.sum(OrderItem.price * OrderItem.quantity), db.func.count(db.distinct(Order.id)),
+        db.func.sum(OrderItem.quantity),
+    ).select_from(Order).join(OrderItem, OrderItem.order_id == Order.id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .group_by(day, Order.status, Product.category_id)))
+
+    totals = SalesTotal.__table__
+    db.session.execute(insert(totals).from_select(
+        [totals.c.status, totals.c.revenue, totals.c.orders, totals.c.units],
+        select(rollup.c.status, db.func.sum(rollup.c.revenue), db.func.sum(rollup.c.orders),
+               db.func.sum(rollup.c.units))
+        .where(rollup.c.category_id == ALL_CATEGORIES).group_by(rollup.c.status)))
+
+    db.session.commit()
+    return db.session.query(db.func.coalesce(db.func.sum(SalesTotal.orders), 0)).scalar()
+
+
+def sales_summary(days=30):
+    """
+    Reads everything the admin dashboard shows from the rollup tables.
+
+    Args:
+        days (int): Length of the chart window in days, ending today
+
+    Returns:
+        dict: 'totals' per status, 'total_orders', 'total_revenue', a 'daily'
+              series for the window and a per-category 'by_category' breakdown
+    """
+    from models import Category, SalesRollup, SalesTotal
+
+    totals = SalesTotal.query.filter(SalesTotal.orders > 0).order_by(SalesTotal.status).all()
+    # Orders are stamped with UTC times, so the window ends on today's UTC date
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+
+    daily = {day: (revenue, orders) for day, revenue, orders in db.session.query(
+        SalesRollup.day, db.func.sum(SalesRollup.revenue), db.func.sum(SalesRollup.orders)
+    ).filter(SalesRollup.category_id == ALL_CATEGORIES, SalesRollup.day >= start)
+        .group_by(SalesRollup.day)}
+
+    # Grouped by id so categories that share a name stay apart
+    per_category = select(
+        SalesRollup.category_id, db.func.sum(SalesRollup.revenue).label('revenue'),
+        db.func.sum(SalesRollup.units).label('units'),
+    ).where(SalesRollup.category_id != ALL_CATEGORIES, SalesRollup.day >= start) \
+        .group_by(SalesRollup.category_id).subquery()
+    by_category = db.session.query(Category.name, per_category.c.revenue, per_category.c.units) \
+        .join(per_category, per_category.c.category_id == Category.id) \
+        .order_by(per_category.c.revenue.desc(), Category.id).all()
+
+    series = [start + timedelta(days=n) for n in range(days)]
+    return {
+        'totals': totals,
+        'total_orders': sum(t.orders for t in totals),
+        'total_revenue': sum(t.revenue for t in totals),
+        'daily': [{'day': d.isoformat(), 'revenue': round(daily.get(d, (0, 0))[0], 2),
+                   'orders': daily.get(d, (0, 0))[1]} for d in series],
+        'by_category': [{'name': name, 'revenue': round(revenue or 0, 2), 'units': units or 0}
+                        for name, revenue, units in by_category],
+    }
+
+
+def backfill_rollups():
+    """
+    Fills the rollup tables once for databases that have orders but no
+    rollups yet, and counts the customers of databases that have no count.
+    """
+    from models import Order, SalesTotal, SiteTotal
+
+    if not db.session.query(SalesTotal.status).first() and db.session.query(Order.id).first():
+        logger.info('Rolled up %d orders', rebuild_rollups())
+    elif not db.session.query(SiteTotal.name).filter_by(name=CUSTOMERS).first():
+        _recount_customers()
+        db.session.commit()
+
+
+def init_rollups(app):
+    """Registers the ``flask rebuild-rollups`` command."""
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Regenerate the sales rollup tables from the order history."""
+        click.echo(f'Rolled up {rebuild_rollups()} orders')
@@ -0,0 +1,256 @@
+import logging
+import re
+
+import click
+from sqlalchemy import bindparam, column, func, literal_column, table, text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Column weights for ranking: a hit in the name counts more than one in the
+# category name, which counts more than one in the description
+NAME_WEIGHT = 10.0
+CATEGORY_WEIGHT = 4.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Search index rows for every product; index_products adds a WHERE on the ids
+_SQLITE_ROWS = ("SELECT p.id, p.name, coalesce(p.description, ''), c.name "
+                "FROM product p JOIN category c ON c.id = p.category_id")
+_POSTGRES_ROWS = ("SELECT p.id, "
+                  "setweight(to_tsvector('english', p.name), 'A') || "
+                  "setweight(to_tsvector('english', c.name), 'B') || "
+                  "setweight(to_tsvector('english', coalesce(p.description, '')), 'C') "
+                  "FROM product p JOIN category c ON c.id = p.category_id")
+
+_fts5_available = None
+
+
+def _backend():
+    """Returns 'sqlite', 'postgresql' or 'like' for the search backend in use."""
+    global _fts5_available
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return 'postgresql'
+    if dialect == 'sqlite':
+        if _fts5_available is None:
+            options = db.session.execute(text("PRAGMA compile_options")).scalars().all()
+            _fts5_available = 'ENABLE_FTS5' in options
+        if _fts5_available:
+            return 'sqlite'
+    return 'like'
+
+
+def create_search_index():
+    """
+    Creates the product search index if it does not exist yet.
+
+    Returns:
+        bool: True if the index was created by this call and needs populating
+    """
+    backend = _backend()
+    if backend == 'sqlite':
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+        )).first()
+        if not exists:
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE product_search USING fts5("
+                "name, description, category, tokenize = 'porter unicode61')"
+            ))
+    elif backend == 'postgresql':
+        exists = db.session.execute(text("SELECT to_regclass('product_search')")).scalar()
+        if not exists:
+            db.session.execute(text(
+                "CREATE TABLE product_search ("
+                "product_id INTEGER PRIMARY KEY REFERENCES product (id) ON DELETE CASCADE, "
+                "document TSVECTOR NOT NULL)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX ix_product_search_document ON product_search USING GIN (document)"
+            ))
+    else:
+        logger.warning('SQLite FTS5 is not available, product search falls back to LIKE matching')
+        return False
+    db.session.commit()
+    return not exists
+
+
+def index_product(product):
+    """
+    Adds or refreshes one product in the search index. Runs inside the caller's
+    transaction so the index commits together with the product change.
+
+    Args:
+        product (Product): A flushed product with its category_id set
+    """
+    from models import Category
+
+    backend = _backend()
+    category = db.session.get(Category, product.category_id)
+    params = {
+        'id': product.id,
+        'name': product.name or '',
+        'description': product.description or '',
+        'category': category.name if category else '',
+    }
+    if backend == 'sqlite':
+        db.session.execute(text("DELETE FROM product_search WHERE rowid = :id"), params)
+        db.session.execute(text(
+            "INSERT INTO product_search (rowid, name, description, category) "
+            "VALUES (:id, :name, :description, :category)"
+        ), params)
+    elif backend == 'postgresql':
+        db.session.execute(text(
+            "INSERT INTO product_search (product_id, document) VALUES (:id, "
+            "setweight(to_tsvector('english', :name), 'A') || "
+            "setweight(to_tsvector('english', :category), 'B') || "
+            "setweight(to_tsvector('english', :description), 'C')) "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+
+
+def remove_product(product_id):
+    """
+    Removes one product from the search index inside the caller's transaction.
+
+    Args:
+        product_id (int): The id of the product being deleted
+    """
+    backend = _backend()
+    if backend == 'sqlite':
+        db.session.execute(text("DELETE FROM product_search WHERE rowid = :id"), {'id': product_id})
+    elif backend == 'postgresql':
+        db.session.execute(text("DELETE FROM product_search WHERE product_id = :id"), {'id': product_id})
+
+
+def index_products(product_ids):
+    """
+    Adds or refreshes many products in the search index with one statement
+    per step, inside the caller's transaction. Used for bulk changes such as
+    feed imports, which must not rebuild the whole index.
+
+    Args:
+        product_ids (list): Ids of flushed products
+    """
+    backend = _backend()
+    product_ids = list(product_ids)
+    if backend == 'like' or not product_ids:
+        return
+    ids = bindparam('ids', product_ids, expanding=True)
+    if backend == 'sqlite':
+        db.session.execute(text("DELETE FROM product_search WHERE rowid IN :ids").bindparams(ids))
+        db.session.execute(text(
+            f"INSERT INTO product_search (rowid, name, description, category) {_SQLITE_ROWS} "
+            "WHERE p.id IN :ids"
+        ).bindparams(ids))
+    else:
+        db.session.execute(text(
+            f"INSERT INTO product_search (product_id, document) {_POSTGRES_ROWS} WHERE p.id IN :ids "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+        ).bindparams(ids))
+
+
+def rebuild_search_index():
+    """
+    Repopulates the whole search index from the product table.
+
+    Returns:
+        int: Number of products indexed
+    """
+    backend = _backend()
+    if backend == 'like':
+        return 0
+
+    db.session.execute(text("DELETE FROM product_search"))
+    if backend == 'sqlite':
+        result = db.session.execute(text(
+            f"INSERT INTO product_search (rowid, name, description, category) {_SQLITE_ROWS}"
+        ))
+    else:
+        result = db.session.execute(text(
+            f"INSERT INTO product_search (product_id, document) {_POSTGRES_ROWS}"
+        ))
+    db.session.commit()
+    return result.rowcount
+
+
+def _match_terms(q):
+    """Splits user input into plain word tokens, dropping search syntax."""
+    return re.findall(r'\w+', q or '')[:20]
+
+
+def search_products(q, category_id=None, min_price=None, max_price=None):
+    """
+    Builds a ranked product query for the search text ``q``.
+
+    Every word must match (in the name, category name or description);
+    the last word is matched as a prefix so partial input still finds results.
+
+    Args:
+        q (str): Search text as typed by the user
+        category_id (int): Restrict to one category
+        min_price (float): Minimum price
+        max_price (float): Maximum price
+
+    Returns:
+        Query: Products ordered by relevance, or None if ``q`` has no words
+    """
+    from models import Category, Product
+
+    terms = _match_terms(q)
+    if not terms:
+        return None
+
+    backend = _backend()
+    if backend == 'sqlite':
+        search = table('product_search', column('rowid'))
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        rank = func.bm25(literal_column('product_search'), NAME_WEIGHT, DESCRIPTION_WEIGHT, CATEGORY_WEIGHT)
+        query = (Product.query
+                 .join(search, search.c.rowid == Product.id)
+                 .filter(literal_column('product_search').op('MATCH')(match))
+                 .order_by(rank, Product.id))
+    elif backend == 'postgresql':
+        search = table('product_search', column('product_id'), column('document'))
+        tsquery = func.to_tsquery('english', ' & '.join(terms[:-1] + [terms[-1] + ':*']))
+        # ts_rank_cd takes weights in {D, C, B, A} order, scaled to at most 1.0
+        weights = text(f"'{{0, {DESCRIPTION_WEIGHT / NAME_WEIGHT}, "
+                       f"{CATEGORY_WEIGHT / NAME_WEIGHT}, 1.0}}'::float4[]")
+        rank = func.ts_rank_cd(weights, search.c.document, tsquery)
+        query = (Product.query
+                 .join(search, search.c.product_id == Product.id)
+                 .filter(search.c.document.op('@@')(tsquery))
+                 .order_by(rank.desc(), Product.id))
+    else:
+        query = Product.query.join(Category)
+        for term in terms:
+            pattern = f'%{term}%'
+            query = query.filter(db.or_(Product.name.ilike(pattern),
+                                        Product.description.ilike(pattern),
+                                        Category.name.ilike(pattern)))
+        query = query.order_by(Product.name, Product.id)
+
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    return query
+
+
+def ensure_search_index():
+    """Makes sure the search index exists, filling it once if it was just created."""
+    if create_search_index():
+        logger.info('Indexed %d products for search', rebuild_search_index())
+
+
+def init_search(app):
+    """Registers the ``flask search-reindex`` command for full rebuilds."""
+
+    @app.cli.command('search-reindex')
+    def search_reindex_command():
+        """Rebuild the product search index from scratch."""
+        click.echo(f'Indexed {rebuild_search_index()} products')